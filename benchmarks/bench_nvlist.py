@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''rtctree
+
+Copyright (C) 2009-2014
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Micro-benchmark of the conversion between dictionaries and CORBA namevalue
+lists.
+
+Run from the top of the source tree (after building the IDL stubs):
+
+    python benchmarks/bench_nvlist.py [-n REPEATS] [-s SIZE]
+
+'''
+
+
+import optparse
+import os.path
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import rtctree
+from omniORB import any
+import SDOPackage
+
+from rtctree.utils import dict_to_nvlist, nvlist_to_dict, NVListMapping
+
+
+def old_dict_to_nvlist(dict):
+    # The conversion used before the fast paths were added.
+    result = []
+    for item in list(dict.keys()):
+        result.append(SDOPackage.NameValue(item, any.to_any(dict[item])))
+    return result
+
+
+def old_nvlist_to_dict(nvlist):
+    result = {}
+    for item in nvlist:
+        result[item.name] = item.value.value()
+    return result
+
+
+def make_properties(size):
+    # Properties similar to those of a data port or component profile.
+    props = {'port.port_type': 'DataInPort',
+            'dataport.data_type': 'IDL:RTC/TimedLong:1.0',
+            'dataport.subscription_type': 'flush,new,periodic',
+            'dataport.dataflow_type': 'push,pull',
+            'dataport.interface_type': 'corba_cdr'}
+    for ii in range(len(props), size):
+        props['conf.default.param_{0}'.format(ii)] = str(ii * 7)
+    return props
+
+
+def bench(name, stmt, number):
+    best = min(timeit.repeat(stmt, number=number, repeat=5))
+    print('{0:32} {1:8.2f} us'.format(name, best / number * 1e6))
+    return best
+
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option('-n', '--number', dest='number', type='int',
+            default=10000, help='Conversions per timing run.')
+    parser.add_option('-s', '--size', dest='size', type='int', default=20,
+            help='Number of entries in the converted list.')
+    options, args = parser.parse_args(argv[1:])
+
+    props = make_properties(options.size)
+    nvlist = old_dict_to_nvlist(props)
+    assert nvlist_to_dict(dict_to_nvlist(props)) == props
+    assert dict(NVListMapping(nvlist)) == props
+
+    print('{0} entries, {1} conversions per run'.format(options.size,
+        options.number))
+    old = bench('dict_to_nvlist (old)', lambda: old_dict_to_nvlist(props),
+            options.number)
+    new = bench('dict_to_nvlist', lambda: dict_to_nvlist(props),
+            options.number)
+    print('{0:32} {1:8.1f}x'.format('speed up', old / new))
+    old = bench('nvlist_to_dict (old)', lambda: old_nvlist_to_dict(nvlist),
+            options.number)
+    new = bench('nvlist_to_dict', lambda: nvlist_to_dict(nvlist),
+            options.number)
+    print('{0:32} {1:8.1f}x'.format('speed up', old / new))
+    bench('NVListMapping, one lookup',
+            lambda: NVListMapping(nvlist)['port.port_type'], options.number)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
+
+
+# vim: tw=79
+
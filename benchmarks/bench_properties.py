@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''rtctree
+
+Copyright (C) 2009-2014
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Benchmark of the memory used by the properties of a large tree, with and
+without sharing identical property dictionaries.
+
+Run from the top of the source tree (after building the IDL stubs), using
+Python 3.4 or later:
+
+    python benchmarks/bench_properties.py [-c COMPONENTS] [-t TYPES]
+
+'''
+
+
+import optparse
+import os.path
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import rtctree
+from rtctree.component import Component
+from rtctree.utils import share_properties
+
+
+def component_properties(type_index, instance):
+    # Properties similar to those of a component profile. Only the instance
+    # name differs between instances of a type.
+    props = {'type_name': 'Type{0}'.format(type_index),
+            'implementation_id': 'Type{0}'.format(type_index),
+            'vendor': 'AIST', 'category': 'Example', 'version': '1.0.0',
+            'activity_type': 'PERIODIC', 'kind': 'DataFlowComponent',
+            'max_instance': '0', 'language': 'Python', 'lang_type': 'SCRIPT',
+            'exec_cxt.periodic.type': 'PeriodicExecutionContext',
+            'exec_cxt.periodic.rate': '1000', 'naming.type': 'corba',
+            'naming.formats': '%h.host_cxt/%n.rtc',
+            'instance_name': 'Type{0}{1}'.format(type_index, instance),
+            'naming.names': 'Type{0}{1}.rtc'.format(type_index, instance)}
+    return props
+
+
+def port_properties(type_index, port):
+    return {'port.port_type': 'DataOutPort' if port % 2 else 'DataInPort',
+            'dataport.data_type': 'IDL:RTC/TimedLong:1.0',
+            'dataport.subscription_type': 'flush,new,periodic',
+            'dataport.dataflow_type': 'push,pull',
+            'dataport.interface_type': 'corba_cdr'}
+
+
+def build(num_comps, num_types, num_ports, share):
+    result = []
+    for ii in range(num_comps):
+        t = ii % num_types
+        props = [component_properties(t, ii)] + \
+                [port_properties(t, p) for p in range(num_ports)]
+        if share:
+            props = [share_properties(props[0],
+                Component._UNSHARED_PROPERTIES)] + \
+                [share_properties(p) for p in props[1:]]
+        result.append(props)
+    return result
+
+
+def measure(num_comps, num_types, num_ports, share):
+    tracemalloc.start()
+    tree = build(num_comps, num_types, num_ports, share)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del tree
+    return size
+
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option('-c', '--components', dest='comps', type='int',
+            default=10000, help='Number of components in the tree.')
+    parser.add_option('-t', '--types', dest='types', type='int',
+            default=20, help='Number of different component types.')
+    parser.add_option('-p', '--ports', dest='ports', type='int',
+            default=4, help='Number of ports on each component.')
+    options, args = parser.parse_args(argv[1:])
+
+    plain = measure(options.comps, options.types, options.ports, False)
+    shared = measure(options.comps, options.types, options.ports, True)
+    print('{0} components of {1} types with {2} ports each'.format(
+        options.comps, options.types, options.ports))
+    print('{0:20} {1:10.1f} KiB'.format('plain dictionaries', plain / 1024.0))
+    print('{0:20} {1:10.1f} KiB'.format('shared properties',
+        shared / 1024.0))
+    print('{0:20} {1:10.1f}x'.format('reduction', plain / float(shared)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
+
+
+# vim: tw=79
+
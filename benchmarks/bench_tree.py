@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''rtctree
+
+Copyright (C) 2009-2014
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Benchmark suite for building and using trees of many components.
+
+A synthetic tree is served by the stand-in in standin.py, from its own ORB in
+a child process so that calls to it are real remote calls, and the following
+are measured:
+
+- discovery: the time and CORBA calls taken to build an RTCTree of the whole
+  naming service, and the memory used per node (Python 3.4 or later);
+- get_node: the latency of looking up component nodes by path;
+- iterate: the throughput of RTCTree.iterate over all nodes;
+- details: the time and CORBA calls per component taken to read the ports,
+  execution contexts, state and configuration sets of every component.
+
+A scenario file (see standin.py and the files in benchmarks/scenarios) can be
+given to inject latency and faults into the stand-in's servants, to measure
+behaviour with slow or unreliable targets. Failures seen by each phase are
+counted in the results rather than stopping the benchmark. Scenarios with
+hung calls (such as dead_host.json) should be run with --call-timeout and
+--discovery-budget, which are passed to RTCTree, to measure the timeout paths
+rather than waiting for the hangs.
+
+The results are written as JSON, so that runs against different releases can
+be compared. Run from the top of the source tree (after building the IDL
+stubs):
+
+    python benchmarks/bench_tree.py -b 4 -d 2 -c 10 -o results.json
+    python benchmarks/bench_tree.py -S benchmarks/scenarios/flaky.json
+    python benchmarks/bench_tree.py -S benchmarks/scenarios/dead_host.json \
+            --call-timeout 1 --discovery-budget 10
+
+'''
+
+
+import json
+import optparse
+import os.path
+import platform
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import standin
+from omniORB import CORBA
+import rtctree
+from rtctree.tree import RTCTree
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def bench_discovery(server, address, orb, unreachable_ttl=None,
+        call_timeout=None, discovery_budget=None):
+    server.calls.reset()
+    if tracemalloc:
+        tracemalloc.start()
+    start = time.time()
+    try:
+        tree = RTCTree(servers=[address], orb=orb,
+                unreachable_ttl=unreachable_ttl, call_timeout=call_timeout,
+                discovery_budget=discovery_budget)
+    except Exception as e:
+        # A fault that discovery could not survive
+        if tracemalloc:
+            tracemalloc.stop()
+        return None, {'time': time.time() - start,
+                'error': '{0}: {1}'.format(type(e).__name__, e),
+                'calls': server.calls.total,
+                'calls_by_op': server.calls.counts}
+    elapsed = time.time() - start
+    if tracemalloc:
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    else:
+        memory = None
+    num_nodes = len(tree.iterate(lambda n, a: n))
+    zombies = len(tree.iterate(lambda n, a: n, filter=['is_zombie']))
+    pending = len(tree.iterate(lambda n, a: n, filter=['is_pending']))
+    components = len(tree.iterate(lambda n, a: n, filter=['is_component']))
+    result = {'time': elapsed, 'nodes': num_nodes, 'zombies': zombies,
+            'pending': pending, 'components_found': components,
+            'calls': server.calls.total, 'calls_by_op': server.calls.counts,
+            'calls_per_component': server.calls.total /
+                float(max(server.num_components, 1))}
+    if tree.unreachable_endpoints:
+        result['unreachable_skipped'] = tree.unreachable_endpoints.skipped
+    if memory is not None:
+        result['memory_bytes'] = memory
+        result['memory_per_node'] = memory / float(max(num_nodes, 1))
+    return tree, result
+
+
+def bench_get_node(tree, server, address, samples):
+    paths = [['/', address] + p for p in server.component_paths]
+    rng = random.Random(1)
+    chosen = [rng.choice(paths) for ii in range(samples)]
+    server.calls.reset()
+    latencies = []
+    missing = 0
+    for p in chosen:
+        start = time.time()
+        node = tree.get_node(p)
+        latencies.append(time.time() - start)
+        if node is None:
+            missing += 1
+    return {'samples': samples, 'missing': missing,
+            'mean': sum(latencies) / max(len(latencies), 1),
+            'p50': percentile(latencies, 0.5),
+            'p99': percentile(latencies, 0.99),
+            'max': max(latencies) if latencies else 0.0,
+            'calls': server.calls.total}
+
+
+def bench_iterate(tree, server, repeats):
+    server.calls.reset()
+    start = time.time()
+    for ii in range(repeats):
+        nodes = len(tree.iterate(lambda n, a: n))
+    elapsed = time.time() - start
+    return {'repeats': repeats, 'nodes': nodes, 'time': elapsed,
+            'nodes_per_second': nodes * repeats / max(elapsed, 1e-9),
+            'calls': server.calls.total}
+
+
+def bench_details(tree, server):
+    comps = tree.iterate(lambda n, a: n, filter=['is_component'])
+    server.calls.reset()
+    errors = {}
+    start = time.time()
+    for c in comps:
+        try:
+            c.ports
+            c.owned_ecs
+            c.state
+            c.conf_sets
+        except Exception as e:
+            name = type(e).__name__
+            errors[name] = errors.get(name, 0) + 1
+    elapsed = time.time() - start
+    return {'components': len(comps), 'time': elapsed, 'errors': errors,
+            'time_per_component': elapsed / max(len(comps), 1),
+            'calls': server.calls.total, 'calls_by_op': server.calls.counts,
+            'calls_per_component': server.calls.total /
+                float(max(len(comps), 1))}
+
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option('-b', '--breadth', dest='breadth', type='int',
+            default=4, help='Naming contexts in each context.')
+    parser.add_option('-d', '--depth', dest='depth', type='int', default=2,
+            help='Levels of naming contexts.')
+    parser.add_option('-c', '--components', dest='components', type='int',
+            default=10, help='Components in each bottom-level context.')
+    parser.add_option('-p', '--ports', dest='ports', type='int', default=4,
+            help='Ports on each component.')
+    parser.add_option('--port', dest='port', type='int', default=28090,
+            help='TCP port the stand-in naming service listens on.')
+    parser.add_option('-s', '--samples', dest='samples', type='int',
+            default=10000, help='Number of get_node lookups.')
+    parser.add_option('-r', '--repeats', dest='repeats', type='int',
+            default=10, help='Number of iterations over the tree.')
+    parser.add_option('-S', '--scenario', dest='scenario', default=None,
+            help='Scenario file describing the faults to inject.')
+    parser.add_option('--scenario-after-discovery', dest='late_scenario',
+            action='store_true', default=False,
+            help='Only inject faults after the tree has been discovered.')
+    parser.add_option('--unreachable-ttl', dest='unreachable_ttl',
+            type='float', default=0,
+            help='Time to remember unreachable endpoints during discovery. '
+            'Default: 0 (disabled), because the stand-in serves every object '
+            'from one endpoint, so one injected failure would make every '
+            'component a zombie.')
+    parser.add_option('--call-timeout', dest='call_timeout', type='float',
+            default=None,
+            help='Maximum time, in seconds, any remote call made by the tree '
+            'may take. Default: no limit.')
+    parser.add_option('--discovery-budget', dest='discovery_budget',
+            type='float', default=None,
+            help='Maximum time, in seconds, to spend discovering the tree. '
+            'Objects not resolved in time are added as pending nodes. '
+            'Default: no limit.')
+    parser.add_option('-o', '--output', dest='output', default=None,
+            help='File to write the JSON results to. Default: stdout.')
+    options, args = parser.parse_args(argv[1:])
+
+    if options.scenario:
+        scenario = standin.Scenario.load(options.scenario)
+    else:
+        scenario = None
+    # The stand-in is started before this process's ORB is created
+    server = standin.StandInProcess(options.port, breadth=options.breadth,
+            depth=options.depth, components=options.components,
+            ports=options.ports, scenario=options.scenario)
+    orb = CORBA.ORB_init([sys.argv[0]], CORBA.ORB_ID)
+    address = '127.0.0.1:{0}'.format(options.port)
+
+    results = {}
+    if not options.late_scenario:
+        server.inject()
+    tree, results['discovery'] = bench_discovery(server, address, orb,
+            options.unreachable_ttl, options.call_timeout,
+            options.discovery_budget)
+    server.inject()
+    if tree:
+        results['get_node'] = bench_get_node(tree, server, address,
+                options.samples)
+        results['iterate'] = bench_iterate(tree, server, options.repeats)
+        results['details'] = bench_details(tree, server)
+
+    report = {'rtctree_version': rtctree.RTCTREE_VERSION,
+            'python': platform.python_version(),
+            'platform': platform.platform(), 'time': time.time(),
+            'parameters': {'breadth': options.breadth,
+                'depth': options.depth, 'components': options.components,
+                'ports': options.ports,
+                'unreachable_ttl': options.unreachable_ttl,
+                'call_timeout': options.call_timeout,
+                'discovery_budget': options.discovery_budget,
+                'total_components': server.num_components,
+                'total_contexts': server.num_contexts},
+            'results': results}
+    if scenario:
+        report['scenario'] = {'name': scenario.name,
+                'file': options.scenario,
+                'after_discovery': options.late_scenario,
+                'injected': server.injected}
+    if options.output:
+        f = open(options.output, 'w')
+        try:
+            json.dump(report, f, indent=1, sort_keys=True)
+        finally:
+            f.close()
+    else:
+        json.dump(report, sys.stdout, indent=1, sort_keys=True)
+        sys.stdout.write('\n')
+    orb.shutdown(False)
+    server.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
+
+
+# vim: tw=79
+
@@ -0,0 +1,973 @@
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''rtctree
+
+Copyright (C) 2009-2014
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Stand-ins for a naming service and the components registered on it, used by
+the benchmarks.
+
+The stand-in serves a minimal CosNaming naming service and fake RTObject,
+PortService, ExecutionContextService and Configuration servants, so a tree of
+any size can be built without running real components. Every operation called
+on the servants is counted.
+
+A StandIn serves the servants from a given ORB. Calls made from the same ORB
+are collocated calls, which omniORB makes directly, so call timeouts do not
+apply to them. StandInProcess serves a StandIn from its own ORB in a child
+process, so the calls are made over the network as they are to real
+components.
+
+To test behaviour with slow or unreliable targets, the servants can inject
+latency, failures and hung calls, as described by a scenario file. A scenario
+file is a JSON object:
+
+    {"name": "flaky-wan",
+     "description": "Slow links with occasional failures",
+     "seed": 1,
+     "rules": [
+        {"target": "cxt0.host_cxt/*", "op": "get_*",
+         "latency": {"dist": "normal", "mean": 0.02, "stddev": 0.005},
+         "transient": 0.05, "object_not_exist": 0.01,
+         "hang": 0.001, "hang_time": 60}]}
+
+Each rule applies to the operations whose names match the "op" pattern on
+servants whose target matches the "target" pattern (shell-style patterns; both
+default to "*"). The target of a naming context is its path from the root
+context (the root context's target is ""), and the target of a component's
+servants (including its ports, execution context and configuration) is the
+component's path, such as "cxt0.host_cxt/cxt1.host_cxt/comp3.rtc". Every
+matching rule is applied, in order. A rule may give:
+
+- latency: a delay before the operation runs. The distribution is one of
+  "fixed" (with "value"), "uniform" ("min" and "max"), "normal" ("mean" and
+  "stddev") and "exponential" ("mean"). Times are in seconds.
+- transient, object_not_exist: the probability of the operation raising
+  CORBA.TRANSIENT (as if the connection failed) or CORBA.OBJECT_NOT_EXIST.
+- hang: the probability of the operation not returning for hang_time seconds
+  (default 3600).
+
+'''
+
+
+import fnmatch
+import json
+import multiprocessing
+import os.path
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import rtctree
+import CosNaming
+import CosNaming__POA
+from omniORB import CORBA, TRANSIENT_ConnectFailed
+import RTC
+import RTC__POA
+import SDOPackage
+import SDOPackage__POA
+
+from rtctree.utils import dict_to_nvlist
+
+
+##############################################################################
+## Call counting
+
+class CallCounter(object):
+    '''Counts the operations called on the stand-in servants.'''
+    def __init__(self, *args, **kwargs):
+        super(CallCounter, self).__init__(*args, **kwargs)
+        self._mutex = threading.Lock()
+        self._counts = {}
+
+    def count(self, op):
+        with self._mutex:
+            self._counts[op] = self._counts.get(op, 0) + 1
+
+    def reset(self):
+        '''Reset all counts to zero.'''
+        with self._mutex:
+            self._counts = {}
+
+    @property
+    def counts(self):
+        '''A dictionary of the number of calls of each operation.'''
+        with self._mutex:
+            return dict(self._counts)
+
+    @property
+    def total(self):
+        '''The total number of calls of all operations.'''
+        with self._mutex:
+            return sum(self._counts.values())
+
+
+def operation(func):
+    '''Mark a servant method as a remote operation, so calls are counted and
+    faults are injected.
+
+    '''
+    name = func.__name__
+
+    def wrapper(self, *args):
+        self._standin._call(name, getattr(self, '_target', ''))
+        return func(self, *args)
+    wrapper.__name__ = name
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+##############################################################################
+## Fault injection
+
+class Scenario(object):
+    '''A set of rules for injecting latency and faults into operations.'''
+    def __init__(self, rules=None, name='', description='', seed=None, *args,
+            **kwargs):
+        '''Constructor.
+
+        @param rules A list of rule dictionaries, as described in the module
+                     documentation.
+        @param name The name of the scenario.
+        @param description A description of the scenario.
+        @param seed The seed for the random numbers used to choose latencies
+                    and faults, or None.
+
+        '''
+        super(Scenario, self).__init__(*args, **kwargs)
+        self._name = name
+        self._description = description
+        self._rules = []
+        for r in rules or []:
+            r = dict(r)
+            r.setdefault('op', '*')
+            r.setdefault('target', '*')
+            if 'latency' in r and r['latency'].get('dist', 'fixed') not in \
+                    ['fixed', 'uniform', 'normal', 'exponential']:
+                raise ValueError(r['latency'])
+            self._rules.append(r)
+        self._random = random.Random(seed)
+        self._mutex = threading.Lock()
+        self._injected = {}
+
+    @staticmethod
+    def load(filename):
+        '''Load a scenario from a JSON file.'''
+        f = open(filename, 'r')
+        try:
+            data = json.load(f)
+        finally:
+            f.close()
+        return Scenario(data.get('rules', []), data.get('name', filename),
+                data.get('description', ''), data.get('seed'))
+
+    def apply(self, op, target):
+        '''Apply the rules matching an operation on a target.
+
+        This may sleep, and may raise a CORBA system exception.
+
+        '''
+        for r in self._rules:
+            if not fnmatch.fnmatchcase(op, r['op']) or \
+                    not fnmatch.fnmatchcase(target, r['target']):
+                continue
+            if 'latency' in r:
+                delay = self._latency(r['latency'])
+                if delay > 0:
+                    self._count('latency')
+                    time.sleep(delay)
+            if self._chance(r.get('hang', 0)):
+                self._count('hang')
+                time.sleep(r.get('hang_time', 3600))
+            if self._chance(r.get('transient', 0)):
+                self._count('transient')
+                raise CORBA.TRANSIENT(TRANSIENT_ConnectFailed,
+                        CORBA.COMPLETED_NO)
+            if self._chance(r.get('object_not_exist', 0)):
+                self._count('object_not_exist')
+                raise CORBA.OBJECT_NOT_EXIST(0, CORBA.COMPLETED_NO)
+
+    @property
+    def description(self):
+        '''The description of the scenario.'''
+        return self._description
+
+    @property
+    def injected(self):
+        '''A dictionary of the number of each kind of fault injected.'''
+        with self._mutex:
+            return dict(self._injected)
+
+    @property
+    def name(self):
+        '''The name of the scenario.'''
+        return self._name
+
+    def _chance(self, p):
+        if not p:
+            return False
+        with self._mutex:
+            return self._random.random() < p
+
+    def _count(self, kind):
+        with self._mutex:
+            self._injected[kind] = self._injected.get(kind, 0) + 1
+
+    def _latency(self, spec):
+        dist = spec.get('dist', 'fixed')
+        with self._mutex:
+            if dist == 'fixed':
+                return spec.get('value', 0.0)
+            elif dist == 'uniform':
+                return self._random.uniform(spec.get('min', 0.0),
+                        spec.get('max', 0.0))
+            elif dist == 'normal':
+                return max(0.0, self._random.gauss(spec.get('mean', 0.0),
+                    spec.get('stddev', 0.0)))
+            else:
+                mean = spec.get('mean', 0.0)
+                if mean <= 0:
+                    return 0.0
+                return self._random.expovariate(1.0 / mean)
+
+
+##############################################################################
+## Naming service
+
+class NamingContext(CosNaming__POA.NamingContext):
+    '''A minimal in-memory naming context.'''
+    def __init__(self, standin, *args, **kwargs):
+        self._standin = standin
+        self._mutex = threading.Lock()
+        # id, kind -> (binding type, object, servant of a local context)
+        self._bindings = {}
+
+    @operation
+    def bind(self, n, obj):
+        self._bind(n, obj, CosNaming.nobject, False)
+
+    @operation
+    def rebind(self, n, obj):
+        self._bind(n, obj, CosNaming.nobject, True)
+
+    @operation
+    def bind_context(self, n, nc):
+        self._bind(n, nc, CosNaming.ncontext, False)
+
+    @operation
+    def rebind_context(self, n, nc):
+        self._bind(n, nc, CosNaming.ncontext, True)
+
+    @operation
+    def resolve(self, n):
+        target, rest = self._find(n)
+        while rest:
+            target, rest = target._find(rest)
+        return target
+
+    @operation
+    def unbind(self, n):
+        ctx, last = self._parent_of(n)
+        with ctx._mutex:
+            if (last.id, last.kind) not in ctx._bindings:
+                raise CosNaming.NamingContext.NotFound(
+                        CosNaming.NamingContext.missing_node, n)
+            del ctx._bindings[(last.id, last.kind)]
+
+    @operation
+    def new_context(self):
+        return self._standin._new_context()[1]
+
+    @operation
+    def bind_new_context(self, n):
+        servant, ref = self._standin._new_context()
+        self._bind(n, ref, CosNaming.ncontext, False, servant)
+        return ref
+
+    @operation
+    def destroy(self):
+        pass
+
+    @operation
+    def list(self, how_many):
+        with self._mutex:
+            bindings = [CosNaming.Binding([CosNaming.NameComponent(i, k)], t)
+                    for (i, k), (t, o, s) in sorted(self._bindings.items())]
+        if len(bindings) <= how_many:
+            return bindings, None
+        it = BindingIterator(self._standin, bindings[how_many:])
+        return bindings[:how_many], it._this()
+
+    def add(self, id, kind, obj, servant=None):
+        '''Bind an object in this context without counting a call.'''
+        if servant is not None:
+            binding_type = CosNaming.ncontext
+        else:
+            binding_type = CosNaming.nobject
+        with self._mutex:
+            self._bindings[(id, kind)] = (binding_type, obj, servant)
+
+    def _bind(self, n, obj, binding_type, rebind, servant=None):
+        ctx, last = self._parent_of(n)
+        with ctx._mutex:
+            if not rebind and (last.id, last.kind) in ctx._bindings:
+                raise CosNaming.NamingContext.AlreadyBound()
+            ctx._bindings[(last.id, last.kind)] = (binding_type, obj,
+                    servant)
+
+    def _find(self, n):
+        # Find the first component of a name. Returns the bound object (or the
+        # servant of the context if more of the name remains) and the rest of
+        # the name. All contexts are served by the stand-in, so names are
+        # resolved without further calls.
+        if not n:
+            raise CosNaming.NamingContext.InvalidName()
+        with self._mutex:
+            entry = self._bindings.get((n[0].id, n[0].kind))
+        if entry is None:
+            raise CosNaming.NamingContext.NotFound(
+                    CosNaming.NamingContext.missing_node, n)
+        binding_type, obj, servant = entry
+        if len(n) == 1:
+            return obj, []
+        if servant is None:
+            raise CosNaming.NamingContext.NotFound(
+                    CosNaming.NamingContext.not_context, n)
+        return servant, n[1:]
+
+    def _parent_of(self, n):
+        # Get the servant of the context holding the last component of a
+        # name.
+        if not n:
+            raise CosNaming.NamingContext.InvalidName()
+        ctx = self
+        rest = n
+        while len(rest) > 1:
+            ctx, rest = ctx._find(rest)
+        return ctx, rest[0]
+
+
+class BindingIterator(CosNaming__POA.BindingIterator):
+    '''Iterates over the bindings of a NamingContext not returned by list.'''
+    def __init__(self, standin, bindings, *args, **kwargs):
+        self._standin = standin
+        self._bindings = bindings
+
+    @operation
+    def next_one(self):
+        if not self._bindings:
+            return False, CosNaming.Binding([], CosNaming.nobject)
+        return True, self._bindings.pop(0)
+
+    @operation
+    def next_n(self, how_many):
+        result = self._bindings[:how_many]
+        self._bindings = self._bindings[how_many:]
+        return len(result) > 0, result
+
+    @operation
+    def destroy(self):
+        poa = self._default_POA()
+        poa.deactivate_object(poa.servant_to_id(self))
+
+
+##############################################################################
+## Component servants
+
+class Configuration(SDOPackage__POA.Configuration):
+    '''The configuration of a fake component.'''
+    def __init__(self, standin, sets, *args, **kwargs):
+        self._standin = standin
+        self._sets = sets
+        self._active = sorted(sets.keys())[0] if sets else ''
+
+    @operation
+    def get_configuration_sets(self):
+        return [self._make_set(n) for n in sorted(self._sets.keys())]
+
+    @operation
+    def get_configuration_set(self, config_id):
+        if config_id not in self._sets:
+            raise SDOPackage.InternalError('No such configuration set')
+        return self._make_set(config_id)
+
+    @operation
+    def get_active_configuration_set(self):
+        if not self._active:
+            raise SDOPackage.NotAvailable('No active configuration set')
+        return self._make_set(self._active)
+
+    @operation
+    def set_configuration_set_values(self, configuration_set):
+        if configuration_set.id not in self._sets:
+            raise SDOPackage.InvalidParameter('No such configuration set')
+        for nv in configuration_set.configuration_data:
+            self._sets[configuration_set.id][nv.name] = nv.value.value()
+        return True
+
+    @operation
+    def add_configuration_set(self, configuration_set):
+        self._sets[configuration_set.id] = dict([(nv.name,
+            nv.value.value()) for nv in configuration_set.configuration_data])
+        return True
+
+    @operation
+    def remove_configuration_set(self, config_id):
+        return self._sets.pop(config_id, None) is not None
+
+    @operation
+    def activate_configuration_set(self, config_id):
+        if config_id not in self._sets:
+            raise SDOPackage.InvalidParameter('No such configuration set')
+        self._active = config_id
+        return True
+
+    @operation
+    def add_service_profile(self, sProfile):
+        return True
+
+    @operation
+    def remove_service_profile(self, id):
+        return True
+
+    def _make_set(self, name):
+        return SDOPackage.ConfigurationSet(name, '',
+                dict_to_nvlist(self._sets[name]))
+
+
+class ExecutionContext(RTC__POA.ExecutionContextService):
+    '''A fake periodic execution context owned by one component.'''
+    def __init__(self, standin, rate=1000.0, *args, **kwargs):
+        self._standin = standin
+        self._rate = rate
+        self._owner = None
+        self._states = {}
+
+    @operation
+    def get_profile(self):
+        return RTC.ExecutionContextProfile(RTC.PERIODIC, self._rate,
+                self._owner, [], dict_to_nvlist({'name': 'periodic'}))
+
+    @operation
+    def is_running(self):
+        return True
+
+    @operation
+    def start(self):
+        return RTC.RTC_OK
+
+    @operation
+    def stop(self):
+        return RTC.RTC_OK
+
+    @operation
+    def get_rate(self):
+        return self._rate
+
+    @operation
+    def set_rate(self, rate):
+        self._rate = rate
+        return RTC.RTC_OK
+
+    @operation
+    def get_kind(self):
+        return RTC.PERIODIC
+
+    @operation
+    def add_component(self, comp):
+        return RTC.RTC_OK
+
+    @operation
+    def remove_component(self, comp):
+        return RTC.RTC_OK
+
+    @operation
+    def activate_component(self, comp):
+        return RTC.RTC_OK
+
+    @operation
+    def deactivate_component(self, comp):
+        return RTC.RTC_OK
+
+    @operation
+    def reset_component(self, comp):
+        return RTC.RTC_OK
+
+    @operation
+    def get_component_state(self, comp):
+        return RTC.INACTIVE_STATE
+
+
+class Port(RTC__POA.PortService):
+    '''A fake data port.'''
+    def __init__(self, standin, name, props, *args, **kwargs):
+        self._standin = standin
+        self._name = name
+        self._props = dict_to_nvlist(props)
+        self._ref = None
+        self._owner = None
+
+    @operation
+    def get_port_profile(self):
+        return RTC.PortProfile(self._name, [], self._ref, [], self._owner,
+                self._props)
+
+    @operation
+    def get_connector_profiles(self):
+        return []
+
+    @operation
+    def get_connector_profile(self, connector_id):
+        return RTC.ConnectorProfile('', '', [], [])
+
+    @operation
+    def connect(self, connector_profile):
+        return RTC.BAD_PARAMETER, connector_profile
+
+    @operation
+    def disconnect(self, connector_id):
+        return RTC.BAD_PARAMETER
+
+    @operation
+    def disconnect_all(self):
+        return RTC.RTC_OK
+
+    @operation
+    def notify_connect(self, connector_profile):
+        return RTC.BAD_PARAMETER, connector_profile
+
+    @operation
+    def notify_disconnect(self, connector_id):
+        return RTC.BAD_PARAMETER
+
+
+class Component(RTC__POA.RTObject):
+    '''A fake component with data ports, one execution context and a
+    configuration.
+
+    '''
+    def __init__(self, standin, instance_name, ports, ec, conf, *args,
+            **kwargs):
+        self._standin = standin
+        self._instance_name = instance_name
+        self._ports = ports
+        self._ec = ec
+        self._conf = conf
+        self._props = dict_to_nvlist({'instance_name': instance_name,
+            'type_name': 'BenchComponent',
+            'implementation_id': 'BenchComponent', 'vendor': 'rtctree',
+            'category': 'Benchmark', 'version': '1.0.0',
+            'activity_type': 'PERIODIC', 'kind': 'DataFlowComponent',
+            'language': 'Python', 'lang_type': 'SCRIPT',
+            'naming.names': instance_name + '.rtc'})
+        self._ref = None
+        self._port_refs = []
+        self._port_profiles = []
+        self._ec_ref = None
+        self._conf_ref = None
+
+    @operation
+    def get_component_profile(self):
+        return RTC.ComponentProfile(self._instance_name, 'BenchComponent',
+                'Benchmark component', '1.0.0', 'rtctree', 'Benchmark',
+                self._port_profiles, None, self._props)
+
+    @operation
+    def get_ports(self):
+        return self._port_refs
+
+    @operation
+    def initialize(self):
+        return RTC.RTC_OK
+
+    @operation
+    def finalize(self):
+        return RTC.RTC_OK
+
+    @operation
+    def exit(self):
+        return RTC.RTC_OK
+
+    @operation
+    def is_alive(self, exec_context):
+        return True
+
+    @operation
+    def attach_context(self, exec_context):
+        return 1
+
+    @operation
+    def detach_context(self, exec_handle):
+        return RTC.RTC_OK
+
+    @operation
+    def get_context(self, exec_handle):
+        return self._ec_ref if exec_handle == 0 else None
+
+    @operation
+    def get_owned_contexts(self):
+        return [self._ec_ref]
+
+    @operation
+    def get_participating_contexts(self):
+        return []
+
+    @operation
+    def get_context_handle(self, cxt):
+        return 0
+
+    @operation
+    def get_sdo_id(self):
+        return self._instance_name
+
+    @operation
+    def get_sdo_type(self):
+        return 'BenchComponent'
+
+    @operation
+    def get_device_profile(self):
+        return SDOPackage.DeviceProfile('', '', '', '', [])
+
+    @operation
+    def get_service_profiles(self):
+        return []
+
+    @operation
+    def get_configuration(self):
+        return self._conf_ref
+
+    @operation
+    def get_organizations(self):
+        return []
+
+    @operation
+    def get_owned_organizations(self):
+        return []
+
+    @operation
+    def get_status_list(self):
+        return []
+
+    def _activate(self):
+        # Activate this component and its parts, and build the profiles that
+        # refer to them.
+        self._ref = self._this()
+        self._ec._owner = self._ref
+        self._ec_ref = self._ec._this()
+        self._conf_ref = self._conf._this()
+        for p in self._ports:
+            p._owner = self._ref
+            p._ref = p._this()
+            self._port_refs.append(p._ref)
+        self._port_profiles = [RTC.PortProfile(p._name, [], p._ref, [],
+            self._ref, p._props) for p in self._ports]
+        return self._ref
+
+
+##############################################################################
+## Stand-in object
+
+class StandIn(object):
+    '''A naming service and a synthetic tree of components.
+
+    The naming service is registered with the ORB's INS POA as
+    'NameService', so an RTCTree using the address the ORB listens on (e.g.
+    '127.0.0.1:2809') finds it. The ORB must have been created with a
+    matching '-ORBendPoint' option.
+
+    The tree has 'breadth' naming contexts in each context, down to 'depth'
+    levels, and 'components' components in each context at the bottom level.
+
+    '''
+    def __init__(self, orb, breadth=4, depth=2, components=10, ports=4,
+            conf_params=5, scenario=None, *args, **kwargs):
+        '''Constructor.
+
+        @param orb The ORB to serve the stand-in from.
+        @param breadth The number of sub-contexts in each naming context.
+        @param depth The number of levels of naming contexts.
+        @param components The number of components in each bottom-level
+                          context.
+        @param ports The number of data ports on each component.
+        @param conf_params The number of parameters in the configuration set
+                           of each component.
+        @param scenario A Scenario giving the faults to inject, or None.
+
+        '''
+        super(StandIn, self).__init__(*args, **kwargs)
+        self._orb = orb
+        self._counter = CallCounter()
+        self._scenario = scenario
+        self._poa = orb.resolve_initial_references('RootPOA')
+        self._poa._get_the_POAManager().activate()
+        self._root = NamingContext(self)
+        ins_poa = orb.resolve_initial_references('omniINSPOA')
+        ins_poa.activate_object_with_id(b'NameService', self._root)
+        ins_poa._get_the_POAManager().activate()
+        self._component_paths = []
+        self._num_contexts = 0
+        self._build(self._root, [], breadth, depth, components, ports,
+                conf_params)
+
+    @property
+    def calls(self):
+        '''The CallCounter counting calls on the stand-in's servants.'''
+        return self._counter
+
+    @property
+    def scenario(self):
+        '''The Scenario giving the faults to inject, or None.
+
+        The scenario can be changed at any time, for example to build a tree
+        normally and then inject faults into later operations.
+
+        '''
+        return self._scenario
+
+    @scenario.setter
+    def scenario(self, scenario):
+        self._scenario = scenario
+
+    @property
+    def component_paths(self):
+        '''The paths of all components in the tree, relative to the naming
+        service, as lists of strings.
+
+        '''
+        return self._component_paths
+
+    @property
+    def num_components(self):
+        '''The number of components in the tree.'''
+        return len(self._component_paths)
+
+    @property
+    def num_contexts(self):
+        '''The number of naming contexts in the tree, not counting the root.'''
+        return self._num_contexts
+
+    def _build(self, ctx, path, breadth, depth, components, ports,
+            conf_params):
+        if depth > 0:
+            for ii in range(breadth):
+                name = 'cxt{0}'.format(ii)
+                servant, ref = self._new_context()
+                servant._target = '/'.join(path + [name + '.host_cxt'])
+                ctx.add(name, 'host_cxt', ref, servant)
+                self._num_contexts += 1
+                self._build(servant, path + [name + '.host_cxt'], breadth,
+                        depth - 1, components, ports, conf_params)
+            return
+        for ii in range(components):
+            name = 'comp{0}'.format(ii)
+            comp = self._make_component(name, ports, conf_params)
+            target = '/'.join(path + [name + '.rtc'])
+            for servant in [comp, comp._ec, comp._conf] + comp._ports:
+                servant._target = target
+            ctx.add(name, 'rtc', comp._activate())
+            self._component_paths.append(path + [name + '.rtc'])
+
+    def _call(self, op, target):
+        # Called by every servant operation.
+        self._counter.count(op)
+        scenario = self._scenario
+        if scenario:
+            scenario.apply(op, target)
+
+    def _make_component(self, name, num_ports, conf_params):
+        ports = []
+        for ii in range(num_ports):
+            port_type = 'DataInPort' if ii % 2 == 0 else 'DataOutPort'
+            ports.append(Port(self, '{0}.port{1}'.format(name, ii),
+                {'port.port_type': port_type,
+                    'dataport.data_type': 'IDL:RTC/TimedLong:1.0',
+                    'dataport.subscription_type': 'flush,new,periodic',
+                    'dataport.dataflow_type': 'push,pull',
+                    'dataport.interface_type': 'corba_cdr'}))
+        params = dict([('param{0}'.format(ii), str(ii))
+            for ii in range(conf_params)])
+        conf = Configuration(self, {'default': params})
+        return Component(self, name, ports, ExecutionContext(self), conf)
+
+    def _new_context(self):
+        servant = NamingContext(self)
+        return servant, servant._this()
+
+
+def make_orb(port):
+    '''Create an ORB listening on the loopback interface at a port.'''
+    return CORBA.ORB_init([sys.argv[0], '-ORBendPoint',
+        'giop:tcp:127.0.0.1:{0}'.format(port)], CORBA.ORB_ID)
+
+
+##############################################################################
+## Stand-in in a child process
+
+class StandInProcess(object):
+    '''A StandIn served by its own ORB in a child process.
+
+    The stand-in is controlled through a pipe. It provides the same
+    information as a StandIn, but the scenario is loaded from a file in the
+    child process and only switched on and off from this one.
+
+    The process must be started before this process creates its own ORB.
+
+    '''
+    def __init__(self, port, breadth=4, depth=2, components=10, ports=4,
+            conf_params=5, scenario=None, *args, **kwargs):
+        '''Constructor.
+
+        @param port The TCP port the stand-in's naming service listens on.
+        @param breadth The number of sub-contexts in each naming context.
+        @param depth The number of levels of naming contexts.
+        @param components The number of components in each bottom-level
+                          context.
+        @param ports The number of data ports on each component.
+        @param conf_params The number of parameters in the configuration set
+                           of each component.
+        @param scenario The name of a scenario file giving the faults to
+                        inject, or None. Faults are not injected until
+                        inject() is called.
+
+        '''
+        super(StandInProcess, self).__init__(*args, **kwargs)
+        self._conn, child_conn = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve_standin,
+                args=(child_conn, port, {'breadth': breadth, 'depth': depth,
+                    'components': components, 'ports': ports,
+                    'conf_params': conf_params}, scenario))
+        self._process.daemon = True
+        self._process.start()
+        info = self._conn.recv()
+        if isinstance(info, Exception):
+            self._process.join()
+            raise info
+        self._component_paths, self._num_contexts = info
+        self._counter = _CallCounterProxy(self)
+
+    @property
+    def calls(self):
+        '''An object with the interface of CallCounter counting calls on the
+        stand-in's servants.
+
+        '''
+        return self._counter
+
+    @property
+    def component_paths(self):
+        '''The paths of all components in the tree, relative to the naming
+        service, as lists of strings.
+
+        '''
+        return self._component_paths
+
+    @property
+    def injected(self):
+        '''A dictionary of the number of each kind of fault injected.'''
+        return self._request('injected')
+
+    @property
+    def num_components(self):
+        '''The number of components in the tree.'''
+        return len(self._component_paths)
+
+    @property
+    def num_contexts(self):
+        '''The number of naming contexts in the tree, not counting the root.'''
+        return self._num_contexts
+
+    def inject(self, enable=True):
+        '''Start or stop injecting the faults of the scenario.'''
+        self._request('inject', enable)
+
+    def stop(self, timeout=5.0):
+        '''Stop the child process.
+
+        @param timeout The time, in seconds, to wait for the process to exit
+                       before killing it (e.g. if a servant call is hung).
+
+        '''
+        try:
+            self._conn.send(('stop', None))
+        except (EOFError, IOError, OSError):
+            pass
+        self._process.join(timeout)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+
+    def _request(self, cmd, arg=None):
+        self._conn.send((cmd, arg))
+        result = self._conn.recv()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class _CallCounterProxy(object):
+    # The CallCounter of a StandInProcess
+    def __init__(self, standin, *args, **kwargs):
+        super(_CallCounterProxy, self).__init__(*args, **kwargs)
+        self._standin = standin
+
+    def reset(self):
+        self._standin._request('reset_calls')
+
+    @property
+    def counts(self):
+        return self._standin._request('calls')
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+
+def _serve_standin(conn, port, kwargs, scenario_file):
+    # The body of the process of a StandInProcess
+    try:
+        scenario = Scenario.load(scenario_file) if scenario_file else None
+        orb = make_orb(port)
+        server = StandIn(orb, **kwargs)
+    except Exception as e:
+        conn.send(e)
+        return
+    conn.send((server.component_paths, server.num_contexts))
+    while True:
+        try:
+            cmd, arg = conn.recv()
+        except EOFError:
+            break
+        if cmd == 'stop':
+            break
+        try:
+            if cmd == 'reset_calls':
+                result = server.calls.reset()
+            elif cmd == 'calls':
+                result = server.calls.counts
+            elif cmd == 'inject':
+                server.scenario = scenario if arg else None
+                result = None
+            elif cmd == 'injected':
+                result = scenario.injected if scenario else {}
+            else:
+                raise ValueError(cmd)
+        except Exception as e:
+            result = e
+        conn.send(result)
+    orb.shutdown(False)
+
+
+# vim: tw=79
+
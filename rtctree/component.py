@@ -23,13 +23,15 @@ import SDOPackage
 import time
 import uuid
 
-from rtctree.config_set import ConfigurationSet
+from rtctree.config_set import ConfigurationSet, ConfigurationTransaction
 from rtctree.exceptions import *
 from rtctree.exec_context import ExecutionContext
+from rtctree.instrument import remote
 from rtctree.node import TreeNode
 import rtctree.sdo
 from rtctree.ports import parse_port
-from rtctree.utils import build_attr_string, nvlist_to_dict, dict_to_nvlist
+from rtctree.utils import build_attr_string, nvlist_to_dict, dict_to_nvlist, \
+        nvlist_to_shared_dict, LazyValue, SingleFlight
 
 
 ##############################################################################
@@ -71,6 +73,10 @@ class Component(TreeNode):
     - heartbeat(time)
       A heartbeat was received from the component. The time the beat was
       received is passed.
+    - heartbeat_missed(time)
+      The component is being watched by a HeartbeatMonitor and has not sent a
+      heartbeat within the monitor's timeout. The time of the last heartbeat
+      received is passed. This event is raised once per silence.
 
     '''
     def __init__(self, name=None, parent=None, obj=None, *args, **kwargs):
@@ -86,10 +92,34 @@ class Component(TreeNode):
         self._obs_id = None
         self._loggers = {}
         self._last_heartbeat = time.time() # RTC is alive at construction time
+        self._hb_monitor = None
+        self._conf_versions = {}
+        # Fetches of the configuration sets, keyed by what is fetched and the
+        # generation of the cache it is fetched for
+        self._conf_flights = SingleFlight()
+        self._conf_generation = 0
+        # Number of configuration sets removed by observer events, and the
+        # number at which each set was last removed
+        self._conf_removals = 0
+        self._conf_removed = {}
+        # Information fetched from the component when first needed. The
+        # fetches are made without holding the node's lock.
+        self._owned_ecs = LazyValue(self._fetch_owned_ecs)
+        self._owned_ec_states = LazyValue(
+                lambda: [self._get_ec_state(ec) for ec in self.owned_ecs])
+        self._participating_ecs = LazyValue(self._fetch_participating_ecs)
+        self._participating_ec_states = LazyValue(lambda: [
+            self._get_ec_state(ec) for ec in self.participating_ecs])
+        self._ports = LazyValue(lambda: [parse_port(port, self) \
+                for port in remote(self._obj, self).get_ports()])
+        self._orgs = LazyValue(self._fetch_organisations)
+        self._parent_orgs = LazyValue(self._fetch_parent_organisations)
+        self._members = LazyValue(lambda: dict((o.org_id,
+            remote(o.obj, self).get_members()) for o in self.organisations))
         super(Component, self).__init__(name=name, parent=parent,
                                         *args, **kwargs)
         self._set_events(['rtc_status', 'component_profile', 'ec_event',
-            'port_event', 'config_event', 'heartbeat'])
+            'port_event', 'config_event', 'heartbeat', 'heartbeat_missed'])
         self._reset_data()
         self._parse_profile()
 
@@ -202,9 +232,10 @@ class Component(TreeNode):
             if self.is_member(rtc):
                 raise AlreadyInCompositionError(self.name, rtc.instance_name)
         org = self.organisations[0].obj
-        org.add_members([x.object for x in rtcs])
+        remote(org, self).add_members([x.object for x in rtcs])
         # Force a reparse of the member information
-        self._orgs = []
+        self._orgs.reset()
+        self._members.reset()
 
     def remove_members(self, rtcs):
         '''Remove other RT Components from this composite component.
@@ -219,7 +250,7 @@ class Component(TreeNode):
         if not self.is_composite:
             raise NotCompositeError(self.name)
         org = self.organisations[0].obj
-        members = org.get_members()
+        members = remote(org, self).get_members()
         for rtc in rtcs:
             if type(rtc) == str:
                 rtc_name = rtc
@@ -229,9 +260,10 @@ class Component(TreeNode):
             if not self.is_member(rtc):
                 raise NotInCompositionError(self.name, rtc_name)
             # Remove the RTC from the composition
-            org.remove_member(rtc_name)
+            remote(org, self).remove_member(rtc_name)
         # Force a reparse of the member information
-        self._orgs = []
+        self._orgs.reset()
+        self._members.reset()
 
     @property
     def composite_parent(self):
@@ -245,12 +277,12 @@ class Component(TreeNode):
     @property
     def is_composite(self):
         '''Is the component a composite component.'''
-        return self._obj.get_owned_organizations() != []
+        return remote(self._obj, self).get_owned_organizations() != []
 
     @property
     def is_composite_member(self):
         '''Is the component a member of a composite component.'''
-        return self._obj.get_organizations() != []
+        return remote(self._obj, self).get_organizations() != []
 
     def is_member(self, rtc):
         '''Is the given component a member of this composition?
@@ -266,10 +298,11 @@ class Component(TreeNode):
         '''
         if not self.is_composite:
             raise NotCompositeError(self.name)
-        members = self.organisations[0].obj.get_members()
+        members = remote(self.organisations[0].obj, self).get_members()
         if type(rtc) is str:
             for m in members:
-                if m.get_component_profile().instance_name == rtc:
+                profile = remote(m, self).get_component_profile()
+                if profile.instance_name == rtc:
                     return True
         else:
             for m in members:
@@ -280,76 +313,36 @@ class Component(TreeNode):
     @property
     def members(self):
         '''Member components if this component is composite.'''
-        with self._mutex:
-            if not self._members:
-                self._members = {}
-                for o in self.organisations:
-                    # TODO: Search for these in the tree
-                    self._members[o.org_id] = o.obj.get_members()
-        return self._members
+        # TODO: Search for these in the tree
+        return self._members.get()
 
     @property
     def organisations(self):
         '''The organisations of this composition.'''
-        class Org:
-            def __init__(self, sdo_id, org_id, members, obj):
-                self.sdo_id = sdo_id
-                self.org_id = org_id
-                self.members = members
-                self.obj = obj
-
-        with self._mutex:
-            if not self._orgs:
-                for org in self._obj.get_owned_organizations():
-                    owner = org.get_owner()
-                    if owner:
-                        sdo_id = owner._narrow(SDOPackage.SDO).get_sdo_id()
-                    else:
-                        sdo_id = ''
-                    org_id = org.get_organization_id()
-                    members = [m.get_sdo_id() for m in org.get_members()]
-                    self._orgs.append(Org(sdo_id, org_id, members, org))
-        return self._orgs
+        return self._orgs.get()
 
     @property
     def org_ids(self):
         '''The organisation IDs of this composition.'''
-        return [sdo.get_organization_id() for sdo in \
-                self._obj.get_owned_organizations()]
+        return [remote(sdo, self).get_organization_id() for sdo in \
+                remote(self._obj, self).get_owned_organizations()]
 
     @property
     def parent_org_ids(self):
         '''The organisation IDs of the compositions this RTC belongs to.'''
-        return [sdo.get_organization_id() for sdo in \
-                self._obj.get_organizations() if sdo]
+        return [remote(sdo, self).get_organization_id() for sdo in \
+                remote(self._obj, self).get_organizations() if sdo]
 
     @property
     def parent_org_sdo_ids(self):
         '''The SDO IDs of the compositions this RTC belongs to.'''
-        return [sdo.get_owner()._narrow(SDOPackage.SDO).get_sdo_id() \
-                for sdo in self._obj.get_organizations() if sdo]
+        return [_get_sdo_id(remote(sdo, self).get_owner(), self) \
+                for sdo in remote(self._obj, self).get_organizations() if sdo]
 
     @property
     def parent_organisations(self):
         '''The organisations this RTC belongs to.'''
-        class ParentOrg:
-            def __init__(self, sdo_id, org_id):
-                self.sdo_id = sdo_id
-                self.org_id = org_id
-
-        with self._mutex:
-            if not self._parent_orgs:
-                for sdo in self._obj.get_organizations():
-                    if not sdo:
-                        continue
-                    owner = sdo.get_owner()
-                    if owner:
-                        sdo_id = owner._narrow(SDOPackage.SDO).get_sdo_id()
-                    else:
-                        sdo_id = ''
-                    org_id = sdo.get_organization_id()
-                    self._parent_orgs.append(ParentOrg(sdo_id, org_id))
-        return self._parent_orgs
+        return self._parent_orgs.get()
 
     ###########################################################################
     # State management
@@ -363,8 +356,7 @@ class Component(TreeNode):
         @return The result of attempting to exit.
 
         '''
-        with self._mutex:
-            return self._obj.exit()
+        return remote(self._obj, self).exit()
 
     def activate_in_ec(self, ec_index):
         '''Activate this component in an execution context.
@@ -378,15 +370,14 @@ class Component(TreeNode):
                         @ref participating_ecs.
 
         '''
-        with self._mutex:
-            if ec_index >= len(self.owned_ecs):
-                ec_index -= len(self.owned_ecs)
-                if ec_index >= len(self.participating_ecs):
-                    raise BadECIndexError(ec_index)
-                ec = self.participating_ecs[ec_index]
-            else:
-                ec = self.owned_ecs[ec_index]
-            ec.activate_component(self._obj)
+        if ec_index >= len(self.owned_ecs):
+            ec_index -= len(self.owned_ecs)
+            if ec_index >= len(self.participating_ecs):
+                raise BadECIndexError(ec_index)
+            ec = self.participating_ecs[ec_index]
+        else:
+            ec = self.owned_ecs[ec_index]
+        ec.activate_component(self._obj)
 
     def deactivate_in_ec(self, ec_index):
         '''Deactivate this component in an execution context.
@@ -400,15 +391,14 @@ class Component(TreeNode):
                         @ref participating_ecs.
 
         '''
-        with self._mutex:
-            if ec_index >= len(self.owned_ecs):
-                ec_index -= len(self.owned_ecs)
-                if ec_index >= len(self.participating_ecs):
-                    raise BadECIndexError(ec_index)
-                ec = self.participating_ecs[ec_index]
-            else:
-                ec = self.owned_ecs[ec_index]
-            ec.deactivate_component(self._obj)
+        if ec_index >= len(self.owned_ecs):
+            ec_index -= len(self.owned_ecs)
+            if ec_index >= len(self.participating_ecs):
+                raise BadECIndexError(ec_index)
+            ec = self.participating_ecs[ec_index]
+        else:
+            ec = self.owned_ecs[ec_index]
+        ec.deactivate_component(self._obj)
 
     def exit(self):
         '''Make a component exit.
@@ -418,7 +408,7 @@ class Component(TreeNode):
         reparse is necessary to do that.
 
         '''
-        self._obj.exit()
+        remote(self._obj, self).exit()
 
     def get_ec(self, ec_handle):
         '''Get a reference to the execution context with the given handle.
@@ -430,14 +420,13 @@ class Component(TreeNode):
         @raises NoECWithHandleError
 
         '''
-        with self._mutex:
-            for ec in self.owned_ecs:
-                if ec.handle == ec_handle:
-                    return ec
-            for ec in self.participating_ecs:
-                if ec.handle == ec_handle:
-                    return ec
-            raise NoECWithHandleError
+        for ec in self.owned_ecs:
+            if ec.handle == ec_handle:
+                return ec
+        for ec in self.participating_ecs:
+            if ec.handle == ec_handle:
+                return ec
+        raise NoECWithHandleError
 
 
     def get_ec_index(self, ec_handle):
@@ -451,14 +440,13 @@ class Component(TreeNode):
         @raises NoECWithHandleError
 
         '''
-        with self._mutex:
-            for ii, ec in enumerate(self.owned_ecs):
-                if ec.handle == ec_handle:
-                    return ii
-            for ii, ec in enumerate(self.participating_ecs):
-                if ec.handle == ec_handle:
-                    return ii + len(self.owned_ecs)
-            raise NoECWithHandleError
+        for ii, ec in enumerate(self.owned_ecs):
+            if ec.handle == ec_handle:
+                return ii
+        for ii, ec in enumerate(self.participating_ecs):
+            if ec.handle == ec_handle:
+                return ii + len(self.owned_ecs)
+        raise NoECWithHandleError
 
     def get_state_string(self, add_colour=True):
         '''Get the state of this component as an optionally-coloured string.
@@ -468,17 +456,16 @@ class Component(TreeNode):
         @return A string describing the state of this component.
 
         '''
-        with self._mutex:
-            if self.state == self.INACTIVE:
-                result = 'Inactive', ['bold', 'blue']
-            elif self.state == self.ACTIVE:
-                result = 'Active', ['bold', 'green']
-            elif self.state == self.ERROR:
-                result = 'Error', ['bold', 'white', 'bgred']
-            elif self.state == self.UNKNOWN:
-                result = 'Unknown', ['bold', 'red']
-            elif self.state == self.CREATED:
-                result = 'Created', ['reset']
+        if self.state == self.INACTIVE:
+            result = 'Inactive', ['bold', 'blue']
+        elif self.state == self.ACTIVE:
+            result = 'Active', ['bold', 'green']
+        elif self.state == self.ERROR:
+            result = 'Error', ['bold', 'white', 'bgred']
+        elif self.state == self.UNKNOWN:
+            result = 'Unknown', ['bold', 'red']
+        elif self.state == self.CREATED:
+            result = 'Created', ['reset']
         if add_colour:
             return build_attr_string(result[1], supported=add_colour) + \
                     result[0] + build_attr_string('reset', supported=add_colour)
@@ -497,14 +484,13 @@ class Component(TreeNode):
                         participating_ecs.
 
         '''
-        with self._mutex:
-            if ec_index >= len(self.owned_ecs):
-                ec_index -= len(self.owned_ecs)
-                if ec_index >= len(self.participating_ecs):
-                    raise BadECIndexError(ec_index)
-                state = self.participating_ec_states[ec_index]
-            else:
-                state = self.owned_ec_states[ec_index]
+        if ec_index >= len(self.owned_ecs):
+            ec_index -= len(self.owned_ecs)
+            if ec_index >= len(self.participating_ecs):
+                raise BadECIndexError(ec_index)
+            state = self.participating_ec_states[ec_index]
+        else:
+            state = self.owned_ec_states[ec_index]
         if state == self.INACTIVE:
             result = 'Inactive', ['bold', 'blue']
         elif state == self.ACTIVE:
@@ -533,15 +519,14 @@ class Component(TreeNode):
                         used as an index into @ref participating_ecs.
 
         '''
-        with self._mutex:
-            if ec_index >= len(self.owned_ecs):
-                ec_index -= len(self.owned_ecs)
-                if ec_index >= len(self.participating_ecs):
-                    raise BadECIndexError(ec_index)
-                ec = self.participating_ecs[ec_index]
-            else:
-                ec = self.owned_ecs[ec_index]
-            ec.reset_component(self._obj)
+        if ec_index >= len(self.owned_ecs):
+            ec_index -= len(self.owned_ecs)
+            if ec_index >= len(self.participating_ecs):
+                raise BadECIndexError(ec_index)
+            ec = self.participating_ecs[ec_index]
+        else:
+            ec = self.owned_ecs[ec_index]
+        ec.reset_component(self._obj)
 
     def state_in_ec(self, ec_index):
         '''Get the state of the component in an execution context.
@@ -555,14 +540,13 @@ class Component(TreeNode):
                         participating_ecs.
 
         '''
-        with self._mutex:
-            if ec_index >= len(self.owned_ecs):
-                ec_index -= len(self.owned_ecs)
-                if ec_index >= len(self.participating_ecs):
-                    raise BadECIndexError(ec_index)
-                return self.participating_ec_states[ec_index]
-            else:
-                return self.owned_ec_states[ec_index]
+        if ec_index >= len(self.owned_ecs):
+            ec_index -= len(self.owned_ecs)
+            if ec_index >= len(self.participating_ecs):
+                raise BadECIndexError(ec_index)
+            return self.participating_ec_states[ec_index]
+        else:
+            return self.owned_ec_states[ec_index]
 
     def refresh_state_in_ec(self, ec_index):
         '''Get the up-to-date state of the component in an execution context.
@@ -580,51 +564,35 @@ class Component(TreeNode):
                         participating_ecs.
 
         '''
-        with self._mutex:
-            if ec_index >= len(self.owned_ecs):
-                ec_index -= len(self.owned_ecs)
-                if ec_index >= len(self.participating_ecs):
-                    raise BadECIndexError(ec_index)
-                state = self._get_ec_state(self.participating_ecs[ec_index])
-                self.participating_ec_states[ec_index] = state
-            else:
-                state = self._get_ec_state(self.owned_ecs[ec_index])
-                self.owned_ec_states[ec_index] = state
-            return state
+        if ec_index >= len(self.owned_ecs):
+            ec_index -= len(self.owned_ecs)
+            if ec_index >= len(self.participating_ecs):
+                raise BadECIndexError(ec_index)
+            state = self._get_ec_state(self.participating_ecs[ec_index])
+            self.participating_ec_states[ec_index] = state
+        else:
+            state = self._get_ec_state(self.owned_ecs[ec_index])
+            self.owned_ec_states[ec_index] = state
+        return state
 
     @property
     def alive(self):
         '''Is this component alive?'''
-        with self._mutex:
-            if self.exec_contexts:
-                for ec in self.exec_contexts:
-                    if self._obj.is_alive(ec):
-                        return True
+        if self.exec_contexts:
+            for ec in self.exec_contexts:
+                if remote(self._obj, self).is_alive(ec):
+                    return True
         return False
 
     @property
     def owned_ec_states(self):
         '''The state of each execution context this component owns.'''
-        with self._mutex:
-            if not self._owned_ec_states:
-                if self.owned_ecs:
-                    states = []
-                    for ec in self.owned_ecs:
-                        states.append(self._get_ec_state(ec))
-                    self._owned_ec_states = states
-                else:
-                    self._owned_ec_states = []
-        return self._owned_ec_states
+        return self._owned_ec_states.get()
 
     @property
     def owned_ecs(self):
         '''A list of the execution contexts owned by this component.'''
-        with self._mutex:
-            if not self._owned_ecs:
-                self._owned_ecs = [ExecutionContext(ec,
-                    self._obj.get_context_handle(ec)) \
-                    for ec in self._obj.get_owned_contexts()]
-        return self._owned_ecs
+        return self._owned_ecs.get()
 
     @property
     def participating_ec_states(self):
@@ -632,28 +600,14 @@ class Component(TreeNode):
         in.
 
         '''
-        with self._mutex:
-            if not self._participating_ec_states:
-                if self.participating_ecs:
-                    states = []
-                    for ec in self.participating_ecs:
-                        states.append(self._get_ec_state(ec))
-                    self._participating_ec_states = states
-                else:
-                    self._participating_ec_states = []
-        return self._participating_ec_states
+        return self._participating_ec_states.get()
 
     @property
     def participating_ecs(self):
         '''A list of the execution contexts this component is participating in.
 
         '''
-        with self._mutex:
-            if not self._participating_ecs:
-                self._participating_ecs = [ExecutionContext(ec,
-                                    self._obj.get_context_handle(ec)) \
-                             for ec in self._obj.get_participating_contexts()]
-        return self._participating_ecs
+        return self._participating_ecs.get()
 
     @property
     def plain_state_string(self):
@@ -685,17 +639,16 @@ class Component(TreeNode):
                 return self.UNKNOWN
             return current
 
-        with self._mutex:
-            if not self.owned_ec_states and not self.participating_ec_states:
-                return self.UNKNOWN
-            merged_state = self.CREATED
-            if self.owned_ec_states:
-                for ec_state in self.owned_ec_states:
-                    merged_state = merge_state(merged_state, ec_state)
-            if self.participating_ec_states:
-                for ec_state in self.participating_ec_states:
-                    merged_state = merge_state(merged_state, ec_state)
-            return merged_state
+        owned = self.owned_ec_states
+        participating = self.participating_ec_states
+        if not owned and not participating:
+            return self.UNKNOWN
+        merged_state = self.CREATED
+        for ec_state in owned:
+            merged_state = merge_state(merged_state, ec_state)
+        for ec_state in participating:
+            merged_state = merge_state(merged_state, ec_state)
+        return merged_state
 
     @property
     def state_string(self):
@@ -707,45 +660,40 @@ class Component(TreeNode):
 
     def disconnect_all(self):
         '''Disconnect all connections to all ports of this component.'''
-        with self._mutex:
-            for p in self.ports:
-                p.disconnect_all()
+        for p in self.ports:
+            p.disconnect_all()
 
     def get_port_by_name(self, port_name):
         '''Get a port of this component by name.'''
-        with self._mutex:
-            for p in self.ports:
-                if p.name == port_name:
-                    return p
-            return None
+        for p in self.ports:
+            if p.name == port_name:
+                return p
+        return None
 
     def get_port_by_ref(self, port_ref):
         '''Get a port of this component by reference to a CORBA PortService
         object.
 
         '''
-        with self._mutex:
-            for p in self.ports:
-                if p.object._is_equivalent(port_ref):
-                    return p
-            return None
+        for p in self.ports:
+            if p.object._is_equivalent(port_ref):
+                return p
+        return None
 
     def has_port_by_name(self, port_name):
         '''Check if this component has a port by the given name.'''
-        with self._mutex:
-            if self.get_port_by_name(port_name):
-                return True
-            return False
+        if self.get_port_by_name(port_name):
+            return True
+        return False
 
     def has_port_by_ref(self, port_ref):
         '''Check if this component has a port by the given reference to a CORBA
         PortService object.
 
         '''
-        with self._mutex:
-            if self.get_port_by_ref(self, port_ref):
-                return True
-            return False
+        if self.get_port_by_ref(self, port_ref):
+            return True
+        return False
 
     @property
     def connected_inports(self):
@@ -796,11 +744,7 @@ class Component(TreeNode):
     @property
     def ports(self):
         '''The list of all ports belonging to this component.'''
-        with self._mutex:
-            if not self._ports:
-                self._ports = [parse_port(port, self) \
-                               for port in self._obj.get_ports()]
-        return self._ports
+        return self._ports.get()
 
     @property
     def svcports(self):
@@ -851,22 +795,11 @@ class Component(TreeNode):
         @raises AddLoggerError
 
         '''
+        obs = rtctree.sdo.RTCLogger(self, cb)
+        uuid_val = self._add_logger_service(obs._this(), level, filters)
         with self._mutex:
-            obs = rtctree.sdo.RTCLogger(self, cb)
-            uuid_val = uuid.uuid4()
-            intf_type = obs._this()._NP_RepositoryId
-            props = {'logger.log_level': level,
-                    'logger.filter': filters}
-            props = dict_to_nvlist(props)
-            sprof = SDOPackage.ServiceProfile(id=uuid_val.get_bytes(),
-                    interface_type=intf_type, service=obs._this(),
-                    properties=props)
-            conf = self.object.get_configuration()
-            res = conf.add_service_profile(sprof)
-            if res:
-                self._loggers[uuid_val] = obs
-                return uuid_val
-            raise AddLoggerError(self.name)
+            self._loggers[uuid_val] = obs
+        return uuid_val
 
     def remove_logger(self, cb_id):
         '''Remove a logger.
@@ -877,8 +810,7 @@ class Component(TreeNode):
         '''
         if cb_id not in self._loggers:
             raise NoLoggerError(cb_id, self.name)
-        conf = self.object.get_configuration()
-        res = conf.remove_service_profile(cb_id.get_bytes())
+        self._remove_logger_service(cb_id)
         del self._loggers[cb_id]
 
     ###########################################################################
@@ -889,11 +821,115 @@ class Component(TreeNode):
 
         @raises NoSuchConfSetError
 
+        '''
+        if not set_name in self.conf_sets:
+            raise NoSuchConfSetError(set_name)
+        remote(self._conf, self).activate_configuration_set(set_name)
+
+    def check_conf_sets(self):
+        '''Check the cached configuration sets against the component.
+
+        All configuration sets and the active set name are fetched from the
+        component in two calls, and only the cached sets that differ are
+        updated. This is a cheap way to keep the cache of a component that is
+        not dynamic up to date, for example by calling it periodically, without
+        discarding the whole cache as reparse_conf_sets() does.
+
+        If the configuration sets have not been parsed yet, nothing is done.
+
+        @return A list of the names of the configuration sets that changed,
+                were added or were removed. If the active configuration set
+                changed, None is included in the list.
+
         '''
         with self._mutex:
-            if not set_name in self.conf_sets:
-                raise NoSuchConfSetError(set_name)
-            self._conf.activate_configuration_set(set_name)
+            if self._conf_sets is None:
+                return []
+            conf = self._conf
+            generation = self._conf_generation
+        fetched = {}
+        for cs in remote(conf, self).get_configuration_sets():
+            fetched[cs.id] = cs
+        try:
+            active = remote(conf, self).get_active_configuration_set().id
+        except SDOPackage.NotAvailable:
+            active = ''
+        with self._mutex:
+            if generation != self._conf_generation:
+                # Reset while fetching
+                return []
+            changed = []
+            for name in list(self._conf_sets.keys()):
+                if name not in fetched:
+                    del self._conf_sets[name]
+                    self._bump_conf_version(name)
+                    changed.append(name)
+            for name, cs in fetched.items():
+                data = nvlist_to_dict(cs.configuration_data)
+                if name not in self._conf_sets:
+                    self._conf_sets[name] = ConfigurationSet(self, cs,
+                            cs.description, data)
+                elif self._conf_sets[name].data != data or \
+                        self._conf_sets[name].description != cs.description:
+                    self._conf_sets[name]._reload(cs, cs.description, data)
+                else:
+                    continue
+                self._bump_conf_version(name)
+                changed.append(name)
+            self._stale_conf_sets = {}
+            if active != self._active_conf_set:
+                self._active_conf_set = active
+                changed.append(None)
+            return changed
+
+    def conf_set_version(self, set_name):
+        '''Get the version of a configuration set in the cache.
+
+        The version is increased every time the cached configuration set is
+        changed, whether by this object, by an observer event or by
+        check_conf_sets(). Comparing versions is a cheap way to tell if a set
+        has changed since it was last read.
+
+        @param set_name The name of the configuration set.
+        @return The version number, or 0 if the set has never been cached.
+
+        '''
+        with self._mutex:
+            return self._conf_versions.get(set_name, 0)
+
+    def conf_transaction(self, activate=None):
+        '''Begin a group of configuration parameter changes.
+
+        The changes are staged locally and uploaded when the transaction is
+        committed, with a single upload for each changed configuration set.
+        For example:
+
+        with comp.conf_transaction(activate='default') as t:
+            t.set('default', 'gain', '2.0')
+            t.set('default', 'offset', '0.5')
+
+        @param activate The name of a configuration set to activate after the
+                        changes are uploaded, or None.
+        @return A ConfigurationTransaction object.
+
+        '''
+        return ConfigurationTransaction(self, activate=activate)
+
+    def set_conf_set_values(self, set_name, params, activate=False):
+        '''Set several parameters of a configuration set with one upload.
+
+        @param set_name The name of the configuration set the destination
+                        parameters are in.
+        @param params A dictionary of parameter names and their new values.
+        @param activate If True, activate the configuration set after the
+                        parameters are set.
+        @raises NoSuchConfSetError, NoSuchConfParamError
+
+        '''
+        t = ConfigurationTransaction(self,
+                activate=set_name if activate else None)
+        t.update(set_name, params)
+        t.commit()
 
     def set_conf_set_value(self, set_name, param, value):
         '''Set a configuration set parameter value.
@@ -905,30 +941,35 @@ class Component(TreeNode):
         @raises NoSuchConfSetError, NoSuchConfParamError
 
         '''
+        conf_sets = self.conf_sets
         with self._mutex:
-            if not set_name in self.conf_sets:
+            if not set_name in conf_sets:
                 raise NoSuchConfSetError(set_name)
-            if not self.conf_sets[set_name].has_param(param):
+            if not conf_sets[set_name].has_param(param):
                 raise NoSuchConfParamError(param)
-            self.conf_sets[set_name].set_param(param, value)
-            self._conf.set_configuration_set_values(\
-                    self.conf_sets[set_name].object)
+            conf_sets[set_name].set_param(param, value)
+            obj = conf_sets[set_name].object
+        remote(self._conf, self).set_configuration_set_values(obj)
+        with self._mutex:
+            self._bump_conf_version(set_name)
 
     @property
     def active_conf_set(self):
         '''The currently-active configuration set.'''
+        conf_sets = self.conf_sets
         with self._mutex:
-            if not self.conf_sets:
+            if not conf_sets:
                 return None
             if not self._active_conf_set:
                 return None
-            return self.conf_sets[self._active_conf_set]
+            return conf_sets[self._active_conf_set]
 
     @property
     def active_conf_set_name(self):
         '''The name of the currently-active configuration set.'''
+        conf_sets = self.conf_sets
         with self._mutex:
-            if not self.conf_sets:
+            if not conf_sets:
                 return ''
             if not self._active_conf_set:
                 return ''
@@ -937,10 +978,20 @@ class Component(TreeNode):
     @property
     def conf_sets(self):
         '''The dictionary of configuration sets in this component, if any.'''
-        with self._mutex:
-            if not self._conf_sets:
-                self._parse_configuration()
-        return self._conf_sets
+        while True:
+            with self._mutex:
+                generation = self._conf_generation
+                if self._conf_sets is None:
+                    key = ('parse', generation)
+                    fetch = self._parse_configuration
+                elif self._stale_conf_sets or \
+                        self._conf_flights.in_flight(('refresh', generation)):
+                    key = ('refresh', generation)
+                    fetch = self._refresh_conf_sets
+                else:
+                    return self._conf_sets
+            # Concurrent readers share one fetch, made outside the lock
+            self._conf_flights.do(key, lambda: fetch(generation))
 
     ###########################################################################
     # Internal API
@@ -949,29 +1000,72 @@ class Component(TreeNode):
         # Components cannot contain children.
         raise CannotHoldChildrenError
 
+    def _add_logger_service(self, logger, level, filters):
+        # Attach a reference to an OpenRTM::Logger object to the component as
+        # an SDO service, returning the ID of the service profile.
+        uuid_val = uuid.uuid4()
+        props = dict_to_nvlist({'logger.log_level': level,
+                'logger.filter': filters})
+        sprof = SDOPackage.ServiceProfile(id=uuid_val.get_bytes(),
+                interface_type=logger._NP_RepositoryId, service=logger,
+                properties=props)
+        conf = remote(self.object, self).get_configuration()
+        if remote(conf, self).add_service_profile(sprof):
+            return uuid_val
+        raise AddLoggerError(self.name)
+
+    def _bump_conf_version(self, set_name):
+        # Record a change to a cached configuration set.
+        self._conf_versions[set_name] = \
+                self._conf_versions.get(set_name, 0) + 1
+
+    def _commit_conf_changes(self, changes, activate=None):
+        # Apply a dictionary of configuration set names to dictionaries of
+        # parameter changes, uploading each set once, then optionally activate
+        # a set.
+        conf_sets = self.conf_sets
+        uploads = []
+        with self._mutex:
+            if activate and activate not in conf_sets:
+                raise NoSuchConfSetError(activate)
+            for set_name, params in changes.items():
+                if not params:
+                    continue
+                conf_sets[set_name].set_params(params)
+                uploads.append((set_name, conf_sets[set_name].object))
+        for set_name, obj in uploads:
+            remote(self._conf, self).set_configuration_set_values(obj)
+            with self._mutex:
+                self._bump_conf_version(set_name)
+        if activate:
+            remote(self._conf, self).activate_configuration_set(activate)
+
     def _config_event(self, name, event):
+        # Changed sets and parameters are only marked as stale here. They are
+        # fetched the next time the configuration sets are read, so the
+        # observer does not make remote calls and a burst of changes to one
+        # set costs a single fetch.
         with self._mutex:
-            if self._conf_sets:
-                if event == self.CFG_UPDATE_SET:
-                    # A configuration set has been updated
-                    cs = self._conf.get_configuration_set(name)
-                    self._conf_sets[name]._reload(cs, cs.description,
-                            nvlist_to_dict(cs.configuration_data))
+            if self._conf_sets is not None:
+                if event in [self.CFG_UPDATE_SET, self.CFG_SET_SET,
+                        self.CFG_ADD_SET]:
+                    # A configuration set has been updated or added
+                    self._stale_conf_sets[name] = None
                 elif event == self.CFG_UPDATE_PARAM:
                     # A parameter in a configuration set has been changed
-                    cset, param = name.split('.')
-                    cs = self._conf.get_configuration_set(cset)
-                    data = nvlist_to_dict(cs.configuration_data)
-                    self._conf_sets[cset].set_param(param, data[param])
-                elif event == self.CFG_ADD_SET:
-                    # A new configuration set has been added
-                    cs = self._conf.get_configuration_set(name)
-                    self._conf_sets[name] = ConfigurationSet(self, cs,
-                            cs.description,
-                            nvlist_to_dict(cs.configuration_data))
+                    cset, param = name.split('.', 1)
+                    if cset not in self._stale_conf_sets:
+                        self._stale_conf_sets[cset] = set([param])
+                    elif self._stale_conf_sets[cset] is not None:
+                        self._stale_conf_sets[cset].add(param)
                 elif event == self.CFG_REMOVE_SET:
                     # Remove the configuration set
-                    del self._conf_sets[name]
+                    self._conf_removals += 1
+                    self._conf_removed[name] = self._conf_removals
+                    if name in self._conf_sets:
+                        del self._conf_sets[name]
+                        self._bump_conf_version(name)
+                    self._stale_conf_sets.pop(name, None)
                 elif event == self.CFG_ACTIVATE_SET:
                     # Change the active configuration set
                     self._active_conf_set = name
@@ -989,8 +1083,8 @@ class Component(TreeNode):
             sprof = SDOPackage.ServiceProfile(id=uuid_val,
                     interface_type=intf_type, service=obs._this(),
                     properties=props)
-            conf = self.object.get_configuration()
-            res = conf.add_service_profile(sprof)
+            conf = remote(self.object, self).get_configuration()
+            res = remote(conf, self).add_service_profile(sprof)
             if res:
                 self._dynamic = True
                 self._obs = obs
@@ -998,8 +1092,8 @@ class Component(TreeNode):
                 # If we could set an observer, the component is alive
                 self._last_heartbeat = time.time()
         else: # Disable
-            conf = self.object.get_configuration()
-            res = conf.remove_service_profile(self._obs_id)
+            conf = remote(self.object, self).get_configuration()
+            res = remote(conf, self).remove_service_profile(self._obs_id)
             if res:
                 self._dynamic = False
                 self._obs = None
@@ -1009,25 +1103,36 @@ class Component(TreeNode):
         def get_ec(ec_handle):
             tgt_ec = None
             loc = None
-            if self._owned_ecs:
-                for ec in self._owned_ecs:
+            owned = self._owned_ecs.peek()
+            if owned:
+                for ec in owned:
                     if ec.handle == ec_handle:
                         tgt_ec = ec
-                        loc = self._owned_ecs
+                        loc = owned
                         break
-            if not del_ec and self._participating_ecs:
-                for ec in self._participating_ecs:
+            participating = self._participating_ecs.peek()
+            if not tgt_ec and participating:
+                for ec in participating:
                     if ec.handle == ec_handle:
                         tgt_ec = ec
-                        loc = self._participating_ecs
+                        loc = participating
                         break
             return tgt_ec, loc
 
+        if event == self.EC_ATTACHED and self._participating_ecs.cached:
+            # Fetch the new EC before taking the lock
+            new_ec = ExecutionContext(
+                    remote(self._obj, self).get_context(ec_handle), ec_handle,
+                    self)
+        else:
+            new_ec = None
         with self._mutex:
             if event == self.EC_ATTACHED:
                 # New EC has been attached
-                self._participating_ecs.append(ExecutionContext(
-                    self._obj.get_context(ec_handle), ec_handle))
+                participating = self._participating_ecs.peek()
+                if new_ec and participating is not None:
+                    participating.append(new_ec)
+                    self._participating_ec_states.reset()
             elif event == self.EC_DETACHED:
                 # An EC has been detached; delete the local facade
                 # if ec is not None, the corresponding EC has a local
@@ -1047,11 +1152,56 @@ class Component(TreeNode):
                 if ec:
                     ec._set_running(False)
         # Call callbacks outside the mutex
-        self._call_cb('ec_event', (ec_handle, state))
+        self._call_cb('ec_event', (ec_handle, event))
+
+    def _fetch_organisations(self):
+        # Fetch the organisations of this composition
+        class Org:
+            def __init__(self, sdo_id, org_id, members, obj):
+                self.sdo_id = sdo_id
+                self.org_id = org_id
+                self.members = members
+                self.obj = obj
+
+        orgs = []
+        for org in remote(self._obj, self).get_owned_organizations():
+            sdo_id = _get_sdo_id(remote(org, self).get_owner(), self)
+            org_id = remote(org, self).get_organization_id()
+            members = [remote(m, self).get_sdo_id() \
+                    for m in remote(org, self).get_members()]
+            orgs.append(Org(sdo_id, org_id, members, org))
+        return orgs
+
+    def _fetch_owned_ecs(self):
+        return [ExecutionContext(ec,
+            remote(self._obj, self).get_context_handle(ec), self) \
+            for ec in remote(self._obj, self).get_owned_contexts()]
+
+    def _fetch_parent_organisations(self):
+        # Fetch the organisations this RTC belongs to
+        class ParentOrg:
+            def __init__(self, sdo_id, org_id):
+                self.sdo_id = sdo_id
+                self.org_id = org_id
+
+        orgs = []
+        for sdo in remote(self._obj, self).get_organizations():
+            if not sdo:
+                continue
+            sdo_id = _get_sdo_id(remote(sdo, self).get_owner(), self)
+            org_id = remote(sdo, self).get_organization_id()
+            orgs.append(ParentOrg(sdo_id, org_id))
+        return orgs
+
+    def _fetch_participating_ecs(self):
+        ecs = remote(self._obj, self).get_participating_contexts()
+        return [ExecutionContext(ec,
+                remote(self._obj, self).get_context_handle(ec), self) \
+                for ec in ecs]
 
     def _get_ec_state(self, ec):
         # Get the state of this component in an EC and return the enum value.
-        if self._obj.is_alive(ec._obj):
+        if remote(self._obj, self).is_alive(ec._obj):
             ec_state = ec.get_component_state(self._obj)
             if ec_state == RTC.ACTIVE_STATE:
                 return self.ACTIVE
@@ -1067,63 +1217,89 @@ class Component(TreeNode):
     def _heartbeat(self):
         # Received a heart beat
         self._last_heartbeat = time.time()
+        if self._hb_monitor:
+            self._hb_monitor.beat(self, self._last_heartbeat)
         self._call_cb('heartbeat', self._last_heartbeat)
 
-    def _parse_configuration(self):
-        # Parse the component's configuration sets
+    def _heartbeat_missed(self, last_heartbeat):
+        # The heartbeat monitor watching this component timed out
+        self._call_cb('heartbeat_missed', last_heartbeat)
+
+    def _parse_configuration(self, generation):
+        # Parse the component's configuration sets. They are fetched before
+        # taking the lock, which is only held to install them.
+        conf = remote(self.object, self).get_configuration()
+        sets = remote(conf, self).get_configuration_sets()
+        try:
+            active = remote(conf, self).get_active_configuration_set().id
+        except SDOPackage.NotAvailable:
+            active = ''
         with self._mutex:
-            self._conf = self.object.get_configuration()
+            if generation != self._conf_generation:
+                # Reset while fetching
+                return
+            self._conf = conf
             self._conf_sets = {}
-            for cs in self._conf.get_configuration_sets():
+            self._stale_conf_sets = {}
+            for cs in sets:
                 self._conf_sets[cs.id] = ConfigurationSet(self, cs, cs.description,
                         nvlist_to_dict(cs.configuration_data))
-            try:
-                self._active_conf_set = self._conf.get_active_configuration_set().id
-            except SDOPackage.NotAvailable:
-                self._active_conf_set = ''
+                self._bump_conf_version(cs.id)
+            self._active_conf_set = active
 
     def _parse_profile(self):
-        # Parse the component's profile
+        # Parse the component's profile. The profile is fetched before taking
+        # the lock, which is only held to install it.
+        profile = remote(self._obj, self).get_component_profile()
+        if profile.parent:
+            parent_obj = remote(
+                    profile.parent, self).get_component_profile().instance_name
+        else:
+            parent_obj = ''
+        properties = nvlist_to_shared_dict(profile.properties,
+                self._UNSHARED_PROPERTIES)
         with self._mutex:
-            profile = self._obj.get_component_profile()
             self._instance_name = profile.instance_name
             self._type_name = profile.type_name
             self._description = profile.description
             self._version = profile.version
             self._vendor = profile.vendor
             self._category = profile.category
-            if profile.parent:
-                self._parent_obj = \
-                        profile.parent.get_component_profile().instance_name
-            else:
-                self._parent_obj = ''
-            self._properties = nvlist_to_dict(profile.properties)
+            self._parent_obj = parent_obj
+            self._properties = properties
 
     def _port_event(self, port_name, event):
         def get_port_obj(port_name):
-            for p_obj in self._obj.get_ports():
-                prof = p_obj.get_port_profile()
+            for p_obj in remote(self._obj, self).get_ports():
+                prof = remote(p_obj, self).get_port_profile()
                 if prof.name == port_name:
                     return p_obj
             raise ValueError(port_name)
 
+        ports = self._ports.peek()
+        if ports and event == self.PORT_ADD:
+            # Fetch the new port before taking the lock
+            new_port = parse_port(get_port_obj(port_name), self)
         with self._mutex:
-            if self._ports:
+            if ports:
+                # Search the cached list, as reading self.ports while holding
+                # the lock would wait for any fetch of the ports in progress
+                p = None
+                for port in ports:
+                    if port.name == port_name:
+                        p = port
+                        break
                 if event == self.PORT_ADD:
                     # New port
-                    p_obj = get_port_obj(port_name)
-                    self._ports.append(parse_port(p_obj, self))
+                    ports.append(new_port)
                 elif event == self.PORT_REMOVE:
                     # Port removed
-                    p = self.get_port_by_name(port_name)
-                    self._ports.remove(p)
+                    ports.remove(p)
                 elif event == self.PORT_CONNECT:
                     # A port has a new connection
-                    p = self.get_port_by_name(port_name)
                     p.reparse_connections()
                 elif event == self.PORT_DISCONNECT:
                     # A port has had a connection removed
-                    p = self.get_port_by_name(port_name)
                     p.reparse_connections()
         # Call callbacks outside the mutex
         self._call_cb('port_event', (port_name, event))
@@ -1134,9 +1310,73 @@ class Component(TreeNode):
         # Call callbacks outside the mutex
         self._call_cb('component_profile', items)
 
+    def _refresh_conf_sets(self, generation):
+        # Fetch the configuration sets marked as stale by observer events.
+        # Each stale set is fetched whole, so it is reloaded whole, even if
+        # only some of its parameters were marked. The sets are fetched
+        # outside the lock. Sets removed by an
+        # observer event while they were being fetched stay removed.
+        with self._mutex:
+            stale = self._stale_conf_sets
+            self._stale_conf_sets = {}
+            conf = self._conf
+            removals = self._conf_removals
+        fetched = {}
+        try:
+            for name in stale:
+                try:
+                    fetched[name] = remote(conf, self).get_configuration_set(
+                            name)
+                except (SDOPackage.InvalidParameter, SDOPackage.InternalError):
+                    # The set has been removed since it was marked (OpenRTM
+                    # raises InternalError for an unknown set)
+                    fetched[name] = None
+        except Exception:
+            # Mark the sets as stale again so the next read retries them
+            with self._mutex:
+                for name, params in stale.items():
+                    if self._conf_removed.get(name, 0) > removals:
+                        continue
+                    marked = self._stale_conf_sets.get(name, set())
+                    if params is None or marked is None:
+                        self._stale_conf_sets[name] = None
+                    else:
+                        self._stale_conf_sets[name] = marked | params
+            raise
+        with self._mutex:
+            if generation != self._conf_generation:
+                # Reset while fetching
+                return
+            for name in stale:
+                if self._conf_removed.get(name, 0) > removals:
+                    continue
+                cs = fetched[name]
+                if cs is None:
+                    if name in self._conf_sets:
+                        del self._conf_sets[name]
+                        self._bump_conf_version(name)
+                    continue
+                data = nvlist_to_dict(cs.configuration_data)
+                if name not in self._conf_sets:
+                    self._conf_sets[name] = ConfigurationSet(self, cs,
+                            cs.description, data)
+                else:
+                    # A new data dictionary, so callers holding the old one
+                    # are not affected
+                    self._conf_sets[name]._reload(cs, cs.description, data)
+                self._bump_conf_version(name)
+
+    def _remove_logger_service(self, id):
+        # Remove a logger service added by _add_logger_service.
+        conf = remote(self.object, self).get_configuration()
+        remote(conf, self).remove_service_profile(id.get_bytes())
+
     def _reset_conf_sets(self):
         with self._mutex:
+            self._conf_generation += 1
             self._conf_sets = None
+            self._stale_conf_sets = {}
+            self._conf_removed = {}
             self._active_conf_set = None
 
     def _reset_data(self):
@@ -1147,43 +1387,43 @@ class Component(TreeNode):
         self._reset_composite()
 
     def _reset_owned_ecs(self):
-        with self._mutex:
-            self._owned_ecs = None
-            self._owned_ec_states = None
+        self._owned_ecs.reset()
+        self._owned_ec_states.reset()
 
     def _reset_owned_ec_states(self):
-        with self._mutex:
-            self._owned_ec_states = None
+        self._owned_ec_states.reset()
 
     def _reset_participating_ecs(self):
-        with self._mutex:
-            self._participating_ecs = None
-            self._participating_ec_states = None
+        self._participating_ecs.reset()
+        self._participating_ec_states.reset()
 
     def _reset_participating_ec_states(self):
-        with self._mutex:
-            self._participating_ec_states = None
+        self._participating_ec_states.reset()
 
     def _reset_ports(self):
-        with self._mutex:
-            self._ports = None
+        self._ports.reset()
 
     def _reset_composite(self):
-        with self._mutex:
-            self._orgs = []
-            self._parent_orgs = []
-            self._members = {}
+        self._orgs.reset()
+        self._parent_orgs.reset()
+        self._members.reset()
+
+    def _set_heartbeat_monitor(self, monitor):
+        # Set the monitor to notify when a heartbeat is received
+        self._hb_monitor = monitor
 
     def _set_state_in_ec(self, ec_handle, state):
-        # Forcefully set the state of this component in an EC
+        # Forcefully set the state of this component in an EC. The states
+        # are fetched first if they have not been.
+        if ec_handle >= len(self.owned_ecs):
+            ec_handle -= len(self.owned_ecs)
+            if ec_handle >= len(self.participating_ecs):
+                raise BadECIndexError(ec_handle)
+            states = self.participating_ec_states
+        else:
+            states = self.owned_ec_states
         with self._mutex:
-            if ec_handle >= len(self.owned_ecs):
-                ec_handle -= len(self.owned_ecs)
-                if ec_handle >= len(self.participating_ecs):
-                    raise BadECIndexError(ec_handle)
-                self.participating_ec_states[ec_handle] = state
-            else:
-                self.owned_ec_states[ec_handle] = state
+            states[ec_handle] = state
         # Call callbacks outside the mutex
         self._call_cb('rtc_status', (ec_handle, state))
 
@@ -1231,6 +1471,18 @@ class Component(TreeNode):
     # Constant for configuration set event 'activate_set'
     CFG_ACTIVATE_SET = 36
 
+    ## Profile properties that differ between instances of a component type,
+    ## kept out of the properties shared by identical components.
+    _UNSHARED_PROPERTIES = ['instance_name', 'naming.names']
+
+
+def _get_sdo_id(owner, node):
+    # Get the SDO ID of the owner of an organisation, or '' if it has none.
+    if not owner:
+        return ''
+    owner = remote(owner, node)._narrow(SDOPackage.SDO)
+    return remote(owner, node).get_sdo_id()
+
 
 # vim: tw=79
 
@@ -18,6 +18,7 @@ Object representing a configuration set.
 '''
 
 
+from rtctree.exceptions import NoSuchConfSetError, NoSuchConfParamError
 from rtctree.utils import dict_to_nvlist
 
 ##############################################################################
@@ -52,6 +53,18 @@ class ConfigurationSet(object):
         self.data[param] = value
         self._object.configuration_data = dict_to_nvlist(self.data)
 
+    def set_params(self, params):
+        '''Set several parameters in this configuration set at once.
+
+        This is equivalent to calling set_param for each parameter, but the
+        wrapped CORBA object is only rebuilt once.
+
+        @param params A dictionary of parameter names and their new values.
+
+        '''
+        self.data.update(params)
+        self._object.configuration_data = dict_to_nvlist(self.data)
+
     @property
     def data(self):
         '''Read-only access to the configuration set's parameters.'''
@@ -74,5 +87,107 @@ class ConfigurationSet(object):
         self._data = data
 
 
+##############################################################################
+## Configuration transaction object
+
+class ConfigurationTransaction(object):
+    '''A group of configuration parameter changes applied together.
+
+    Do not create this class directly. Use Component.conf_transaction().
+
+    Changes are staged locally by calling set() or update(), and are not
+    visible in the component's configuration sets until they are committed.
+    Committing uploads each changed configuration set to the component once,
+    no matter how many of its parameters were changed, and then optionally
+    activates a configuration set.
+
+    When used in a with statement, the transaction is committed at the end
+    of the block, unless the block raises an exception, in which case it is
+    discarded.
+
+    '''
+    def __init__(self, owner, activate=None, *args, **kwargs):
+        '''Constructor.
+
+        @param owner The Component the configuration sets belong to.
+        @param activate The name of a configuration set to activate after the
+                        changes are uploaded, or None.
+
+        '''
+        super(ConfigurationTransaction, self).__init__(*args, **kwargs)
+        self._owner = owner
+        self._activate = activate
+        self._staged = {}
+        self._done = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+    def abort(self):
+        '''Discard all staged changes.'''
+        self._staged = {}
+        self._done = True
+
+    def commit(self):
+        '''Upload the staged changes to the component.
+
+        @raises NoSuchConfSetError if the set to activate does not exist.
+
+        '''
+        if self._done:
+            return
+        self._owner._commit_conf_changes(self._staged, self._activate)
+        self._staged = {}
+        self._done = True
+
+    def set(self, set_name, param, value):
+        '''Stage a change to a parameter.
+
+        @param set_name The name of the configuration set the parameter is in.
+        @param param The name of the parameter.
+        @param value The new value for the parameter.
+        @raises NoSuchConfSetError, NoSuchConfParamError
+
+        '''
+        self.update(set_name, {param: value})
+
+    def update(self, set_name, params):
+        '''Stage changes to several parameters of a configuration set.
+
+        @param set_name The name of the configuration set the parameters are
+                        in.
+        @param params A dictionary of parameter names and their new values.
+        @raises NoSuchConfSetError, NoSuchConfParamError
+
+        '''
+        conf_sets = self._owner.conf_sets
+        if set_name not in conf_sets:
+            raise NoSuchConfSetError(set_name)
+        for param in params:
+            if not conf_sets[set_name].has_param(param):
+                raise NoSuchConfParamError(param)
+        self._staged.setdefault(set_name, {}).update(params)
+
+    @property
+    def activate(self):
+        '''The name of the configuration set to activate after committing.'''
+        return self._activate
+
+    @activate.setter
+    def activate(self, set_name):
+        self._activate = set_name
+
+    @property
+    def staged(self):
+        '''A dictionary of the staged changes, keyed by configuration set.'''
+        return dict([(k, v.copy()) for k, v in self._staged.items()])
+
+
 # vim: tw=79
 
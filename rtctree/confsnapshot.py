@@ -0,0 +1,260 @@
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''rtctree
+
+Copyright (C) 2009-2014
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Snapshots of the configuration of many components, and their comparison.
+
+'''
+
+
+from collections import namedtuple
+import json
+import SDOPackage
+import time
+
+from rtctree.instrument import remote
+from rtctree.utils import nvlist_to_dict, parallel_map
+
+
+##############################################################################
+## Snapshot difference record
+
+ConfigurationDifference = namedtuple('ConfigurationDifference',
+        'path set param old new')
+'''A single difference between two configuration snapshots.
+
+path is the full path of the component as a string, set is the name of the
+configuration set, param is the name of the parameter, and old and new are
+its values in the two snapshots. A value is None if the parameter is not
+present in that snapshot. A difference in the active configuration set is
+given with set and param both None, and the names of the active sets as old
+and new.
+
+'''
+
+
+##############################################################################
+## Configuration snapshot object
+
+class ConfigurationSnapshot(object):
+    '''The configuration of a group of components at one point in time.
+
+    Do not create this class directly. Use RTCTree.snapshot_configurations()
+    or ConfigurationSnapshot.load().
+
+    For each component, the snapshot holds the name of the active
+    configuration set and the parameters of every configuration set.
+    Components that could not be read when the snapshot was taken are listed
+    in the errors property instead.
+
+    '''
+    def __init__(self, components=None, errors=None, timestamp=None, *args,
+            **kwargs):
+        '''Constructor.
+
+        @param components A dictionary of component paths (as strings) to
+                          tuples of the active configuration set name and a
+                          dictionary of configuration set names to
+                          dictionaries of parameters.
+        @param errors A dictionary of component paths to the error that
+                      prevented reading their configuration, as a string.
+        @param timestamp The time the snapshot was taken.
+
+        '''
+        super(ConfigurationSnapshot, self).__init__(*args, **kwargs)
+        self._components = components if components is not None else {}
+        self._errors = errors if errors is not None else {}
+        self._time = timestamp if timestamp is not None else time.time()
+
+    def __contains__(self, path):
+        return path in self._components
+
+    def __getitem__(self, path):
+        return self._components[path]
+
+    def __len__(self):
+        return len(self._components)
+
+    def active_set(self, path):
+        '''Get the name of the active configuration set of a component.'''
+        return self._components[path][0]
+
+    def conf_sets(self, path):
+        '''Get the configuration sets of a component.
+
+        @return A dictionary of configuration set names to dictionaries of
+                parameters.
+
+        '''
+        return self._components[path][1]
+
+    def diff(self, other):
+        '''Compare this snapshot with another.
+
+        Components present in only one snapshot are compared as if they had
+        no configuration sets in the other. Components that could not be read
+        in either snapshot are not compared.
+
+        @param other The ConfigurationSnapshot to compare with. Its values are
+                     given as the new values of the differences.
+        @return A list of ConfigurationDifference records, sorted by path,
+                set and parameter.
+
+        '''
+        result = []
+        paths = set(self._components) | set(other._components)
+        paths -= set(self._errors)
+        paths -= set(other._errors)
+        empty = (None, {})
+        for path in sorted(paths):
+            old_active, old_sets = self._components.get(path, empty)
+            new_active, new_sets = other._components.get(path, empty)
+            if old_active != new_active:
+                result.append(ConfigurationDifference(path, None, None,
+                    old_active, new_active))
+            if old_sets == new_sets:
+                continue
+            for set_name in sorted(set(old_sets) | set(new_sets)):
+                old = old_sets.get(set_name, {})
+                new = new_sets.get(set_name, {})
+                if old == new:
+                    continue
+                for param in sorted(set(old) | set(new)):
+                    old_value = old.get(param)
+                    new_value = new.get(param)
+                    if old_value != new_value:
+                        result.append(ConfigurationDifference(path, set_name,
+                            param, old_value, new_value))
+        return result
+
+    def diff_file(self, filename):
+        '''Compare this snapshot with a target configuration saved in a file.
+
+        @param filename The name of a file written by save().
+        @return A list of ConfigurationDifference records, with the values in
+                the file as the new values.
+
+        '''
+        return self.diff(ConfigurationSnapshot.load(filename))
+
+    @staticmethod
+    def load(filename):
+        '''Load a snapshot from a file written by save().
+
+        @raises ValueError if the file does not contain a snapshot.
+
+        '''
+        f = open(filename, 'r')
+        try:
+            data = json.load(f)
+        finally:
+            f.close()
+        if not isinstance(data, dict) or \
+                data.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(filename)
+        components = {}
+        for path, comp in data['components'].items():
+            components[path] = (comp['active'], comp['sets'])
+        return ConfigurationSnapshot(components, data.get('errors', {}),
+                data.get('time'))
+
+    def save(self, filename):
+        '''Save the snapshot to a file as JSON.
+
+        The file can be loaded with load(), and edited by hand to use as the
+        target of diff_file().
+
+        '''
+        components = {}
+        for path, (active, sets) in self._components.items():
+            components[path] = {'active': active, 'sets': sets}
+        f = open(filename, 'w')
+        try:
+            json.dump({'version': SNAPSHOT_VERSION, 'time': self._time,
+                'components': components, 'errors': self._errors}, f,
+                indent=1, sort_keys=True, default=str)
+        finally:
+            f.close()
+
+    @property
+    def errors(self):
+        '''A dictionary of the paths of components that could not be read and
+        the errors that occurred.
+
+        '''
+        return self._errors
+
+    @property
+    def paths(self):
+        '''The sorted list of paths of the components in the snapshot.'''
+        return sorted(self._components.keys())
+
+    @property
+    def time(self):
+        '''The time the snapshot was taken.'''
+        return self._time
+
+
+## Version of the snapshot file format
+SNAPSHOT_VERSION = 1
+
+
+##############################################################################
+## Snapshot creation
+
+def read_configuration(component):
+    '''Read the configuration of a component directly from the component.
+
+    The component node's cached configuration sets are neither used nor
+    updated. All configuration sets are read in a single call.
+
+    @param component The Component node.
+    @return A tuple of the active configuration set name and a dictionary of
+            configuration set names to dictionaries of parameters.
+
+    '''
+    conf = remote(component.object, component).get_configuration()
+    sets = {}
+    for cs in remote(conf, component).get_configuration_sets():
+        sets[cs.id] = nvlist_to_dict(cs.configuration_data)
+    try:
+        active = remote(conf, component).get_active_configuration_set().id
+    except SDOPackage.NotAvailable:
+        active = ''
+    return active, sets
+
+
+def take_snapshot(components, max_workers=8):
+    '''Read the configuration of a list of components concurrently.
+
+    @param components A list of Component nodes.
+    @param max_workers The maximum number of components to read at once.
+    @return A ConfigurationSnapshot.
+
+    '''
+    now = time.time()
+    results = parallel_map(read_configuration, components, max_workers)
+    snapshot = {}
+    errors = {}
+    for comp, (conf, error) in zip(components, results):
+        if error is not None:
+            errors[comp.full_path_str] = '{0}: {1}'.format(
+                    type(error).__name__, error)
+        else:
+            snapshot[comp.full_path_str] = conf
+    return ConfigurationSnapshot(snapshot, errors, now)
+
+
+# vim: tw=79
+
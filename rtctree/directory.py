@@ -20,17 +20,20 @@ Object representing a directory node in the tree.
 
 from copy import deepcopy
 import CosNaming
-from omniORB import URI, CORBA, TRANSIENT_ConnectFailed
+from omniORB import URI, CORBA, TRANSIENT_ConnectFailed, \
+        TRANSIENT_CallTimedout
 import sys
 
 from rtctree.component import Component
-from rtctree.exceptions import BadPathError
-from rtctree.manager import Manager
+from rtctree.exceptions import AlreadyBoundError, BadPathError
+from rtctree.instrument import Deadline, endpoint_host, remote
+from rtctree.manager import Manager, ManagerCrawl
 from rtctree.node import TreeNode
 from rtctree.options import Options
+from rtctree.pending import DiscoveryBudget, Pending, schedule_pending
 from rtctree.unknown import Unknown
 from rtctree.zombie import Zombie
-from rtctree.utils import filtered, trim_filter
+from rtctree.utils import filtered, parallel_map, trim_filter
 import RTC
 import RTM
 
@@ -53,18 +56,60 @@ class Directory(TreeNode):
         super(Directory, self).__init__(name=name, parent=parent,
                 children=children, filter=filter, *args, **kwargs)
 
-    def reparse(self):
+    def bind_many(self, objects, max_workers=8):
+        '''Bind many objects into the context represented by this directory.
+
+        The bind calls are made concurrently. Each object that is bound is
+        added to this directory's children. An object that cannot be
+        contacted after it has been bound is added as a zombie, or as a
+        pending node if its calls timed out, and is still reported as bound.
+
+        The names should be in the format used in paths. For example,
+        'manager.mgr' or 'ConsoleIn0.rtc'.
+
+        @param objects A dictionary of names to object references.
+        @param max_workers The maximum number of calls to make at once.
+        @return A dictionary of names to None if the name was bound, or the
+                exception raised if it was not (AlreadyBoundError if the name
+                was already bound).
+
+        '''
+        return self._bind_many(objects, False, max_workers)
+
+    def rebind_many(self, objects, max_workers=8):
+        '''Bind many objects into the context represented by this directory,
+        replacing any objects already bound to their names.
+
+        The rebind calls are made concurrently. Each object that is bound
+        replaces the child of the same name in this directory's children.
+
+        @param objects A dictionary of names to object references.
+        @param max_workers The maximum number of calls to make at once.
+        @return A dictionary of names to None if the name was bound, or the
+                exception raised if it was not.
+
+        '''
+        return self._bind_many(objects, True, max_workers)
+
+    def reparse(self, time_budget=None):
         '''Reparse all children of this directory.
 
         This effectively rebuilds the tree below this node.
 
         This operation takes an unbounded time to complete; if there are a lot
         of objects registered below this directory's context, they will all
-        need to be parsed.
+        need to be parsed. Give a time budget to limit it; objects not
+        resolved within the budget are added as pending nodes, and resolved
+        in the background.
+
+        @param time_budget The maximum time, in seconds, to spend parsing. If
+                           None, there is no limit.
 
         '''
+        budget = DiscoveryBudget(time_budget)
         self._remove_all_children()
-        self._parse_context(self._context, self.orb)
+        self._parse_context(self._context, self.orb, budget=budget)
+        schedule_pending(self.root, budget.pending)
 
     def unbind(self, name):
         '''Unbind an object from the context represented by this directory.
@@ -77,16 +122,34 @@ class Directory(TreeNode):
         'manager.mgr' or 'ConsoleIn0.rtc'.
 
         '''
-        with self._mutex:
-            id, sep, kind = name.rpartition('.')
-            if not id:
-                id = kind
-                kind = ''
-            name = CosNaming.NameComponent(id=str(id), kind=str(kind))
-            try:
-                self.context.unbind([name])
-            except CosNaming.NamingContext.NotFound:
-                raise BadPathError(name)
+        # The lock is not held during the call, so that several names can be
+        # unbound at once.
+        try:
+            remote(self.context, self).unbind(_string_to_corba_name(name))
+        except CosNaming.NamingContext.NotFound:
+            raise BadPathError(name)
+
+    def unbind_many(self, names, max_workers=8):
+        '''Unbind many objects from the context represented by this directory.
+
+        The unbind calls are made concurrently. Each name that is unbound is
+        removed from this directory's children.
+
+        Warning: this is a dangerous operation. See unbind().
+
+        @param names A list of names, in the format used in paths.
+        @param max_workers The maximum number of calls to make at once.
+        @return A dictionary of names to None if the name was unbound, or the
+                exception raised if it was not (BadPathError if the name was
+                not bound).
+
+        '''
+        def unbind(name):
+            self.unbind(name)
+            with self._mutex:
+                self._children.pop(name, None)
+        return _results(names, parallel_map(unbind, names,
+            max_workers=max_workers))
 
     @property
     def context(self):
@@ -99,96 +162,312 @@ class Directory(TreeNode):
         '''Is this node a directory?'''
         return True
 
-    def _parse_context(self, context, orb, filter=[]):
+    def _parse_context(self, context, orb, filter=[], budget=None):
         with self._mutex:
             # Parse a naming context to fill in the children.
             self._context = context
             # Get the list of bindings from the context
-            bindings, bindings_it = context.list(Options().\
+            bindings, bindings_it = remote(context, self).list(Options().\
                                         get_option('max_bindings'))
             for binding in bindings:
                 # Process the bindings that are within max_bindings
-                self._process_binding(binding, orb, filter)
+                self._process_binding(binding, orb, filter, budget)
             if bindings_it:
                 # Handle the iterator containing the remaining bindings
-                remaining, bindings = bindings_it.next_n(Options().\
-                                            get_option('max_bindings'))
+                remaining, bindings = remote(bindings_it, self).next_n(
+                        Options().get_option('max_bindings'))
                 while remaining:
                     for binding in bindings:
-                        self._process_binding(binding, orb, filter)
-                    remaining, binding = bindings_it.next_n(Options().\
-                                                get_option('max_bindings'))
-                bindings_it.destroy()
+                        self._process_binding(binding, orb, filter, budget)
+                    remaining, bindings = remote(bindings_it, self).next_n(
+                            Options().get_option('max_bindings'))
+                remote(bindings_it, self).destroy()
 
-    def _process_binding(self, binding, orb, filter):
+    def _process_binding(self, binding, orb, filter, budget=None):
         if filtered([corba_name_to_string(binding.binding_name)], filter):
             # Do not pass anything which does not pass the filter
             return
-        trimmed_filter = trim_filter(deepcopy(filter))
+        if budget is None:
+            self._resolve_binding(binding, orb, filter, None)
+            return
+        if budget.expired:
+            self._add_pending(binding, filter, budget,
+                    'discovery time budget exhausted')
+            return
+        try:
+            with Deadline(at=budget.deadline):
+                self._resolve_binding(binding, orb, filter, budget)
+        except CORBA.TRANSIENT as e:
+            if e.args[0] != TRANSIENT_CallTimedout:
+                raise
+            self._add_pending(binding, filter, budget, 'call timed out')
+
+    def _add_pending(self, binding, filter, budget, reason):
+        # Add a pending node in place of an object that was not resolved
         with self._mutex:
-            # Process a binding, creating the correct child type for it and
-            # adding that child to this node's children.
-            if binding.binding_type == CosNaming.nobject:
-                # This is a leaf node; either a component or a manager.  The
-                # specific type can be determined from the binding name kind.
-                if binding.binding_name[0].kind == 'mgr':
-                    name = corba_name_to_string(binding.binding_name)
-                    obj = self._context.resolve(binding.binding_name)
-                    if not obj:
-                        leaf = Zombie(name, self)
-                        return
-                    obj = obj._narrow(RTM.Manager)
-                    try:
-                        leaf = Manager(name, self, obj, dynamic=self.dynamic)
-                    except CORBA.OBJECT_NOT_EXIST:
-                        # Manager zombie
-                        leaf = Zombie(name, self)
-                    except CORBA.TRANSIENT:
-                        # Manager zombie
-                        leaf = Zombie(name, self)
-                    self._add_child(leaf)
-                elif binding.binding_name[0].kind == 'rtc':
-                    name = corba_name_to_string(binding.binding_name)
-                    obj = self._context.resolve(binding.binding_name)
-                    try:
-                        obj = obj._narrow(RTC.RTObject)
-                    except CORBA.TRANSIENT as e:
-                        if e.args[0] == TRANSIENT_ConnectFailed:
-                            self._add_child(Zombie(name, self))
-                            return
-                        else:
-                            raise
-                    except CORBA.OBJECT_NOT_EXIST:
-                        self._add_child(Zombie(name, self))
-                        return
-                    try:
-                        leaf = Component(name, self, obj, dynamic=self.dynamic)
-                    except CORBA.OBJECT_NOT_EXIST:
-                        # Component zombie
-                        leaf = Zombie(name, self, dynamic=self.dynamic)
-                    except CORBA.TRANSIENT as e:
-                        if e.args[0] == TRANSIENT_ConnectFailed:
-                            self._add_child(Zombie(name, self))
-                            return
-                        else:
-                            raise
-                    self._add_child(leaf)
-                else:
-                    # Unknown type - add a plain node
-                    name = corba_name_to_string(binding.binding_name)
-                    obj = self._context.resolve(binding.binding_name)
-                    leaf = Unknown(name, self, obj)
-                    self._add_child(leaf)
+            node = Pending(corba_name_to_string(binding.binding_name), self,
+                    binding, filter=filter, reason=reason)
+            self._add_child(node)
+        budget._add_pending(node)
+
+    def _add_object(self, binding_name, obj, budget=None):
+        # Create the correct child type for an object bound in this
+        # directory's context, and add that child to this node's children.
+        # The directory's lock is only needed to add the child, so that
+        # objects bound by bind_many() can be contacted concurrently.
+        leaf = self._make_object_node(binding_name, obj, budget)
+        if leaf is not None:
+            self._add_child(leaf)
+
+    def _make_object_node(self, binding_name, obj, budget=None):
+        # Create the correct node type for an object bound in this
+        # directory's context, without adding it to the children. The object
+        # is a component, a manager or an unknown object; the specific type
+        # can be determined from the binding name kind. No locks are taken.
+        name = corba_name_to_string(binding_name)
+        kind = binding_name[0].kind
+        if kind == 'mgr':
+            if not obj:
+                return None
+            if self._endpoint_unreachable(obj):
+                return Zombie(name, self)
+            obj = remote(obj, self)._narrow(RTM.Manager)
+            if budget is not None and budget.deadline is not None:
+                crawl = ManagerCrawl(time_budget=budget.remaining)
+                crawl._visit(obj)
             else:
-                # This is a context, and therefore a subdirectory.
-                subdir_name = corba_name_to_string(binding.binding_name)
-                subdir = Directory(subdir_name, self, filter=trimmed_filter,
+                crawl = None
+            try:
+                return Manager(name, self, obj, crawl=crawl,
                         dynamic=self.dynamic)
-                subdir_context = self._context.resolve(binding.binding_name)
-                subdir_context = subdir_context._narrow(CosNaming.NamingContext)
-                subdir._parse_context(subdir_context, orb,
-                        filter=trimmed_filter)
-                self._add_child(subdir)
+            except CORBA.OBJECT_NOT_EXIST:
+                # Manager zombie
+                return Zombie(name, self)
+            except CORBA.TRANSIENT as e:
+                if e.args[0] == TRANSIENT_CallTimedout:
+                    raise
+                if e.args[0] == TRANSIENT_ConnectFailed:
+                    self._mark_unreachable(obj)
+                # Manager zombie
+                return Zombie(name, self)
+        elif kind == 'rtc':
+            if self._endpoint_unreachable(obj):
+                return Zombie(name, self)
+            try:
+                obj = remote(obj, self)._narrow(RTC.RTObject)
+            except CORBA.TRANSIENT as e:
+                if e.args[0] == TRANSIENT_ConnectFailed:
+                    self._mark_unreachable(obj)
+                    return Zombie(name, self)
+                else:
+                    raise
+            except CORBA.OBJECT_NOT_EXIST:
+                return Zombie(name, self)
+            try:
+                return Component(name, self, obj, dynamic=self.dynamic)
+            except CORBA.OBJECT_NOT_EXIST:
+                # Component zombie
+                return Zombie(name, self, dynamic=self.dynamic)
+            except CORBA.TRANSIENT as e:
+                if e.args[0] == TRANSIENT_ConnectFailed:
+                    self._mark_unreachable(obj)
+                    return Zombie(name, self)
+                else:
+                    raise
+        else:
+            # Unknown type - add a plain node
+            return Unknown(name, self, obj)
+
+    def _bind_many(self, objects, rebind, max_workers):
+        context = self.context
+        names = list(objects.keys())
+        budget = DiscoveryBudget()
+
+        def bind(name):
+            corba_name = _string_to_corba_name(name)
+            obj = objects[name]
+            try:
+                if rebind:
+                    remote(context, self).rebind(corba_name, obj)
+                else:
+                    remote(context, self).bind(corba_name, obj)
+            except CosNaming.NamingContext.AlreadyBound:
+                raise AlreadyBoundError(name)
+            except CosNaming.NamingContext.NotFound:
+                raise BadPathError(name)
+            # The name is bound, so failing to contact the object only
+            # changes the node added for it, not the result
+            try:
+                self._add_object(corba_name, obj)
+            except CORBA.TRANSIENT as e:
+                if e.args[0] != TRANSIENT_CallTimedout:
+                    self._add_child(Zombie(name, self))
+                    return
+                binding = CosNaming.Binding(corba_name, CosNaming.nobject)
+                self._add_pending(binding, [], budget, 'call timed out')
+            except Exception:
+                self._add_child(Zombie(name, self))
+        results = parallel_map(bind, names, max_workers=max_workers)
+        schedule_pending(self.root, budget.pending)
+        return _results(names, results)
+
+    def _endpoint_unreachable(self, obj):
+        # Check if the endpoint of an object recently could not be connected
+        # to, in which case the object is not contacted.
+        unreachable = self._unreachable_endpoints()
+        if unreachable is None or endpoint_host(obj) not in unreachable:
+            return False
+        unreachable._count_skipped()
+        return True
+
+    def _mark_unreachable(self, obj):
+        # Remember that the endpoint of an object could not be connected to
+        unreachable = self._unreachable_endpoints()
+        if unreachable is not None:
+            unreachable.add(endpoint_host(obj))
+
+    def _unreachable_endpoints(self):
+        # Get the negative cache of the tree. The root is found without taking
+        # the parents' locks, which may be held by threads waiting for this
+        # directory's lock.
+        node = self
+        while node._parent is not None:
+            node = node._parent
+        return node._unreachable
+
+    def _resolve_binding(self, binding, orb, filter, budget):
+        with self._mutex:
+            # Process a binding, creating the correct child type for it and
+            # adding that child to this node's children.
+            node = self._make_binding_node(binding, orb, filter, budget)
+            if node is not None:
+                self._add_child(node)
+
+    def _make_binding_node(self, binding, orb, filter, budget):
+        # Create the correct node type for a binding in this directory's
+        # context, without adding it to the children. No locks are held
+        # during the remote calls.
+        if binding.binding_type == CosNaming.nobject:
+            obj = remote(self.context, self).resolve(binding.binding_name)
+            return self._make_object_node(binding.binding_name, obj, budget)
+        # This is a context, and therefore a subdirectory.
+        trimmed_filter = trim_filter(deepcopy(filter))
+        subdir_name = corba_name_to_string(binding.binding_name)
+        subdir = Directory(subdir_name, self, filter=trimmed_filter,
+                dynamic=self.dynamic)
+        subdir_context = remote(self.context, self).resolve(
+                binding.binding_name)
+        subdir_context = remote(subdir_context, self)._narrow(
+                CosNaming.NamingContext)
+        subdir._parse_context(subdir_context, orb, filter=trimmed_filter,
+                budget=budget)
+        return subdir
+
+    def _probe(self, name):
+        # Check if the object bound to a name in this directory's context can
+        # be reached. Returns a tuple of whether it is alive and the object
+        # reference probed (None if the name is no longer bound). The object
+        # is contacted without the host policy, so that a circuit opened by
+        # slow calls is not taken as the object being dead.
+        obj = self._bound_object(name)
+        if not obj:
+            return False, None
+        try:
+            return not remote(obj, self, use_policy=False)._non_existent(), \
+                    obj
+        except CORBA.TRANSIENT as e:
+            if e.args[0] == TRANSIENT_ConnectFailed:
+                return False, obj
+            raise
+        except CORBA.OBJECT_NOT_EXIST:
+            return False, obj
+
+    def _bound_object(self, name):
+        # Get the object bound to a name in this directory's context, or None
+        # if the name is not bound.
+        try:
+            return remote(self.context, self).resolve(
+                    _string_to_corba_name(name))
+        except CosNaming.NamingContext.NotFound:
+            return None
+
+    def _remove_zombie(self, zombie):
+        # Remove a zombie child, unless it has been replaced.
+        with self._mutex:
+            if self._children.get(zombie.name) is zombie:
+                del self._children[zombie.name]
+
+    def _revive_zombie(self, zombie):
+        # Replace a zombie child whose object can be reached again with the
+        # correct type of node. Returns True if it was replaced. The object is
+        # resolved and its node built without holding the lock, which is only
+        # taken to swap the new node in.
+        with self._mutex:
+            if self._children.get(zombie.name) is not zombie:
+                return False
+        binding_name = _string_to_corba_name(zombie.name)
+        obj = remote(self.context, self).resolve(binding_name)
+        leaf = self._make_object_node(binding_name, obj)
+        if leaf is None or leaf.is_zombie:
+            return False
+        with self._mutex:
+            if self._children.get(zombie.name) is not zombie:
+                # Removed or replaced while the object was being contacted
+                return False
+            self._children[zombie.name] = leaf
+        return True
+
+    def _retry_pending(self, node, budget):
+        # Try again to resolve a pending child. Returns True if it was
+        # resolved. As with _revive_zombie(), the object is resolved and its
+        # node built without holding the lock, which is only taken to swap
+        # the new node in.
+        with self._mutex:
+            if self._children.get(node.name) is not node:
+                # Removed or replaced since it was added
+                return False
+        binding = node.binding
+        if filtered([corba_name_to_string(binding.binding_name)],
+                node._filter):
+            # Filtered out this time; leave it as it was
+            return False
+        try:
+            with Deadline(at=budget.deadline):
+                new_node = self._make_binding_node(binding, self.orb,
+                        node._filter, budget)
+        except CORBA.TRANSIENT as e:
+            if e.args[0] != TRANSIENT_CallTimedout:
+                raise
+            new_node = Pending(node.name, self, binding, filter=node._filter,
+                    reason='call timed out', attempts=node.attempts + 1)
+        if new_node is None:
+            # Nothing to replace it with; leave it as it was
+            return False
+        with self._mutex:
+            if self._children.get(node.name) is not node:
+                # Removed or replaced while the object was being contacted
+                return False
+            self._children[node.name] = new_node
+        if new_node.is_pending:
+            budget._add_pending(new_node)
+            return False
+        return True
+
+
+def _results(names, results):
+    # Convert the results of parallel_map into a dictionary of names to the
+    # exception raised for each, or None.
+    return dict((name, error) for name, (result, error) in zip(names, results))
+
+
+def _string_to_corba_name(name):
+    # Convert a name in the format used in paths, such as 'ConsoleIn0.rtc',
+    # to a CosNaming.Name.
+    id, sep, kind = name.rpartition('.')
+    if not id:
+        id = kind
+        kind = ''
+    return [CosNaming.NameComponent(id=str(id), kind=str(kind))]
 
 
 def corba_name_to_string(name):
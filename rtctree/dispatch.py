@@ -0,0 +1,225 @@
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''rtctree
+
+Copyright (C) 2009-2014
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Delivery of node events to registered callbacks.
+
+'''
+
+
+from collections import deque
+import sys
+import threading
+import time
+import traceback
+
+
+##############################################################################
+## Callback worker object
+
+class CallbackWorker(object):
+    '''A thread that calls callbacks on behalf of the thread raising events.
+
+    Calls are queued and made in order by the worker's thread. If the queue
+    is full when a call is queued, the oldest queued call is discarded, so a
+    slow callback loses old events rather than holding up the thread raising
+    them.
+
+    A worker may be shared by several subscribers by passing it as the
+    executor argument of TreeNode.add_callback. Shared workers must be
+    stopped by their creator.
+
+    '''
+    def __init__(self, max_queue=100, name='rtctree-callback-worker', *args,
+            **kwargs):
+        '''Constructor.
+
+        @param max_queue The maximum number of calls to queue.
+        @param name The name of the worker's thread.
+
+        '''
+        super(CallbackWorker, self).__init__(*args, **kwargs)
+        self._queue = deque()
+        self._max_queue = max_queue
+        self._cond = threading.Condition(threading.Lock())
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, wait=True):
+        '''Stop the worker.
+
+        Calls that are already queued are made before the thread exits.
+
+        @param wait If True, wait for the thread to exit.
+
+        '''
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if wait and threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    @property
+    def queue_length(self):
+        '''The number of calls waiting to be made.'''
+        with self._cond:
+            return len(self._queue)
+
+    def _put(self, sub, node, value, queued):
+        # Queue a call. Returns the subscriber whose call was discarded to make
+        # room, if any.
+        dropped = None
+        with self._cond:
+            if self._stopped:
+                return sub
+            if len(self._queue) >= self._max_queue:
+                dropped = self._queue.popleft()[0]
+            self._queue.append((sub, node, value, queued))
+            self._cond.notify()
+        return dropped
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopped:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                sub, node, value, queued = self._queue.popleft()
+            sub._call(node, value, queued)
+
+
+##############################################################################
+## Subscriber object
+
+class Subscriber(object):
+    '''A callback registered for an event on a node.
+
+    Do not create this class directly. Use TreeNode.add_callback.
+
+    The subscriber keeps statistics about the calls made to its callback.
+    The latency of a call is the time from the event being raised to the
+    callback returning, so it includes any time spent waiting in a worker's
+    queue.
+
+    '''
+    def __init__(self, cb, args=None, executor=None, own_executor=False,
+            *args_, **kwargs):
+        '''Constructor.
+
+        @param cb The callback function.
+        @param args The value to pass as the callback's cb_args argument.
+        @param executor A CallbackWorker to make calls in, or None to call the
+                        callback directly in the thread raising the event.
+        @param own_executor If True, the executor is stopped when this
+                            subscriber is removed.
+
+        '''
+        super(Subscriber, self).__init__(*args_, **kwargs)
+        self._cb = cb
+        self._args = args
+        self._executor = executor
+        self._own_executor = own_executor
+        self._mutex = threading.Lock()
+        self._calls = 0
+        self._errors = 0
+        self._dropped = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+
+    def dispatch(self, node, value):
+        '''Deliver an event to the callback.'''
+        now = time.time()
+        if self._executor:
+            dropped = self._executor._put(self, node, value, now)
+            if dropped:
+                dropped._count_drop()
+        else:
+            self._call(node, value, now)
+
+    @property
+    def args(self):
+        '''The value passed to the callback as cb_args.'''
+        return self._args
+
+    @property
+    def callback(self):
+        '''The callback function.'''
+        return self._cb
+
+    @property
+    def executor(self):
+        '''The CallbackWorker the callback is called in, or None.'''
+        return self._executor
+
+    @property
+    def stats(self):
+        '''A dictionary of statistics about calls to the callback.
+
+        The keys are 'calls', 'errors', 'dropped', 'queued' (the number of
+        calls waiting in the executor's queue, shared by all subscribers of
+        the executor), 'mean_latency' and 'max_latency'. Latencies are in
+        seconds.
+
+        '''
+        with self._mutex:
+            if self._calls:
+                mean = self._total_latency / self._calls
+            else:
+                mean = 0.0
+            result = {'calls': self._calls, 'errors': self._errors,
+                    'dropped': self._dropped, 'mean_latency': mean,
+                    'max_latency': self._max_latency}
+        if self._executor:
+            result['queued'] = self._executor.queue_length
+        else:
+            result['queued'] = 0
+        return result
+
+    def _call(self, node, value, queued):
+        error = False
+        try:
+            self._cb(node, value, self._args)
+        except Exception:
+            error = True
+            if not self._executor:
+                raise
+            # Do not let one bad callback kill a worker shared with others
+            traceback.print_exc(file=sys.stderr)
+        finally:
+            # Counted before an inline callback's exception propagates
+            latency = time.time() - queued
+            with self._mutex:
+                self._calls += 1
+                if error:
+                    self._errors += 1
+                self._total_latency += latency
+                if latency > self._max_latency:
+                    self._max_latency = latency
+
+    def _count_drop(self):
+        with self._mutex:
+            self._dropped += 1
+
+    def _release(self):
+        # Called when the subscriber is removed from its node, or the node is
+        # discarded from the tree.
+        if self._own_executor:
+            self._executor.stop(wait=False)
+
+
+# vim: tw=79
+
@@ -0,0 +1,357 @@
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''rtctree
+
+Copyright (C) 2009-2014
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Tracking of the endpoints (host and port) that remote calls are sent to, and
+limits on the calls made to each.
+
+'''
+
+
+from collections import namedtuple
+from omniORB import CORBA, TRANSIENT_CallTimedout, TRANSIENT_ConnectFailed
+import threading
+import time
+
+from rtctree.instrument import UNKNOWN_HOST, current_deadline
+
+
+##############################################################################
+## Unreachable endpoints object
+
+class UnreachableEndpoints(object):
+    '''A negative cache of the endpoints that could not be connected to.
+
+    When an object cannot be reached because the connection to its endpoint
+    failed, the endpoint is remembered for a short time. During discovery,
+    other objects whose references point at a remembered endpoint are added
+    as zombies straight away, rather than each costing another failed
+    connection attempt.
+
+    Do not create this class directly. It is created by RTCTree; see the
+    unreachable_ttl argument.
+
+    '''
+    def __init__(self, ttl=10.0, *args, **kwargs):
+        '''Constructor.
+
+        @param ttl The time, in seconds, that an endpoint is remembered for
+                   after a connection to it failed.
+
+        '''
+        super(UnreachableEndpoints, self).__init__(*args, **kwargs)
+        self._mutex = threading.Lock()
+        self._ttl = ttl
+        # Endpoint -> expiry time
+        self._endpoints = {}
+        self._skipped = 0
+
+    def __contains__(self, endpoint):
+        with self._mutex:
+            expiry = self._endpoints.get(endpoint)
+            if expiry is None:
+                return False
+            if expiry <= time.time():
+                del self._endpoints[endpoint]
+                return False
+            return True
+
+    def add(self, endpoint):
+        '''Remember that an endpoint could not be connected to.
+
+        @param endpoint The endpoint, as given by
+                        rtctree.instrument.endpoint_host().
+
+        '''
+        if endpoint == UNKNOWN_HOST:
+            # Objects with unknown endpoints may be on any host
+            return
+        with self._mutex:
+            self._endpoints[endpoint] = time.time() + self._ttl
+
+    def clear(self):
+        '''Forget all the endpoints.'''
+        with self._mutex:
+            self._endpoints = {}
+
+    @property
+    def endpoints(self):
+        '''The endpoints currently remembered, with the time in seconds until
+        each is forgotten.
+
+        '''
+        now = time.time()
+        with self._mutex:
+            return dict((e, expiry - now) \
+                    for e, expiry in self._endpoints.items() if expiry > now)
+
+    @property
+    def skipped(self):
+        '''The number of objects added as zombies without being contacted
+        because their endpoint was unreachable.
+
+        '''
+        with self._mutex:
+            return self._skipped
+
+    @property
+    def ttl(self):
+        '''The time, in seconds, that an endpoint is remembered for.'''
+        return self._ttl
+
+    def _count_skipped(self):
+        with self._mutex:
+            self._skipped += 1
+
+
+##############################################################################
+## Host policy object
+
+## The statistics of the calls made to one endpoint through a host policy.
+##
+## state is the state of the endpoint's circuit breaker (CLOSED, OPEN or
+## HALF_OPEN). in_flight is the number of calls being made. calls is the
+## number of calls admitted, and errors the number of those that raised
+## CORBA.TRANSIENT. rejected is the number of calls refused because the
+## circuit was open, and throttled the number of calls that had to wait for
+## the in-flight or rate limit. wait_time is the total time, in seconds, that
+## calls waited.
+HostStats = namedtuple('HostStats',
+        'host state in_flight calls errors rejected throttled wait_time')
+
+
+class HostPolicy(object):
+    '''Limits on the remote calls made by a tree to each endpoint.
+
+    Every remote call made by the nodes of a tree with a host policy (see
+    RTCTree.set_host_policy()) is admitted by the policy of its endpoint
+    (host and port), which can apply:
+
+    - an in-flight limit: the maximum number of calls made to the endpoint at
+      once. Further calls wait for a call to finish.
+    - a rate limit: a token bucket giving the sustained number of calls per
+      second, and the number of calls that can be made in a burst. Calls
+      wait for a token.
+    - a circuit breaker: after a number of consecutive calls raise
+      CORBA.TRANSIENT, the circuit opens and calls to the endpoint are
+      refused at once, raising CORBA.TRANSIENT with the minor code
+      TRANSIENT_ConnectFailed as if the host were down. After a delay, one
+      trial call is let through; the circuit closes again if it succeeds.
+
+    A call waits no longer than the current thread's deadline (see
+    rtctree.instrument.Deadline), after which it raises CORBA.TRANSIENT with
+    the minor code TRANSIENT_CallTimedout.
+
+    Calls to objects whose endpoint is not known are not limited.
+
+    '''
+    def __init__(self, max_in_flight=None, rate=None, burst=None,
+            failure_threshold=None, reset_timeout=30.0, hosts=None, *args,
+            **kwargs):
+        '''Constructor.
+
+        Each limit is None to not apply it.
+
+        @param max_in_flight The maximum number of calls made to an endpoint
+                             at once.
+        @param rate The maximum sustained number of calls per second made to
+                    an endpoint.
+        @param burst The number of calls that can be made to an endpoint at
+                     once before the rate limit applies. Defaults to the rate,
+                     or 1 if the rate is less than 1.
+        @param failure_threshold The number of consecutive calls raising
+                                 CORBA.TRANSIENT that open an endpoint's
+                                 circuit.
+        @param reset_timeout The time, in seconds, that a circuit stays open
+                             before a trial call is let through.
+        @param hosts A dictionary of endpoints (as given by
+                     rtctree.instrument.endpoint_host()) to dictionaries
+                     overriding the limits above for that endpoint, e.g.
+                     {'192.168.0.3:2809': {'rate': 5}}.
+
+        '''
+        super(HostPolicy, self).__init__(*args, **kwargs)
+        self._limits = {'max_in_flight': max_in_flight, 'rate': rate,
+                'burst': burst, 'failure_threshold': failure_threshold,
+                'reset_timeout': reset_timeout}
+        self._host_limits = dict(hosts or {})
+        self._cond = threading.Condition(threading.Lock())
+        self._hosts = {}
+
+    def reset(self, host=None):
+        '''Close the circuits and clear the statistics.
+
+        @param host The endpoint to reset. If None, all are reset.
+
+        '''
+        with self._cond:
+            if host is None:
+                self._hosts = dict((h, _HostState(s.limits)) \
+                        for h, s in self._hosts.items())
+            elif host in self._hosts:
+                self._hosts[host] = _HostState(self._hosts[host].limits)
+            self._cond.notify_all()
+
+    def state(self, host):
+        '''Get the state of the circuit breaker of an endpoint.
+
+        @param host The endpoint.
+        @return CLOSED, OPEN or HALF_OPEN.
+
+        '''
+        with self._cond:
+            s = self._hosts.get(host)
+            if s is None:
+                return self.CLOSED
+            return s.state(time.time())
+
+    def stats(self):
+        '''Get the statistics of the endpoints called so far.
+
+        @return A dictionary of endpoints to HostStats.
+
+        '''
+        now = time.time()
+        with self._cond:
+            return dict((h, HostStats(h, s.state(now), s.in_flight, s.calls,
+                    s.errors, s.rejected, s.throttled, s.wait_time)) \
+                    for h, s in self._hosts.items())
+
+    def _acquire(self, host):
+        # Wait until a call to an endpoint can be made, or raise
+        # CORBA.TRANSIENT if it cannot.
+        if host == UNKNOWN_HOST:
+            return
+        deadline = current_deadline()
+        start = time.time()
+        waited = False
+        with self._cond:
+            s = self._host(host)
+            while True:
+                now = time.time()
+                state = s.state(now)
+                if state == self.OPEN or (state == self.HALF_OPEN and s.trial):
+                    s.rejected += 1
+                    raise CORBA.TRANSIENT(TRANSIENT_ConnectFailed,
+                            CORBA.COMPLETED_NO)
+                wait = s.admit(now)
+                if wait == 0:
+                    break
+                if deadline is not None:
+                    if now >= deadline:
+                        raise CORBA.TRANSIENT(TRANSIENT_CallTimedout,
+                                CORBA.COMPLETED_NO)
+                    if wait is None or deadline - now < wait:
+                        wait = deadline - now
+                waited = True
+                self._cond.wait(wait)
+            if state == self.HALF_OPEN:
+                # This call is the trial of the circuit
+                s.trial = True
+            s.in_flight += 1
+            s.calls += 1
+            if waited:
+                s.throttled += 1
+                s.wait_time += time.time() - start
+
+    def _host(self, host):
+        s = self._hosts.get(host)
+        if s is None:
+            limits = dict(self._limits)
+            limits.update(self._host_limits.get(host, {}))
+            s = self._hosts[host] = _HostState(limits)
+        return s
+
+    def _release(self, host, error):
+        # Record the end of a call admitted by _acquire(). A call interrupted
+        # by an exception that is not an Exception (e.g. KeyboardInterrupt)
+        # frees its slot without changing the state of the circuit.
+        if host == UNKNOWN_HOST:
+            return
+        with self._cond:
+            s = self._hosts.get(host)
+            if s is None:
+                # Reset during the call
+                return
+            s.in_flight = max(s.in_flight - 1, 0)
+            if isinstance(error, CORBA.TRANSIENT):
+                s.errors += 1
+                s.failures += 1
+                threshold = s.limits['failure_threshold']
+                if s.trial or (threshold and s.failures >= threshold):
+                    s.opened = time.time()
+            elif error is None or isinstance(error, Exception):
+                # The endpoint answered
+                s.failures = 0
+                s.opened = None
+            s.trial = False
+            self._cond.notify_all()
+
+    ## Circuit breaker state: calls are made
+    CLOSED = 'closed'
+    ## Circuit breaker state: calls are refused
+    OPEN = 'open'
+    ## Circuit breaker state: one trial call is made
+    HALF_OPEN = 'half_open'
+
+
+class _HostState(object):
+    # The limits and state of one endpoint of a HostPolicy. Only used with
+    # the policy's lock held.
+    def __init__(self, limits):
+        self.limits = limits
+        self.in_flight = 0
+        rate = limits['rate']
+        burst = limits['burst']
+        if burst is None and rate is not None:
+            burst = max(rate, 1)
+        self.burst = burst
+        self.tokens = burst
+        self.refilled = time.time()
+        self.failures = 0
+        self.opened = None
+        self.trial = False
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+        self.throttled = 0
+        self.wait_time = 0.0
+
+    def admit(self, now):
+        # Take a token and return 0 if a call can be made now, or return the
+        # time to wait (None to wait for a call to finish).
+        max_in_flight = self.limits['max_in_flight']
+        if max_in_flight is not None and self.in_flight >= max_in_flight:
+            return None
+        rate = self.limits['rate']
+        if rate is None:
+            return 0
+        self.tokens = min(self.burst,
+                self.tokens + (now - self.refilled) * rate)
+        self.refilled = now
+        if self.tokens < 1:
+            return (1 - self.tokens) / rate
+        self.tokens -= 1
+        return 0
+
+    def state(self, now):
+        if self.opened is None:
+            return HostPolicy.CLOSED
+        if now - self.opened < self.limits['reset_timeout']:
+            return HostPolicy.OPEN
+        return HostPolicy.HALF_OPEN
+
+
+# vim: tw=79
+
@@ -0,0 +1,315 @@
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''rtctree
+
+Copyright (C) 2009-2014
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+A single stream of the events raised by all nodes in a tree.
+
+'''
+
+
+from collections import deque, namedtuple
+import threading
+import time
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+
+##############################################################################
+## Event record
+
+Event = namedtuple('Event', 'node path event value time')
+'''A single event raised by a node.
+
+node is the node that raised the event, path is that node's full path as a
+string, event is the name of the event (e.g. 'rtc_status'), value is the
+value the node's callbacks receive, and time is the time the event was
+raised.
+
+'''
+
+
+##############################################################################
+## Event stream object
+
+class EventStream(object):
+    '''A filtered, bounded stream of the events raised by the nodes in a tree.
+
+    Do not create this class directly. Use RTCTree.events().
+
+    Events are buffered until read. The stream can be read by calling get(),
+    by iterating over it in a normal for loop (which blocks until an event
+    arrives and ends when the stream is closed), or by iterating over it in
+    an asyncio 'async for' loop. An 'async for' loop waits for events on
+    the event loop itself, without occupying a thread, so leaving the loop
+    early consumes no further events.
+
+    The buffer holds at most maxsize events. What happens when an event
+    arrives and the buffer is full is decided by the stream's policy:
+
+    - DROP_OLDEST: the oldest buffered event is discarded.
+    - DROP_NEWEST: the arriving event is discarded.
+    - COALESCE: if an event of the same type from the same node is already
+      buffered, its value is replaced by the new one (keeping its place in
+      the buffer). Otherwise, the oldest buffered event is discarded.
+    - BLOCK: the node raising the event waits until space is available. This
+      stalls the thread delivering the event (usually an ORB thread serving
+      an observer), so it should only be used when the stream is read
+      promptly.
+
+    The number of events discarded and coalesced is available from the
+    dropped and coalesced properties.
+
+    '''
+    def __init__(self, root, events=None, paths=None, filter=None,
+            maxsize=1000, policy=None, *args, **kwargs):
+        '''Constructor.
+
+        @param root The root node of the tree to receive events from.
+        @param events A list of the event names to receive. If None,
+                      DEFAULT_EVENTS is used.
+        @param paths A list of paths (each a list of strings). If given, only
+                     events from nodes at or below one of these paths will be
+                     received.
+        @param filter A function called with each Event. If it returns False,
+                      the event is not received.
+        @param maxsize The maximum number of events to buffer.
+        @param policy The policy to apply when the buffer is full.
+
+        '''
+        super(EventStream, self).__init__(*args, **kwargs)
+        if events is None:
+            events = self.DEFAULT_EVENTS
+        if policy is None:
+            policy = self.DROP_OLDEST
+        if policy not in [self.DROP_OLDEST, self.DROP_NEWEST, self.COALESCE,
+                self.BLOCK]:
+            raise ValueError(policy)
+        self._root = root
+        self._events = frozenset(events)
+        self._paths = [tuple(p) for p in paths] if paths else []
+        self._filter = filter
+        self._maxsize = maxsize
+        self._policy = policy
+        self._buffer = deque()
+        self._pending = {}
+        self._cond = threading.Condition(threading.Lock())
+        self._closed = False
+        # (event loop, future) of each 'async for' step waiting for an event
+        self._waiters = []
+        self._dropped = 0
+        self._coalesced = 0
+        self._root._add_listener(self._on_event)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        event = self.get()
+        if event is None:
+            raise StopIteration
+        return event
+
+    next = __next__
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        # Take a buffered event if there is one. Otherwise the returned future
+        # is completed on the event loop when an event arrives, so no thread
+        # is blocked waiting for it.
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._complete_waiter(loop, future)
+        return future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        '''Stop receiving events.
+
+        Events already buffered can still be read. Once the buffer is empty,
+        iteration ends and get() returns None.
+
+        '''
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._root._rem_listener(self._on_event)
+        self._wake_waiters()
+
+    def get(self, block=True, timeout=None):
+        '''Get the next event from the stream.
+
+        @param block If False, return immediately if no event is buffered.
+        @param timeout The maximum time to wait for an event, in seconds.
+        @return The next Event, or None if no event arrived in time or the
+                stream is closed and empty.
+
+        '''
+        with self._cond:
+            if block:
+                if timeout is not None:
+                    end = time.time() + timeout
+                while not self._buffer and not self._closed:
+                    if timeout is None:
+                        self._cond.wait()
+                    else:
+                        remaining = end - time.time()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+            if not self._buffer:
+                return None
+            event = self._buffer.popleft()
+            if self._policy == self.COALESCE:
+                # The buffer holds keys; the latest event is held separately
+                event = self._pending.pop(event)
+            self._cond.notify_all()
+            return event
+
+    @property
+    def closed(self):
+        '''Has the stream been closed?'''
+        with self._cond:
+            return self._closed
+
+    @property
+    def coalesced(self):
+        '''The number of events merged into an already-buffered event.'''
+        with self._cond:
+            return self._coalesced
+
+    @property
+    def dropped(self):
+        '''The number of events discarded because the buffer was full.'''
+        with self._cond:
+            return self._dropped
+
+    @property
+    def policy(self):
+        '''The policy applied when the buffer is full.'''
+        return self._policy
+
+    def _complete_waiter(self, loop, future):
+        # Complete the future of an 'async for' step with the next event, or
+        # end the iteration if the stream is closed and empty. If there is no
+        # event yet, wait for one. Runs in the event loop's thread.
+        if future.done():
+            # Cancelled; leave any event for the next reader
+            return
+        event = self.get(block=False)
+        if event is not None:
+            future.set_result(event)
+            return
+        with self._cond:
+            if not self._closed:
+                self._waiters.append((loop, future))
+                return
+        future.set_exception(StopAsyncIteration())
+
+    def _wake_waiters(self):
+        # Have the waiting 'async for' steps check the stream again, in their
+        # event loops.
+        with self._cond:
+            waiters = self._waiters
+            self._waiters = []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(self._complete_waiter, loop,
+                        future)
+            except RuntimeError:
+                # The event loop has been closed
+                pass
+
+    def _on_event(self, node, event, value):
+        # Called by nodes in the tree when they raise an event.
+        if event not in self._events:
+            return
+        path = node.full_path
+        if self._paths:
+            for p in self._paths:
+                if tuple(path[:len(p)]) == p:
+                    break
+            else:
+                return
+        if path[0] == '/' and len(path) > 1:
+            path_str = '/' + '/'.join(path[1:])
+        else:
+            path_str = '/'.join(path)
+        ev = Event(node, path_str, event, value, time.time())
+        if self._filter and not self._filter(ev):
+            return
+        with self._cond:
+            if self._closed:
+                return
+            if self._policy == self.COALESCE:
+                # In this mode the buffer holds (node, event) keys in arrival
+                # order, and the latest event for each key is kept in
+                # _pending, so replacing a buffered event does not move it.
+                key = (node, event)
+                if key in self._pending:
+                    self._pending[key] = ev
+                    self._coalesced += 1
+                    return
+            if len(self._buffer) >= self._maxsize:
+                if self._policy == self.DROP_NEWEST:
+                    self._dropped += 1
+                    return
+                elif self._policy == self.BLOCK:
+                    while len(self._buffer) >= self._maxsize and \
+                            not self._closed:
+                        self._cond.wait()
+                    if self._closed:
+                        return
+                else:
+                    old = self._buffer.popleft()
+                    if self._policy == self.COALESCE:
+                        del self._pending[old]
+                    self._dropped += 1
+            if self._policy == self.COALESCE:
+                self._pending[key] = ev
+                self._buffer.append(key)
+            else:
+                self._buffer.append(ev)
+            self._cond.notify_all()
+            waiting = bool(self._waiters)
+        if waiting:
+            self._wake_waiters()
+
+    ## The events received if no list of events is given.
+    DEFAULT_EVENTS = ['rtc_status', 'ec_event', 'port_event', 'config_event',
+            'heartbeat']
+
+    ## Discard the oldest buffered event when the buffer is full.
+    DROP_OLDEST = 'drop_oldest'
+    ## Discard the arriving event when the buffer is full.
+    DROP_NEWEST = 'drop_newest'
+    ## Merge events of the same type from the same node.
+    COALESCE = 'coalesce'
+    ## Make the node raising the event wait for space in the buffer.
+    BLOCK = 'block'
+
+
+# vim: tw=79
+
@@ -287,5 +287,11 @@ class NotCORBANameError(RtcTreeError):
         return 'Not a CORBA CosNaming.Name: {0}'.format(self.args[0])
 
 
+class AlreadyBoundError(RtcTreeError):
+    '''A name is already bound in a naming context.'''
+    def __str__(self):
+        return 'Name already bound: {0}'.format(self.args[0])
+
+
 # vim: tw=79
 
@@ -0,0 +1,212 @@
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''rtctree
+
+Copyright (C) 2009-2014
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Tree-level monitor of component heartbeats.
+
+'''
+
+
+import threading
+import time
+
+
+##############################################################################
+## Heartbeat monitor object
+
+class HeartbeatMonitor(object):
+    '''Watches the heartbeats of many components at once.
+
+    Each watched component is placed in a timer wheel slot according to the
+    time its next heartbeat is due. Receiving a heartbeat moves the component
+    to a new slot, which costs the same no matter how many components are
+    being watched. A single background thread advances the wheel and, when a
+    component's deadline passes without a heartbeat, raises one
+    "heartbeat_missed" event for it. The component is then left out of the
+    wheel until it beats again, so a silent component does not produce a
+    stream of repeated events.
+
+    Only dynamic components send heartbeats; watching a component that is not
+    dynamic will result in a missed heartbeat event once the timeout expires.
+
+    '''
+    def __init__(self, interval=1.0, tolerance=2.5, resolution=0.1, cb=None,
+            cb_args=None, *args, **kwargs):
+        '''Constructor.
+
+        @param interval The expected heartbeat interval of the components, in
+                        seconds.
+        @param tolerance The number of intervals that may pass without a
+                         heartbeat before the heartbeat is considered missed.
+        @param resolution The granularity of the timer wheel, in seconds.
+                          Missed heartbeats are detected at most this long
+                          after their deadline.
+        @param cb A function to call when a heartbeat is missed, in addition
+                  to the watched component's heartbeat_missed event. It should
+                  be of the format 'def cb(node, last_heartbeat, cb_args)'.
+        @param cb_args The value to pass as cb_args to @ref cb.
+
+        '''
+        super(HeartbeatMonitor, self).__init__(*args, **kwargs)
+        self._mutex = threading.RLock()
+        self._timeout = interval * tolerance
+        self._resolution = resolution
+        # The wheel must span more than one timeout so that a deadline never
+        # wraps around onto a slot that has not yet been processed.
+        self._num_slots = int(self._timeout / resolution) + 2
+        self._slots = [set() for ii in range(self._num_slots)]
+        self._deadlines = {}
+        self._last_beats = {}
+        self._missed = set()
+        self._cb = cb
+        self._cb_args = cb_args
+        self._tick = self._to_tick(time.time())
+        self._stop_flag = threading.Event()
+        self._thread = None
+
+    def start(self):
+        '''Start the background thread that detects missed heartbeats.'''
+        with self._mutex:
+            if self._thread:
+                return
+            self._stop_flag.clear()
+            self._tick = self._to_tick(time.time())
+            self._thread = threading.Thread(target=self._run,
+                    name='rtctree-heartbeat-monitor')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        '''Stop the background thread.
+
+        Watched components remain watched and will be checked again if the
+        monitor is restarted.
+
+        '''
+        with self._mutex:
+            thread = self._thread
+            self._thread = None
+        if thread:
+            self._stop_flag.set()
+            thread.join()
+
+    def watch(self, node):
+        '''Start watching the heartbeat of a component node.
+
+        The component is assumed to be alive at the time it is watched.
+
+        '''
+        with self._mutex:
+            node._set_heartbeat_monitor(self)
+            self._schedule(node, time.time())
+
+    def unwatch(self, node):
+        '''Stop watching the heartbeat of a component node.'''
+        with self._mutex:
+            node._set_heartbeat_monitor(None)
+            self._unschedule(node)
+            self._last_beats.pop(node, None)
+            self._missed.discard(node)
+
+    def beat(self, node, beat_time):
+        '''Record a heartbeat received from a watched component.
+
+        This is called by the component when its observer receives a
+        heartbeat.
+
+        '''
+        with self._mutex:
+            if node not in self._last_beats:
+                # Not watched (or unwatched while the beat was in flight)
+                return
+            self._missed.discard(node)
+            self._schedule(node, beat_time)
+
+    @property
+    def missed(self):
+        '''The list of watched components that have missed a heartbeat and not
+        yet recovered.
+
+        '''
+        with self._mutex:
+            return list(self._missed)
+
+    @property
+    def running(self):
+        '''Is the background thread running?'''
+        with self._mutex:
+            return self._thread is not None
+
+    @property
+    def timeout(self):
+        '''The time, in seconds, that may pass without a heartbeat.'''
+        return self._timeout
+
+    @property
+    def watched(self):
+        '''The list of components being watched.'''
+        with self._mutex:
+            return list(self._last_beats.keys())
+
+    def _check(self, now):
+        # Advance the wheel to the current time, collecting every component
+        # whose deadline has passed.
+        expired = []
+        with self._mutex:
+            now_tick = self._to_tick(now)
+            # If the thread was delayed by more than a full revolution, every
+            # slot needs to be checked exactly once.
+            first = max(self._tick, now_tick - self._num_slots + 1)
+            for tick in range(first, now_tick + 1):
+                slot = self._slots[tick % self._num_slots]
+                for node in list(slot):
+                    if self._deadlines[node] <= now:
+                        slot.discard(node)
+                        del self._deadlines[node]
+                        self._missed.add(node)
+                        expired.append((node, self._last_beats[node]))
+            self._tick = now_tick
+        # Call callbacks outside the mutex
+        for node, last in expired:
+            node._heartbeat_missed(last)
+            if self._cb:
+                self._cb(node, last, self._cb_args)
+        return expired
+
+    def _run(self):
+        while not self._stop_flag.wait(self._resolution):
+            self._check(time.time())
+            if self._stop_flag.is_set():
+                break
+
+    def _schedule(self, node, beat_time):
+        # Place a node in the slot for its next deadline.
+        self._unschedule(node)
+        deadline = beat_time + self._timeout
+        self._last_beats[node] = beat_time
+        self._deadlines[node] = deadline
+        self._slots[self._to_tick(deadline) % self._num_slots].add(node)
+
+    def _to_tick(self, t):
+        return int(t / self._resolution)
+
+    def _unschedule(self, node):
+        deadline = self._deadlines.pop(node, None)
+        if deadline is not None:
+            self._slots[self._to_tick(deadline) % self._num_slots].discard(
+                    node)
+
+
+# vim: tw=79
+
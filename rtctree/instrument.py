@@ -0,0 +1,944 @@
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''rtctree
+
+Copyright (C) 2009-2014
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Instrumentation of the remote calls made by the tree.
+
+Every remote operation called by the node objects is made through remote(),
+e.g. remote(self._obj, self).get_ports(). When instrumentation is disabled
+(the default), remote() returns the object it is given and costs one function
+call. When it is enabled, remote() returns a wrapper that times each call and
+passes it, with any exception raised, the target host and the node the call
+was made for, to the sinks that have been added. The host is read from the
+object reference's IIOP profile.
+
+The sinks are a CallRecorder collecting statistics by operation and host,
+CallTrace recording the exact sequence of calls with the path of the node
+each was made for, and SlowCallLog flagging calls that take longer than a
+threshold. Sinks receive the calls of the whole process, since object
+references are shared between trees using the same ORB.
+
+remote() also gives each object reference the call timeout of the node's tree
+(once, rather than before every call), applies the deadline of the calling
+thread (see Deadline), and passes calls through the host policy of the node's
+tree (see rtctree.endpoints.HostPolicy).
+
+The locks of the nodes, ports and execution contexts are TimedLock objects.
+While call statistics are enabled, the time each lock is held for is also
+recorded by the CallRecorder (see CallRecorder.lock_stats()).
+
+'''
+
+
+from __future__ import print_function
+
+from bisect import bisect_left
+from collections import deque, namedtuple
+import binascii
+import json
+import math
+import omniORB
+from omniORB import CORBA, TRANSIENT_CallTimedout
+import os.path
+import struct
+import sys
+import threading
+import time
+import weakref
+
+
+##############################################################################
+## Statistics
+
+## Upper bounds, in seconds, of the buckets of the latency histograms
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+        1.0, 2.5, 5.0, 10.0, float('inf'))
+
+
+## Statistics of an operation on a host.
+##
+## count is the number of calls and errors is a dictionary of the number of
+## calls that raised each type of exception, by name. total and max are the
+## total and longest call times, in seconds. buckets is a list of the number
+## of calls in each bucket of LATENCY_BUCKETS (not cumulative).
+OperationStats = namedtuple('OperationStats',
+        'op host count errors total max buckets')
+
+
+## Statistics of the holds of a type of lock.
+##
+## lock is the name of the lock (the type of object it belongs to). count is
+## the number of times it was held, total and max the total and longest hold
+## times, in seconds, and buckets the number of holds in each bucket of
+## LATENCY_BUCKETS (not cumulative).
+LockStats = namedtuple('LockStats', 'lock count total max buckets')
+
+
+class CallRecorder(object):
+    '''Records the time taken by remote calls and the errors they raise.
+
+    Do not create this class directly. Use enable().
+
+    '''
+    def __init__(self, *args, **kwargs):
+        super(CallRecorder, self).__init__(*args, **kwargs)
+        self._mutex = threading.Lock()
+        self._ops = {}
+        self._locks = {}
+        self._start = time.time()
+
+    def record(self, op, host, elapsed, error=None, node=None, start=None):
+        '''Record a call.
+
+        @param op The name of the operation called.
+        @param host The host the call was made to.
+        @param elapsed The time taken by the call, in seconds.
+        @param error The name of the exception raised by the call, or None.
+        @param node The node the call was made for. Not used.
+        @param start The time the call started. Not used.
+
+        '''
+        key = (op, host)
+        bucket = bisect_left(LATENCY_BUCKETS, elapsed)
+        with self._mutex:
+            entry = self._ops.get(key)
+            if entry is None:
+                # count, total, max, errors, buckets
+                entry = [0, 0.0, 0.0, {}, [0] * len(LATENCY_BUCKETS)]
+                self._ops[key] = entry
+            entry[0] += 1
+            entry[1] += elapsed
+            if elapsed > entry[2]:
+                entry[2] = elapsed
+            if error is not None:
+                entry[3][error] = entry[3].get(error, 0) + 1
+            entry[4][bucket] += 1
+
+    def record_lock(self, lock, elapsed):
+        '''Record the hold of a lock.
+
+        @param lock The name of the lock.
+        @param elapsed The time the lock was held for, in seconds.
+
+        '''
+        bucket = bisect_left(LATENCY_BUCKETS, elapsed)
+        with self._mutex:
+            entry = self._locks.get(lock)
+            if entry is None:
+                # count, total, max, buckets
+                entry = [0, 0.0, 0.0, [0] * len(LATENCY_BUCKETS)]
+                self._locks[lock] = entry
+            entry[0] += 1
+            entry[1] += elapsed
+            if elapsed > entry[2]:
+                entry[2] = elapsed
+            entry[3][bucket] += 1
+
+    def reset(self):
+        '''Discard all recorded calls and lock holds.'''
+        with self._mutex:
+            self._ops = {}
+            self._locks = {}
+            self._start = time.time()
+
+    def lock_stats(self):
+        '''Get the statistics of the recorded lock holds.
+
+        @return A dictionary of LockStats, keyed by lock name.
+
+        '''
+        with self._mutex:
+            return dict((k, LockStats(k, e[0], e[1], e[2], list(e[3]))) \
+                    for k, e in self._locks.items())
+
+    def stats(self):
+        '''Get the statistics of the recorded calls.
+
+        @return A dictionary of OperationStats, keyed by (operation, host).
+
+        '''
+        with self._mutex:
+            return dict((k, OperationStats(k[0], k[1], e[0], dict(e[3]),
+                e[1], e[2], list(e[4]))) for k, e in self._ops.items())
+
+    @property
+    def start_time(self):
+        '''The time recording started or was last reset.'''
+        with self._mutex:
+            return self._start
+
+
+def merge_stats(stats, by):
+    '''Combine the statistics of the operations on each host.
+
+    @param stats A dictionary of OperationStats, as returned by
+                 CallRecorder.stats().
+    @param by 'op' to combine the statistics of each operation over all
+              hosts, or 'host' to combine those of each host over all
+              operations. The field not combined by is None in the result.
+    @return A dictionary of OperationStats, keyed by operation or host.
+    @raises ValueError if by is not 'op' or 'host'.
+
+    '''
+    if by not in ('op', 'host'):
+        raise ValueError(by)
+    result = {}
+    for s in stats.values():
+        key = getattr(s, by)
+        old = result.get(key)
+        if old is None:
+            errors = dict(s.errors)
+            result[key] = s._replace(errors=errors,
+                    **{'host' if by == 'op' else 'op': None})
+            continue
+        errors = old.errors
+        for e, c in s.errors.items():
+            errors[e] = errors.get(e, 0) + c
+        result[key] = old._replace(count=old.count + s.count,
+                total=old.total + s.total, max=max(old.max, s.max),
+                buckets=[a + b for a, b in zip(old.buckets, s.buckets)])
+    return result
+
+
+##############################################################################
+## Chokepoint for remote calls
+
+# The objects receiving each remote call, set by add_sink()
+_sinks = ()
+# The CallRecorder added by enable(), or None
+_recorder = None
+_sinks_mutex = threading.Lock()
+
+
+def remote(obj, node=None, use_policy=True):
+    '''Get the object to make a remote call on.
+
+    All remote calls made by the tree go through this function, e.g.
+    remote(self._obj, self).get_ports().
+
+    @param obj A CORBA object reference.
+    @param node The node (or port) the call is made for, which is used to
+                give the node path of the call in traces and to find the call
+                timeout and host policy of the node's tree.
+    @param use_policy If False, the call is not passed through the host
+                      policy, e.g. for probes that must reach the endpoint
+                      even while its circuit is open.
+    @return The object reference itself, or a wrapper that passes the call
+            to the sinks if any have been added, and through the tree's host
+            policy if it has one.
+    @raises CORBA.TRANSIENT if the current thread's deadline has passed.
+
+    '''
+    policy = None
+    if _use_timeouts or _use_policies:
+        root = _root_node(node)
+        if _use_timeouts:
+            _apply_timeouts(obj, root)
+        if _use_policies and use_policy:
+            # The host policy is set on the root node
+            policy = getattr(root, '_host_policy', None)
+    sinks = _sinks
+    if not sinks and policy is None:
+        return obj
+    return _Instrumented(obj, node, sinks, policy)
+
+
+class _Instrumented(object):
+    '''Wrapper around an object reference that records the calls made on it,
+    and admits them through a host policy.
+
+    Wrappers are made for a single call and must not be stored or passed as
+    arguments to other remote calls.
+
+    '''
+    __slots__ = ('_obj', '_node', '_sinks', '_policy')
+
+    def __init__(self, obj, node, sinks, policy=None):
+        self._obj = obj
+        self._node = node
+        self._sinks = sinks
+        self._policy = policy
+
+    def __getattr__(self, name):
+        method = getattr(self._obj, name)
+        if not callable(method):
+            return method
+        obj = self._obj
+        node = self._node
+        sinks = self._sinks
+        policy = self._policy
+
+        def call(*args, **kwargs):
+            host = endpoint_host(obj)
+            if policy is not None:
+                policy._acquire(host)
+            start = time.time()
+            try:
+                result = method(*args, **kwargs)
+            except BaseException as e:
+                # Including KeyboardInterrupt and SystemExit, so that the
+                # call's slot in the host policy is always released
+                elapsed = time.time() - start
+                if policy is not None:
+                    policy._release(host, e)
+                for s in sinks:
+                    s.record(name, host, elapsed, type(e).__name__, node,
+                            start)
+                raise
+            elapsed = time.time() - start
+            if policy is not None:
+                policy._release(host, None)
+            for s in sinks:
+                s.record(name, host, elapsed, None, node, start)
+            return result
+        return call
+
+
+def add_sink(sink):
+    '''Add an object to receive every remote call.
+
+    The sink's record(op, host, elapsed, error, node, start) method is called
+    after each call, in the thread that made it, with the name of the
+    operation, the host called, the time taken in seconds, the name of the
+    exception raised (or None), the node the call was made for (or None) and
+    the time the call started.
+
+    @param sink The object to add.
+
+    '''
+    global _sinks
+    with _sinks_mutex:
+        if sink not in _sinks:
+            _sinks = _sinks + (sink,)
+
+
+def remove_sink(sink):
+    '''Stop an object receiving remote calls.
+
+    Has no effect if the object was not added.
+
+    @param sink The object to remove.
+
+    '''
+    global _sinks
+    with _sinks_mutex:
+        _sinks = tuple(s for s in _sinks if s is not sink)
+
+
+def enable():
+    '''Enable the recording of statistics of remote calls.
+
+    Has no effect if it is already enabled.
+
+    @return The CallRecorder recording calls.
+
+    '''
+    global _recorder
+    with _sinks_mutex:
+        recorder = _recorder
+        if recorder is None:
+            recorder = _recorder = CallRecorder()
+    add_sink(recorder)
+    return recorder
+
+
+def disable():
+    '''Disable the recording of statistics of remote calls.
+
+    Recorded statistics are discarded.
+
+    '''
+    global _recorder
+    with _sinks_mutex:
+        recorder = _recorder
+        _recorder = None
+    if recorder is not None:
+        remove_sink(recorder)
+
+
+def recorder():
+    '''Get the CallRecorder recording calls, or None if disabled.'''
+    return _recorder
+
+
+def node_path(node):
+    '''Get the path of the node a call was made for, as a string.
+
+    No locks are taken, so this is safe to call from a thread building part
+    of the tree while the thread building its parent waits for it.
+
+    @param node A tree node, or an object with an _owner attribute that is a
+                tree node, such as a port. May be None.
+    @return The full path of the node, or an empty string if there is none.
+
+    '''
+    node = _tree_node(node)
+    names = []
+    while node is not None:
+        names.append(node._name)
+        node = node._parent
+    if not names:
+        return ''
+    names.reverse()
+    path = '/'.join(names)
+    if names[0] == '/':
+        # The root's name is the separator
+        path = path[1:] or '/'
+    return path
+
+
+def _root_node(node):
+    # Get the root of the tree a node, port or connection is in, without
+    # taking any locks
+    node = _tree_node(node)
+    while node is not None and node._parent is not None:
+        node = node._parent
+    return node
+
+
+def _tree_node(node):
+    # Get the tree node a port or connection belongs to
+    while node is not None and not hasattr(node, '_parent'):
+        node = getattr(node, '_owner', None)
+    return node
+
+
+##############################################################################
+## Lock hold times
+
+class TimedLock(object):
+    '''A reentrant lock whose hold times are recorded while call statistics
+    are enabled.
+
+    Only the outermost hold of a thread is recorded. When statistics are
+    disabled, the lock costs one check more than a threading.RLock.
+
+    '''
+    __slots__ = ('_lock', '_name', '_depth', '_acquired', '_rec')
+
+    def __init__(self, name):
+        '''Constructor.
+
+        @param name The name the holds of the lock are recorded under,
+                    usually the type of the object it belongs to.
+
+        '''
+        self._lock = threading.RLock()
+        self._name = name
+        self._depth = 0
+        self._acquired = 0.0
+        self._rec = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+    def acquire(self, blocking=True):
+        '''Acquire the lock.
+
+        @param blocking If False, do not wait for the lock.
+        @return True if the lock was acquired.
+
+        '''
+        if not self._lock.acquire(blocking):
+            return False
+        self._depth += 1
+        if self._depth == 1:
+            rec = self._rec = _recorder
+            if rec is not None:
+                self._acquired = time.time()
+        return True
+
+    def release(self):
+        '''Release the lock.'''
+        self._depth -= 1
+        if self._depth or self._rec is None:
+            self._lock.release()
+            return
+        rec = self._rec
+        elapsed = time.time() - self._acquired
+        self._rec = None
+        self._lock.release()
+        rec.record_lock(self._name, elapsed)
+
+    @property
+    def name(self):
+        '''The name the holds of the lock are recorded under.'''
+        return self._name
+
+
+##############################################################################
+## Call timeouts and deadlines
+
+# Set once a call timeout or deadline has been used. From then on, remote()
+# checks the timeout of each object reference and the deadline of the thread.
+_use_timeouts = False
+# Holds the deadline of each thread, and whether the thread's omniORB call
+# timeout was set for it
+_local = threading.local()
+# The tree call timeout each object reference has been given
+_ref_timeouts = weakref.WeakKeyDictionary()
+_ref_timeouts_mutex = threading.Lock()
+
+
+class Deadline(object):
+    '''A limit on the time the remote calls made in a block of code may take.
+
+    A deadline is used as a context manager:
+
+        with Deadline(2.0):
+            ports = component.ports
+            state = component.state
+
+    Each remote call made by the thread in the body of the with statement is
+    given the time remaining until the deadline as the omniORB call timeout
+    of the thread, so the deadlines of different threads calling the same
+    object do not affect each other. A call that times out, or that is made
+    after the deadline has passed, raises CORBA.TRANSIENT with the minor code
+    TRANSIENT_CallTimedout. A deadline inside another can only shorten the
+    time available. Deadlines are passed on to the threads used by
+    rtctree.utils.parallel_map.
+
+    omniORB gives a timeout set on an object reference, such as the call
+    timeout of the tree, precedence over the timeout of the thread, so a call
+    on such a reference can run past the deadline by up to that timeout.
+
+    '''
+    def __init__(self, timeout=None, at=None, *args, **kwargs):
+        '''Constructor.
+
+        @param timeout The time, in seconds from now, that the calls may take.
+                       If None, the deadline is not limited (but an enclosing
+                       deadline still applies).
+        @param at The time the deadline passes, as returned by time.time().
+                  Overrides timeout.
+
+        '''
+        super(Deadline, self).__init__(*args, **kwargs)
+        if at is None and timeout is not None:
+            at = time.time() + timeout
+        self._at = at
+        self._saved = None
+
+    def __enter__(self):
+        self._saved = current_deadline()
+        at = self._at
+        if self._saved is not None and (at is None or self._saved < at):
+            at = self._saved
+        if at is not None:
+            use_timeouts()
+        _local.deadline = at
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.deadline = self._saved
+        if self._saved is None and getattr(_local, 'timed', False):
+            # Leave no timeout on the thread for calls made outside deadlines
+            omniORB.setClientThreadCallTimeout(0)
+            _local.timed = False
+        return False
+
+    @property
+    def expired(self):
+        '''Has the deadline passed?'''
+        return self._at is not None and time.time() >= self._at
+
+    @property
+    def remaining(self):
+        '''The time remaining until the deadline, in seconds, or None.'''
+        if self._at is None:
+            return None
+        return max(self._at - time.time(), 0.0)
+
+
+def current_deadline():
+    '''Get the deadline of the current thread.
+
+    @return The time the deadline passes, or None if there is none.
+
+    '''
+    return getattr(_local, 'deadline', None)
+
+
+def use_timeouts():
+    '''Start checking call timeouts and deadlines in remote().
+
+    This is done automatically when a deadline is entered, and by RTCTree
+    when a call timeout is set.
+
+    '''
+    global _use_timeouts
+    _use_timeouts = True
+
+
+def _apply_timeouts(obj, root):
+    # Give an object reference the call timeout of its tree and the thread
+    # the time left until its deadline
+    deadline = current_deadline()
+    if deadline is not None:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise CORBA.TRANSIENT(TRANSIENT_CallTimedout, CORBA.COMPLETED_NO)
+        omniORB.setClientThreadCallTimeout(_to_millis(remaining))
+        _local.timed = True
+    if isinstance(obj, CORBA.Object):
+        # The call timeout is set on the root node
+        _set_ref_timeout(obj, getattr(root, '_call_timeout', None))
+
+
+def _set_ref_timeout(obj, timeout):
+    # Set the call timeout of an object reference, unless it already has it.
+    # References the tree has not given a timeout are left unchanged, so the
+    # timeouts an application sets on its own references are kept while the
+    # tree has none.
+    try:
+        with _ref_timeouts_mutex:
+            current = _ref_timeouts.get(obj)
+            if current == timeout:
+                return
+            if timeout is None:
+                del _ref_timeouts[obj]
+            else:
+                _ref_timeouts[obj] = timeout
+    except TypeError:
+        # The reference cannot be remembered, so set it before every call
+        if timeout is None:
+            return
+    # A timeout of 0 removes the timeout the tree set earlier
+    omniORB.setClientCallTimeout(obj, _to_millis(timeout) if timeout else 0)
+
+
+def _to_millis(timeout):
+    # Convert a timeout in seconds to the milliseconds omniORB takes
+    return int(math.ceil(timeout * 1000))
+
+
+##############################################################################
+## Host policies
+
+# Set once a tree has been given a host policy (see rtctree.endpoints). From
+# then on, the policy of the tree is looked up for every call.
+_use_policies = False
+
+
+def use_policies():
+    '''Start passing remote calls through the host policies of their trees.
+
+    This is done automatically by RTCTree when a host policy is set.
+
+    '''
+    global _use_policies
+    _use_policies = True
+
+
+##############################################################################
+## Call traces
+
+## A remote call recorded in a trace.
+##
+## path is the full path of the node the call was made for (an empty string
+## if unknown), op the operation name and host the host called. start is the
+## time the call started and duration the time it took, in seconds. error is
+## the name of the exception raised, or None. thread is the name of the thread
+## that made the call.
+CallRecord = namedtuple('CallRecord',
+        'path op host start duration error thread')
+
+
+class CallTrace(object):
+    '''Records the sequence of remote calls made while it is running.
+
+    A trace can be used as a context manager, in which case it runs for the
+    body of the with statement:
+
+        with CallTrace() as trace:
+            tree = RTCTree(servers=['localhost'])
+        trace.save('discovery.json')
+
+    '''
+    def __init__(self, max_records=100000, *args, **kwargs):
+        '''Constructor.
+
+        @param max_records The maximum number of calls to keep. Once reached,
+                           the oldest calls are discarded.
+
+        '''
+        super(CallTrace, self).__init__(*args, **kwargs)
+        self._mutex = threading.Lock()
+        self._records = deque(maxlen=max_records)
+        self._dropped = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def clear(self):
+        '''Discard all recorded calls.'''
+        with self._mutex:
+            self._records.clear()
+            self._dropped = 0
+
+    def folded(self):
+        '''Get the trace as folded stacks, for rendering as a flame graph.
+
+        Each line is the node path and operation as a semicolon-separated
+        stack, followed by the total time in microseconds spent in that
+        operation on that node, e.g. '/;localhost;comp0.rtc;get_ports 1520'.
+        The output can be given to tools such as flamegraph.pl.
+
+        @return A list of lines.
+
+        '''
+        totals = {}
+        for r in self.records:
+            stack = [n for n in r.path.split('/') if n]
+            if r.path.startswith('/'):
+                stack.insert(0, '/')
+            key = ';'.join(stack + [r.op])
+            totals[key] = totals.get(key, 0) + r.duration
+        return ['{0} {1}'.format(k, int(v * 1e6)) \
+                for k, v in sorted(totals.items())]
+
+    def record(self, op, host, elapsed, error=None, node=None, start=None):
+        '''Record a call. Called by the instrumentation.'''
+        rec = CallRecord(node_path(node), op, host, start, elapsed, error,
+                threading.current_thread().name)
+        with self._mutex:
+            if len(self._records) == self._records.maxlen:
+                self._dropped += 1
+            self._records.append(rec)
+
+    def save(self, filename):
+        '''Save the trace as a timeline in the Trace Event format.
+
+        The file can be viewed in chrome://tracing or Perfetto. Each thread
+        making calls is shown as a separate track.
+
+        @param filename The name of the file to write.
+
+        '''
+        records = self.records
+        base = records[0].start if records else 0
+        threads = {}
+        events = []
+        for r in records:
+            tid = threads.setdefault(r.thread, len(threads) + 1)
+            args = {'path': r.path, 'host': r.host}
+            if r.error:
+                args['error'] = r.error
+            events.append({'name': r.op, 'cat': r.host, 'ph': 'X',
+                'ts': (r.start - base) * 1e6, 'dur': r.duration * 1e6,
+                'pid': 1, 'tid': tid, 'args': args})
+        for name, tid in threads.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1,
+                'tid': tid, 'args': {'name': name}})
+        f = open(filename, 'w')
+        try:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        finally:
+            f.close()
+
+    def start(self):
+        '''Start recording calls.'''
+        add_sink(self)
+
+    def stop(self):
+        '''Stop recording calls. The recorded calls are kept.'''
+        remove_sink(self)
+
+    @property
+    def dropped(self):
+        '''The number of calls discarded because the trace was full.'''
+        with self._mutex:
+            return self._dropped
+
+    @property
+    def records(self):
+        '''The recorded calls, as a list of CallRecord in the order they
+        finished.'''
+        with self._mutex:
+            return list(self._records)
+
+
+class SlowCallLog(object):
+    '''Records the remote calls that take longer than a threshold.
+
+    Like CallTrace, a log can be used as a context manager.
+
+    '''
+    def __init__(self, threshold, callback=None, max_records=1000, *args,
+            **kwargs):
+        '''Constructor.
+
+        @param threshold The time, in seconds, above which a call is slow.
+        @param callback A function to call with the CallRecord of each slow
+                        call, in the thread that made the call. If None, a
+                        warning giving the node path, operation and time is
+                        printed to stderr.
+        @param max_records The maximum number of slow calls to keep. Once
+                           reached, the oldest calls are discarded.
+
+        '''
+        super(SlowCallLog, self).__init__(*args, **kwargs)
+        self._threshold = threshold
+        self._callback = callback
+        self._mutex = threading.Lock()
+        self._records = deque(maxlen=max_records)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def record(self, op, host, elapsed, error=None, node=None, start=None):
+        '''Record a call if it is slow. Called by the instrumentation.'''
+        if elapsed <= self._threshold:
+            return
+        rec = CallRecord(node_path(node), op, host, start, elapsed, error,
+                threading.current_thread().name)
+        with self._mutex:
+            self._records.append(rec)
+        if self._callback:
+            self._callback(rec)
+        else:
+            print('{0}: Warning: slow call: {1} on {2} ({3}) took '\
+                    '{4:.1f} ms'.format(os.path.basename(sys.argv[0]), op,
+                        rec.path or '<unknown>', host, elapsed * 1000),
+                    file=sys.stderr)
+
+    def start(self):
+        '''Start logging slow calls.'''
+        add_sink(self)
+
+    def stop(self):
+        '''Stop logging slow calls. The logged calls are kept.'''
+        remove_sink(self)
+
+    @property
+    def records(self):
+        '''The slow calls, as a list of CallRecord.'''
+        with self._mutex:
+            return list(self._records)
+
+    @property
+    def threshold(self):
+        '''The time, in seconds, above which a call is slow.'''
+        return self._threshold
+
+
+##############################################################################
+## Host of an object reference
+
+# Object reference -> host, for references that can be weakly referenced
+_hosts = weakref.WeakKeyDictionary()
+
+## Host recorded for references without an IIOP profile
+UNKNOWN_HOST = 'unknown'
+
+
+def endpoint_host(obj):
+    '''Get the host that calls on an object reference are sent to.
+
+    The host is read from the first IIOP profile of the reference's IOR, and
+    cached for the life of the reference.
+
+    @param obj A CORBA object reference.
+    @return The host and port as a string (e.g. '192.168.0.3:2809'), or
+            UNKNOWN_HOST.
+
+    '''
+    try:
+        return _hosts[obj]
+    except (KeyError, TypeError):
+        pass
+    host = UNKNOWN_HOST
+    try:
+        if omniORB.orb is not None and obj is not None:
+            host = ior_host(omniORB.orb.object_to_string(obj)) or UNKNOWN_HOST
+    except Exception:
+        pass
+    try:
+        _hosts[obj] = host
+    except TypeError:
+        # Cannot be weakly referenced
+        pass
+    return host
+
+
+def ior_host(ior):
+    '''Get the host and port of the first IIOP profile in a stringified IOR.
+
+    @param ior An IOR string, 'IOR:' followed by hexadecimal digits.
+    @return The host and port as a string (e.g. '192.168.0.3:2809'), or None
+            if the IOR has no IIOP profile or cannot be decoded.
+
+    '''
+    if not ior.startswith('IOR:'):
+        return None
+    try:
+        data = binascii.unhexlify(ior[4:])
+        order = '<' if data[0:1] == b'\x01' else '>'
+        # Skip the type ID
+        offset = _align(1, 4)
+        length, = struct.unpack_from(order + 'I', data, offset)
+        offset = _align(offset + 4 + length, 4)
+        num_profiles, = struct.unpack_from(order + 'I', data, offset)
+        offset += 4
+        for ii in range(num_profiles):
+            offset = _align(offset, 4)
+            tag, length = struct.unpack_from(order + 'II', data, offset)
+            offset += 8
+            if tag == _TAG_INTERNET_IOP:
+                return _iiop_host(data[offset:offset + length])
+            offset += length
+    except (struct.error, TypeError, ValueError):
+        pass
+    return None
+
+
+# Profile tag of IIOP profiles
+_TAG_INTERNET_IOP = 0
+
+
+def _align(offset, boundary):
+    return (offset + boundary - 1) // boundary * boundary
+
+
+def _iiop_host(profile):
+    # Decode the host and port of an IIOP profile body, which is an
+    # encapsulation with its own byte order.
+    order = '<' if profile[0:1] == b'\x01' else '>'
+    # Byte order and IIOP version
+    offset = _align(3, 4)
+    length, = struct.unpack_from(order + 'I', profile, offset)
+    offset += 4
+    host = profile[offset:offset + length].rstrip(b'\x00').decode('ascii')
+    offset = _align(offset + length, 2)
+    port, = struct.unpack_from(order + 'H', profile, offset)
+    return '{0}:{1}'.format(host, port)
+
+
+# vim: tw=79
+
@@ -0,0 +1,254 @@
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''rtctree
+
+Copyright (C) 2009-2014
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Recording of observer notifications to a journal file, and their replay.
+
+A journal is an append-only binary file. It begins with a header of the magic
+bytes 'RTCJ' and a format version. The header is followed by records, each
+beginning with a single byte giving its type:
+
+- 'P' defines a node path: path ID (uint32) and path length (uint16),
+  followed by the UTF-8 path.
+- 'E' is a notification: time stamp (double), path ID (uint32), kind code
+  (uint8) and hint length (uint16), followed by the UTF-8 hint.
+
+Each path is written only once, the first time a notification for it is
+recorded. All values are little-endian.
+
+'''
+
+
+import struct
+import threading
+import time
+
+from rtctree.sdo import apply_status, parse_status
+
+
+##############################################################################
+## Journal format
+
+JOURNAL_MAGIC = b'RTCJ'
+JOURNAL_VERSION = 1
+
+_HEADER = struct.Struct('<4sH')
+_PATH = struct.Struct('<cIH')
+_EVENT = struct.Struct('<cdIBH')
+
+# Codes used to store notification kinds
+_KINDS = ['COMPONENT_PROFILE', 'RTC_STATUS', 'EC_STATUS', 'PORT_PROFILE',
+        'CONFIGURATION', 'HEARTBEAT']
+_KIND_CODES = dict((k, ii) for ii, k in enumerate(_KINDS))
+
+
+def _encode(s):
+    if isinstance(s, bytes):
+        return s
+    return s.encode('utf-8')
+
+
+def _decode(b):
+    if str is bytes:
+        # Python 2: keep plain strings so they match node names
+        return b
+    return b.decode('utf-8')
+
+
+##############################################################################
+## Journal writer object
+
+class EventJournal(object):
+    '''Records observer notifications to a journal file.
+
+    Do not create this class directly. Use RTCTree.record_events().
+
+    '''
+    def __init__(self, filename, *args, **kwargs):
+        '''Constructor.
+
+        @param filename The name of the journal file to create. An existing
+                        file will be overwritten.
+
+        '''
+        super(EventJournal, self).__init__(*args, **kwargs)
+        self._mutex = threading.Lock()
+        self._file = open(filename, 'wb')
+        self._file.write(_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION))
+        self._paths = {}
+        self._count = 0
+        self._filename = filename
+
+    def close(self):
+        '''Close the journal file.'''
+        with self._mutex:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def flush(self):
+        '''Flush recorded notifications to the journal file.'''
+        with self._mutex:
+            if self._file:
+                self._file.flush()
+
+    def record(self, path, kind, hint, timestamp=None):
+        '''Record a notification.
+
+        @param path The full path of the node the notification is for, as a
+                    string.
+        @param kind The kind of notification (e.g. 'RTC_STATUS').
+        @param hint The notification's hint string.
+        @param timestamp The time the notification was received. If None, the
+                         current time is used.
+
+        '''
+        if kind not in _KIND_CODES:
+            # Observers ignore kinds they do not know, so there is nothing
+            # to replay.
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        hint = _encode(hint)
+        with self._mutex:
+            if not self._file:
+                return
+            path_id = self._paths.get(path)
+            if path_id is None:
+                path_id = len(self._paths)
+                self._paths[path] = path_id
+                enc_path = _encode(path)
+                self._file.write(_PATH.pack(b'P', path_id, len(enc_path)))
+                self._file.write(enc_path)
+            self._file.write(_EVENT.pack(b'E', timestamp, path_id,
+                _KIND_CODES[kind], len(hint)))
+            self._file.write(hint)
+            self._count += 1
+
+    @property
+    def count(self):
+        '''The number of notifications recorded.'''
+        with self._mutex:
+            return self._count
+
+    @property
+    def filename(self):
+        '''The name of the journal file.'''
+        return self._filename
+
+
+##############################################################################
+## Journal reading and replay
+
+def read_journal(filename):
+    '''Read the notifications recorded in a journal file.
+
+    @param filename The name of the journal file.
+    @return A generator producing a (timestamp, path, kind, hint) tuple for
+            each notification, in the order they were recorded.
+    @raises ValueError if the file is not a journal.
+
+    '''
+    f = open(filename, 'rb')
+    try:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise ValueError(filename)
+        magic, version = _HEADER.unpack(header)
+        if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION:
+            raise ValueError(filename)
+        paths = {}
+        while True:
+            rec_type = f.read(1)
+            if not rec_type:
+                break
+            if rec_type == b'P':
+                data = f.read(_PATH.size - 1)
+                if len(data) < _PATH.size - 1:
+                    # Truncated final record, e.g. from a crash
+                    break
+                ignored, path_id, length = _PATH.unpack(rec_type + data)
+                paths[path_id] = _decode(f.read(length))
+            elif rec_type == b'E':
+                data = f.read(_EVENT.size - 1)
+                if len(data) < _EVENT.size - 1:
+                    break
+                ignored, ts, path_id, kind, length = _EVENT.unpack(
+                        rec_type + data)
+                hint = f.read(length)
+                if len(hint) < length:
+                    break
+                yield ts, paths[path_id], _KINDS[kind], _decode(hint)
+            else:
+                raise ValueError(filename)
+    finally:
+        f.close()
+
+
+def replay_journal(root, filename, speed=1.0, callbacks_only=False):
+    '''Replay the notifications recorded in a journal into a tree.
+
+    Each notification is delivered to the node in the tree with the recorded
+    path. Notifications for paths that are not in the tree, or are not
+    components, are skipped.
+
+    @param root The root node of the tree.
+    @param filename The name of the journal file.
+    @param speed The replay speed relative to the recording. 1.0 replays at
+                 the recorded rate, 2.0 at twice the rate, and so on. If 0 or
+                 None, notifications are replayed as fast as possible.
+    @param callbacks_only If False, each notification is applied to its node
+                          as if it was received by the node's observer, which
+                          may cause the node to contact its component. If
+                          True, only the node's callbacks (and tree-wide
+                          listeners such as event streams) are called, so the
+                          journal can be replayed without the recorded
+                          components running.
+    @return A tuple of the number of notifications delivered and the number
+            skipped.
+
+    '''
+    nodes = {}
+    delivered = 0
+    skipped = 0
+    start = None
+    for ts, path, kind, hint in read_journal(filename):
+        if start is None:
+            start = (ts, time.time())
+        elif speed:
+            delay = start[1] + (ts - start[0]) / speed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        if path not in nodes:
+            node = root.get_node(['/'] + path.lstrip('/').split('/'))
+            if node and not node.is_component:
+                node = None
+            nodes[path] = node
+        node = nodes[path]
+        if not node:
+            skipped += 1
+            continue
+        if callbacks_only:
+            event, value = parse_status(node, kind, hint)
+            if event == 'heartbeat':
+                value = time.time()
+            node._call_cb(event, value)
+        else:
+            apply_status(node, kind, hint)
+        delivered += 1
+    return delivered, skipped
+
+
+# vim: tw=79
+
@@ -0,0 +1,394 @@
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''rtctree
+
+Copyright (C) 2009-2014
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Collection of log records from many components.
+
+'''
+
+
+from collections import deque, namedtuple
+import os
+import os.path
+import PortableServer
+import sys
+import threading
+import traceback
+import uuid
+
+from rtctree.exceptions import NoLoggerError
+import rtctree.sdo
+
+
+##############################################################################
+## Log record
+
+LogRecord = namedtuple('LogRecord', 'path time source level message')
+'''A log record received from a component.
+
+path is the full path of the component node as a string, time is a
+floating-point time stamp, source is the name of the logger in the component
+that produced the record, level is the record's OpenRTM.LogLevel value and
+message is the text of the record.
+
+'''
+
+
+def format_record(record):
+    '''Format a log record as a single line of text (without a newline).'''
+    return '{0:.6f} {1} {2} {3}: {4}'.format(record.time, record.path,
+            record.level, record.source, record.message)
+
+
+##############################################################################
+## Log sinks
+
+class LogSink(object):
+    '''Base class for the destinations of collected log records.
+
+    Sinks receive records in batches from the collector's delivery thread.
+
+    '''
+    def write(self, records):
+        '''Receive a batch of records, in the order they were received.'''
+        raise NotImplementedError
+
+    def close(self):
+        '''Release any resources held by the sink.'''
+        pass
+
+
+class CallbackSink(LogSink):
+    '''A sink that passes each batch of records to a function.'''
+    def __init__(self, cb, *args, **kwargs):
+        '''Constructor.
+
+        @param cb The function to call. It receives a list of LogRecord
+                  objects.
+
+        '''
+        super(CallbackSink, self).__init__(*args, **kwargs)
+        self._cb = cb
+
+    def write(self, records):
+        self._cb(records)
+
+
+class MemorySink(LogSink):
+    '''A sink that keeps the most recently collected records in memory.'''
+    def __init__(self, max_records=10000, *args, **kwargs):
+        '''Constructor.
+
+        @param max_records The number of records to keep.
+
+        '''
+        super(MemorySink, self).__init__(*args, **kwargs)
+        self._records = deque(maxlen=max_records)
+
+    def tail(self, n=None):
+        '''Get the last n records kept, oldest first.
+
+        @param n The number of records to get. If None, all kept records are
+                 returned.
+
+        '''
+        records = list(self._records)
+        if n is None:
+            return records
+        return records[-n:]
+
+    def write(self, records):
+        self._records.extend(records)
+
+
+class RotatingFileSink(LogSink):
+    '''A sink that writes records as lines of text to a file.
+
+    When the file reaches its maximum size, it is renamed with the suffix
+    '.1' (and any existing backups become '.2', '.3', and so on, up to the
+    number of backups to keep) and a new file is started.
+
+    '''
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, backup_count=5,
+            formatter=format_record, *args, **kwargs):
+        '''Constructor.
+
+        @param filename The name of the file to write.
+        @param max_bytes The size at which the file is rotated. If 0, the file
+                         is never rotated.
+        @param backup_count The number of rotated files to keep.
+        @param formatter A function converting a LogRecord to a line of text.
+
+        '''
+        super(RotatingFileSink, self).__init__(*args, **kwargs)
+        self._filename = filename
+        self._max_bytes = max_bytes
+        self._backup_count = backup_count
+        self._formatter = formatter
+        self._file = open(filename, 'a')
+        self._size = self._file.tell()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def write(self, records):
+        lines = ''.join([self._formatter(r) + '\n' for r in records])
+        if self._max_bytes and self._size and \
+                self._size + len(lines) > self._max_bytes:
+            self._rotate()
+        self._file.write(lines)
+        self._file.flush()
+        self._size += len(lines)
+
+    def _rotate(self):
+        self._file.close()
+        if self._backup_count > 0:
+            for ii in range(self._backup_count - 1, 0, -1):
+                src = '{0}.{1}'.format(self._filename, ii)
+                if os.path.exists(src):
+                    dst = '{0}.{1}'.format(self._filename, ii + 1)
+                    if os.path.exists(dst):
+                        os.remove(dst)
+                    os.rename(src, dst)
+            dst = self._filename + '.1'
+            if os.path.exists(dst):
+                os.remove(dst)
+            os.rename(self._filename, dst)
+        self._file = open(self._filename, 'w')
+        self._size = 0
+
+
+##############################################################################
+## Log collector object
+
+class LogCollector(object):
+    '''Collects the log records of many components into a set of sinks.
+
+    A single Logger servant receives the records of all attached components.
+    Received records are appended to a fixed-size ring buffer without taking
+    any lock; a delivery thread removes them in batches and passes each batch
+    to every sink. If records arrive faster than they are delivered, the
+    oldest records in the ring are overwritten and counted as dropped. A sink
+    that raises an exception is reported and counted in the statistics, and
+    does not stop the other sinks or the delivery thread.
+
+    '''
+    def __init__(self, orb, capacity=65536, batch_size=1024,
+            flush_interval=0.1, sinks=None, *args, **kwargs):
+        '''Constructor.
+
+        @param orb The ORB used to serve the logger servant (e.g. RTCTree.orb).
+        @param capacity The number of records the ring buffer holds.
+        @param batch_size The maximum number of records delivered to the sinks
+                          in one batch. The delivery thread is woken early when
+                          this many records are waiting.
+        @param flush_interval The maximum time, in seconds, a record waits in
+                              the ring before delivery.
+        @param sinks A list of LogSink objects to deliver records to.
+
+        '''
+        super(LogCollector, self).__init__(*args, **kwargs)
+        self._mutex = threading.RLock()
+        self._ring = deque(maxlen=capacity)
+        self._capacity = capacity
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._sinks = list(sinks) if sinks else []
+        self._received = 0
+        self._dropped = 0
+        self._delivered = 0
+        self._errors = 0
+        # Held while delivering, so that batches reach the sinks in order
+        self._deliver_mutex = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_flag = False
+        # Object ID -> component path, read by the servant without locking
+        self._sources = {}
+        # Logger ID -> (component, object ID)
+        self._attached = {}
+        root_poa = orb.resolve_initial_references('RootPOA')
+        policies = [root_poa.create_id_uniqueness_policy(
+                        PortableServer.MULTIPLE_ID),
+                    root_poa.create_id_assignment_policy(
+                        PortableServer.USER_ID)]
+        self._poa = root_poa.create_POA(
+                'rtctree-log-collector-{0}'.format(uuid.uuid4()),
+                root_poa._get_the_POAManager(), policies)
+        self._servant = rtctree.sdo.SharedRTCLogger(
+                orb.resolve_initial_references('POACurrent'), self._sources,
+                self._receive)
+        self._thread = threading.Thread(target=self._run,
+                name='rtctree-log-collector')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def add_sink(self, sink):
+        '''Add a sink to deliver records to.'''
+        with self._mutex:
+            self._sinks = self._sinks + [sink]
+
+    def attach(self, component, level='NORMAL', filters='ALL'):
+        '''Start collecting the log records of a component.
+
+        @param component The Component node to collect records from.
+        @param level The maximum level of log records to collect.
+        @param filters Filter the loggers in the component from which to
+                       collect records.
+        @return An ID for the attachment, to be passed to detach().
+        @raises AddLoggerError
+
+        '''
+        oid = uuid.uuid4().get_bytes()
+        with self._mutex:
+            self._poa.activate_object_with_id(oid, self._servant)
+            self._sources[oid] = component.full_path_str
+            try:
+                log_id = component._add_logger_service(
+                        self._poa.id_to_reference(oid), level, filters)
+            except:
+                del self._sources[oid]
+                self._poa.deactivate_object(oid)
+                raise
+            self._attached[log_id] = (component, oid)
+            return log_id
+
+    def detach(self, log_id):
+        '''Stop collecting the log records of a component.
+
+        @param log_id The ID returned by attach().
+        @raises NoLoggerError
+
+        '''
+        with self._mutex:
+            if log_id not in self._attached:
+                raise NoLoggerError(log_id, 'log collector')
+            component, oid = self._attached.pop(log_id)
+            try:
+                component._remove_logger_service(log_id)
+            finally:
+                del self._sources[oid]
+                self._poa.deactivate_object(oid)
+
+    def flush(self):
+        '''Deliver all records waiting in the ring to the sinks now.'''
+        self._deliver(all=True)
+
+    def rem_sink(self, sink):
+        '''Remove a sink. The sink is not closed.'''
+        with self._mutex:
+            self._sinks = [s for s in self._sinks if s is not sink]
+
+    def stop(self):
+        '''Detach from all components, deliver waiting records to the sinks,
+        and stop the delivery thread.
+
+        The sinks are closed.
+
+        '''
+        with self._mutex:
+            for log_id in list(self._attached.keys()):
+                try:
+                    self.detach(log_id)
+                except Exception:
+                    # The component may already be gone
+                    pass
+            self._stop_flag = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        with self._mutex:
+            for s in self._sinks:
+                s.close()
+            self._poa.destroy(False, False)
+
+    @property
+    def attached(self):
+        '''The list of components records are being collected from.'''
+        with self._mutex:
+            return [c for c, oid in self._attached.values()]
+
+    @property
+    def stats(self):
+        '''A dictionary of collection statistics.
+
+        The keys are 'received', 'delivered', 'dropped', 'waiting' and
+        'errors' (the number of times a sink failed to write a batch). The
+        received and dropped counts are updated without locking, so they may
+        be slightly low when records arrive on several threads at once.
+
+        '''
+        with self._mutex:
+            delivered = self._delivered
+            errors = self._errors
+        return {'received': self._received, 'delivered': delivered,
+                'dropped': self._dropped, 'waiting': len(self._ring),
+                'errors': errors}
+
+    def _deliver(self, all=False):
+        # Move records from the ring to the sinks in batches. The collector's
+        # lock is only held to take each batch; the sinks write without it.
+        with self._deliver_mutex:
+            while self._ring:
+                batch = []
+                with self._mutex:
+                    popleft = self._ring.popleft
+                    try:
+                        for ii in range(self._batch_size):
+                            batch.append(popleft())
+                    except IndexError:
+                        # Ring is empty
+                        pass
+                    sinks = self._sinks
+                errors = 0
+                for s in sinks:
+                    try:
+                        s.write(batch)
+                    except Exception:
+                        # Do not let one bad sink stop the others
+                        errors += 1
+                        traceback.print_exc(file=sys.stderr)
+                with self._mutex:
+                    self._delivered += len(batch)
+                    self._errors += errors
+                if not all and len(self._ring) < self._batch_size:
+                    break
+
+    def _receive(self, path, record):
+        # Called by the servant for every record received. This runs in ORB
+        # threads and must not block.
+        ring = self._ring
+        if len(ring) == self._capacity:
+            self._dropped += 1
+        ring.append(LogRecord(path,
+            record.time.sec + record.time.nsec / 1e9, record.loggername,
+            record.level, record.message))
+        self._received += 1
+        if len(ring) >= self._batch_size and not self._wake.is_set():
+            self._wake.set()
+
+    def _run(self):
+        while not self._stop_flag:
+            self._wake.wait(self._flush_interval)
+            self._wake.clear()
+            try:
+                self._deliver()
+            except Exception:
+                # Keep the delivery thread running
+                traceback.print_exc(file=sys.stderr)
+
+
+# vim: tw=79
+
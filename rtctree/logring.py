@@ -0,0 +1,349 @@
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''rtctree
+
+Copyright (C) 2009-2014
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+A memory-mapped ring file of log records.
+
+The file is a fixed-size header followed by a fixed-size data area used as a
+ring. The header contains, in order and little-endian:
+
+- the magic bytes 'RTCL' and the format version (uint16),
+- the size of the data area (uint64),
+- the write position (uint64): the end of the last complete record,
+- the oldest position (uint64): the start of the oldest record not yet
+  overwritten,
+- the number of records written since the file was created (uint64).
+
+Positions are byte offsets that only ever increase; the offset within the
+data area is the position modulo the data area size. Each record is a header
+of its total length (uint32, a multiple of 8), time stamp (double), level
+(uint8) and the lengths of the path, source and message (uint16, uint16 and
+uint32), followed by the UTF-8 path, source and message. A record is never
+split across the end of the data area: if it does not fit, a length of
+0xFFFFFFFF (or the end of the area, if fewer than four bytes remain) marks
+the rest of the area as unused.
+
+The writer moves the oldest position forward before overwriting old records
+and moves the write position forward only after a record is complete, so the
+file always holds the most recent complete records, even if the writing
+process dies.
+
+'''
+
+
+import mmap
+import os
+import struct
+
+from rtctree.logcollector import LogSink
+
+
+##############################################################################
+## File format
+
+RING_MAGIC = b'RTCL'
+RING_VERSION = 1
+
+LOG_LEVELS = ['SILENT', 'ERROR', 'WARN', 'INFO', 'NORMAL', 'DEBUG', 'TRACE',
+        'VERBOSE', 'PARANOID']
+
+_HEADER = struct.Struct('<4sHxxQQQQ')
+_HEADER_SIZE = 64
+_REC = struct.Struct('<IdBxHHIxx')
+_WRAP = 0xFFFFFFFF
+_U32 = struct.Struct('<I')
+_U64 = struct.Struct('<Q')
+# Offsets of the header fields that change
+_WRITE_POS = 16
+_OLDEST_POS = 24
+_COUNT = 32
+
+
+def _level_code(level):
+    # Convert an OpenRTM.LogLevel value, integer or name to a level code.
+    if isinstance(level, int):
+        return level
+    code = getattr(level, '_v', None)
+    if code is not None:
+        return code
+    return LOG_LEVELS.index(str(level))
+
+
+def _buffer_maker(mm):
+    # Get a function making zero-copy views of parts of a memory map.
+    try:
+        view = memoryview(mm)
+        return lambda offset, length: view[offset:offset + length]
+    except TypeError:
+        # Python 2 maps do not support memoryview
+        return lambda offset, length: buffer(mm, offset, length)
+
+
+##############################################################################
+## Ring writer
+
+class MmapRingSink(LogSink):
+    '''A log sink that writes records to a memory-mapped ring file.
+
+    The file has a fixed size, so only the most recent records are kept.
+    Because the records are written into the mapping of the file, they
+    survive the collecting process crashing, and other processes can read
+    them while they are written using MmapRingReader.
+
+    Records are packed directly into the mapping, without building
+    intermediate buffers. The encoded path of each component is cached. On
+    Python 2, byte strings are written without conversion, so writing a
+    record allocates nothing; on Python 3, encoding the source and message
+    text is unavoidable.
+
+    '''
+    def __init__(self, filename, size=16 * 1024 * 1024, *args, **kwargs):
+        '''Constructor.
+
+        If the file exists and is a ring of the same size, writing continues
+        after the records it already holds. Otherwise, a new ring is created.
+
+        @param filename The name of the ring file.
+        @param size The size of the data area of the ring, in bytes.
+
+        '''
+        super(MmapRingSink, self).__init__(*args, **kwargs)
+        self._size = size - size % 8
+        total = _HEADER_SIZE + self._size
+        existing = os.path.exists(filename) and \
+                os.path.getsize(filename) == total
+        self._file = open(filename, 'r+b' if existing else 'w+b')
+        if not existing:
+            self._file.truncate(total)
+        self._mm = mmap.mmap(self._file.fileno(), total)
+        magic, version, size, write_pos, oldest, count = \
+                _HEADER.unpack_from(self._mm, 0)
+        if not existing or magic != RING_MAGIC or \
+                version != RING_VERSION or size != self._size:
+            _HEADER.pack_into(self._mm, 0, RING_MAGIC, RING_VERSION,
+                    self._size, 0, 0, 0)
+            write_pos = oldest = count = 0
+        self._write_pos = write_pos
+        self._oldest = oldest
+        self._count = count
+        self._paths = {}
+
+    def close(self):
+        if self._mm:
+            self._mm.flush()
+            self._mm.close()
+            self._mm = None
+            self._file.close()
+
+    def flush(self):
+        '''Flush the ring to the file on disk.
+
+        This is only needed to protect against the operating system crashing;
+        the records are visible to readers and survive the writing process
+        crashing without it.
+
+        '''
+        self._mm.flush()
+
+    def write(self, records):
+        for r in records:
+            self.write_record(r.path, r.time, r.level, r.source, r.message)
+        self._commit()
+
+    def write_record(self, path, time, level, source, message):
+        '''Write a single record to the ring.
+
+        The record becomes visible to readers the next time a batch of records
+        is committed, at the end of write().
+
+        '''
+        enc_path = self._paths.get(path)
+        if enc_path is None:
+            enc_path = self._paths[path] = self._encode(path)
+        source = self._encode(source)
+        message = self._encode(message)
+        length = _REC.size + len(enc_path) + len(source) + len(message)
+        length += -length % 8
+        if length > self._size:
+            # Cannot ever fit; truncate the message
+            message = message[:len(message) - (length - self._size)]
+            length = self._size
+        offset = self._write_pos % self._size
+        if offset + length > self._size:
+            # Mark the rest of the area as unused and wrap to the start
+            self._make_space(self._size - offset)
+            if self._size - offset >= _U32.size:
+                _U32.pack_into(self._mm, _HEADER_SIZE + offset, _WRAP)
+            self._write_pos += self._size - offset
+            offset = 0
+        self._make_space(length)
+        start = _HEADER_SIZE + offset
+        mm = self._mm
+        _REC.pack_into(mm, start, length, time, _level_code(level),
+                len(enc_path), len(source), len(message))
+        start += _REC.size
+        mm[start:start + len(enc_path)] = enc_path
+        start += len(enc_path)
+        mm[start:start + len(source)] = source
+        start += len(source)
+        mm[start:start + len(message)] = message
+        self._write_pos += length
+        self._count += 1
+
+    @property
+    def count(self):
+        '''The number of records written to the ring since it was created.'''
+        return self._count
+
+    def _commit(self):
+        # Publish the new write position (and record count) to readers.
+        _U64.pack_into(self._mm, _COUNT, self._count)
+        _U64.pack_into(self._mm, _WRITE_POS, self._write_pos)
+
+    def _encode(self, s):
+        if isinstance(s, bytes):
+            return s
+        return s.encode('utf-8')
+
+    def _make_space(self, length):
+        # Move the oldest position forward past any records that writing
+        # length bytes at the write position will overwrite. Readers see the
+        # new oldest position before the data is overwritten.
+        end = self._write_pos + length
+        moved = False
+        while self._oldest < self._write_pos and \
+                end - self._oldest > self._size:
+            offset = self._oldest % self._size
+            if self._size - offset < _U32.size:
+                self._oldest += self._size - offset
+            else:
+                rec_len = _U32.unpack_from(self._mm, _HEADER_SIZE + offset)[0]
+                if rec_len == _WRAP:
+                    self._oldest += self._size - offset
+                else:
+                    self._oldest += rec_len
+            moved = True
+        if moved:
+            _U64.pack_into(self._mm, _OLDEST_POS, self._oldest)
+
+
+##############################################################################
+## Ring reader
+
+class MmapRingReader(object):
+    '''Reads the records in a ring file written by a MmapRingSink.
+
+    Any number of readers, in any number of processes, can read a ring while
+    it is written. Records are returned as views into the file's mapping, not
+    copies. A view remains valid only until the writer overwrites that part of
+    the ring, so records should be consumed (or copied) promptly. Records that
+    are overwritten before they are read are counted as missed. Views still
+    held when the reader is closed keep the file mapped until they are
+    released.
+
+    '''
+    def __init__(self, filename, from_start=True, *args, **kwargs):
+        '''Constructor.
+
+        @param filename The name of the ring file.
+        @param from_start If True, the first read returns all records held in
+                          the ring. If False, only records written after the
+                          reader is created are returned.
+
+        '''
+        super(MmapRingReader, self).__init__(*args, **kwargs)
+        self._file = open(filename, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._size, write_pos, oldest, count = \
+                _HEADER.unpack_from(self._mm, 0)
+        if magic != RING_MAGIC or version != RING_VERSION:
+            self.close()
+            raise ValueError(filename)
+        self._view = _buffer_maker(self._mm)
+        self._pos = oldest if from_start else write_pos
+        self._missed = 0
+
+    def close(self):
+        '''Close the ring file.'''
+        if self._mm:
+            self._view = None
+            try:
+                self._mm.close()
+            except BufferError:
+                # Views of records are still held; the mapping is unmapped
+                # when the last of them is released
+                pass
+            self._mm = None
+            self._file.close()
+
+    def read(self):
+        '''Read the records written since the last read.
+
+        @return A generator producing (time, level, path, source, message)
+                tuples. The level is the level's name, and the path, source and
+                message are views of the UTF-8 bytes in the ring. Use
+                bytes(view).decode('utf-8') (str(view) on Python 2) to convert
+                them to text.
+
+        '''
+        mm = self._mm
+        size = self._size
+        write_pos = _U64.unpack_from(mm, _WRITE_POS)[0]
+        while self._pos < write_pos:
+            oldest = _U64.unpack_from(mm, _OLDEST_POS)[0]
+            if self._pos < oldest:
+                # Lapped by the writer
+                self._missed += 1
+                self._pos = oldest
+                continue
+            offset = self._pos % size
+            if size - offset < _U32.size:
+                self._pos += size - offset
+                continue
+            start = _HEADER_SIZE + offset
+            if _U32.unpack_from(mm, start)[0] == _WRAP:
+                self._pos += size - offset
+                continue
+            length, ts, level, path_len, source_len, msg_len = \
+                    _REC.unpack_from(mm, start)
+            start += _REC.size
+            path = self._view(start, path_len)
+            start += path_len
+            source = self._view(start, source_len)
+            start += source_len
+            message = self._view(start, msg_len)
+            # Check the record was not overwritten while it was being read
+            if _U64.unpack_from(mm, _OLDEST_POS)[0] > self._pos:
+                continue
+            self._pos += length
+            if level < len(LOG_LEVELS):
+                level = LOG_LEVELS[level]
+            yield ts, level, path, source, message
+
+    @property
+    def missed(self):
+        '''The number of times this reader was lapped by the writer and missed
+        records.
+
+        '''
+        return self._missed
+
+    @property
+    def total(self):
+        '''The number of records written to the ring since it was created.'''
+        return _U64.unpack_from(self._mm, _COUNT)[0]
+
+
+# vim: tw=79
+
@@ -20,9 +20,12 @@ Object representing a manager node in the tree.
 
 from __future__ import print_function
 
+from collections import namedtuple
 from omniORB import CORBA, TRANSIENT_ConnectFailed, UNKNOWN_UserException
 import os.path
 import sys
+import threading
+import time
 
 from rtctree.component import Component
 from rtctree.exceptions import FailedToLoadModuleError, \
@@ -33,10 +36,120 @@ from rtctree.exceptions import FailedToLoadModuleError, \
                                FailedToRemoveMasterManagerError, \
                                FailedToAddSlaveManagerError, \
                                FailedToRemoveSlaveManagerError
+from rtctree.instrument import remote
 from rtctree.node import TreeNode
-from rtctree.utils import nvlist_to_dict
+from rtctree.utils import nvlist_to_dict, parallel_map, LazyValue
 import RTC
 
+##############################################################################
+## Bulk operation result
+
+ComponentResult = namedtuple('ComponentResult', 'name node error time')
+'''The result of creating or deleting one component in a bulk operation.
+
+name is the module name or instance name given, node is the Component node
+created or removed (None if the operation failed, or if a deleted component
+was not in the tree), error is the exception raised if the operation failed
+(None otherwise), and time is the time taken by the operation, in seconds.
+
+'''
+
+
+##############################################################################
+## Manager hierarchy crawl
+
+class ManagerCrawl(object):
+    '''The state of the discovery of a hierarchy of managers.
+
+    When a manager node is created, its components and slave managers, and
+    their slave managers in turn, are discovered. The slave managers and
+    components of each manager are fetched concurrently. A crawl object is
+    shared by all the managers discovered, and is used to:
+
+    - detect cycles, where a manager is its own (indirect) slave, and slave
+      managers shared by several masters, so that no manager is discovered
+      twice;
+    - stop the discovery when a time budget runs out, or when it is cancelled
+      from another thread.
+
+    Managers and components not discovered because the crawl stopped are
+    counted in the skipped property. They can be discovered later by calling
+    Manager.reparse_children().
+
+    '''
+    def __init__(self, time_budget=None, max_workers=8, *args, **kwargs):
+        '''Constructor.
+
+        @param time_budget The maximum time, in seconds, to spend discovering
+                           managers and components. If None, there is no limit.
+        @param max_workers The maximum number of concurrent fetches made for
+                           each manager.
+
+        '''
+        super(ManagerCrawl, self).__init__(*args, **kwargs)
+        self._mutex = threading.Lock()
+        if time_budget is None:
+            self._deadline = None
+        else:
+            self._deadline = time.time() + time_budget
+        self._max_workers = max_workers
+        self._cancelled = False
+        self._visited = []
+        self._cycles = 0
+        self._skipped = 0
+
+    def cancel(self):
+        '''Stop the discovery as soon as possible.'''
+        with self._mutex:
+            self._cancelled = True
+
+    @property
+    def cycles(self):
+        '''The number of managers found more than once, either because of a
+        cycle or because they are shared by several masters.
+
+        '''
+        with self._mutex:
+            return self._cycles
+
+    @property
+    def expired(self):
+        '''Has the crawl been cancelled or run out of time?'''
+        with self._mutex:
+            if self._cancelled:
+                return True
+        return self._deadline is not None and time.time() > self._deadline
+
+    @property
+    def max_workers(self):
+        '''The maximum number of concurrent fetches made for each manager.'''
+        return self._max_workers
+
+    @property
+    def skipped(self):
+        '''The number of managers and components not discovered because the
+        crawl was cancelled or ran out of time.
+
+        '''
+        with self._mutex:
+            return self._skipped
+
+    def _skip(self, count=1):
+        with self._mutex:
+            self._skipped += count
+
+    def _visit(self, obj):
+        # Record a manager as discovered. Returns False if it has already been
+        # discovered during this crawl.
+        with self._mutex:
+            for v in self._visited:
+                if v._is_equivalent(obj):
+                    self._cycles += 1
+                    return False
+            self._visited.append(obj)
+            return True
+
+
 ##############################################################################
 ## Manager node object
 
@@ -48,12 +161,67 @@ class Manager(TreeNode):
     remove new components and managers to the tree at run time.
 
     '''
-    def __init__(self, name=None, parent=None, obj=None, *args, **kwargs):
-        '''Constructor. Calls the TreeNode constructor.'''
+    def __init__(self, name=None, parent=None, obj=None, crawl=None, *args,
+            **kwargs):
+        '''Constructor. Calls the TreeNode constructor.
+
+        @param name Name of this manager (i.e. its entry in the path).
+        @param parent The parent node of this node, if any.
+        @param obj The CORBA RTM::Manager object to wrap.
+        @param crawl The ManagerCrawl object used to discover the manager
+                     hierarchy, which must already have visited this manager.
+                     If None, a new crawl with no time limit is started at
+                     this manager.
+
+        '''
+        # Information fetched from the manager when first needed. The fetches
+        # are made without holding the node's lock.
+        self._configuration = LazyValue(lambda: nvlist_to_dict(
+            remote(self._obj, self).get_configuration()))
+        self._profile = LazyValue(lambda: nvlist_to_dict(
+            remote(self._obj, self).get_profile().properties))
+        self._factory_profiles = LazyValue(lambda: [
+            nvlist_to_dict(fp.properties) \
+                    for fp in remote(self._obj, self).get_factory_profiles()])
+        self._loadable_modules = LazyValue(lambda: [
+            nvlist_to_dict(mp.properties) \
+                    for mp in remote(self._obj, self).get_loadable_modules()])
+        self._loaded_modules = LazyValue(lambda: [
+            nvlist_to_dict(mp.properties) \
+                    for mp in remote(self._obj, self).get_loaded_modules()])
         super(Manager, self).__init__(name=name, parent=parent, *args,
                                       **kwargs)
         self._obj = obj
-        self._parse()
+        if crawl is None:
+            crawl = ManagerCrawl()
+            if obj:
+                crawl._visit(obj)
+        self._parse(crawl)
+
+    def reparse_children(self, time_budget=None, max_workers=8):
+        '''Discover this manager's components and slave managers again.
+
+        The existing child nodes are discarded.
+
+        @param time_budget The maximum time, in seconds, to spend discovering
+                           managers and components. If None, there is no limit.
+        @param max_workers The maximum number of concurrent fetches made for
+                           each manager.
+        @return The ManagerCrawl object used. It can be checked to see if the
+                discovery was completed.
+
+        '''
+        crawl = ManagerCrawl(time_budget=time_budget, max_workers=max_workers)
+        crawl._visit(self._obj)
+        with self._mutex:
+            old = self._children
+            self._children = {}
+            self._components = None
+            self._slaves = None
+        for child in old.values():
+            child._release_callbacks()
+        self._parse_children(crawl)
+        return crawl
 
     ##########################################################################
     # Module and component management
@@ -71,16 +239,41 @@ class Manager(TreeNode):
         format. For example, to change the instance name of the new component,
         append '?instance_name=new_name' to the module name.
 
+        The new component is added as a child node of this node; the other
+        child nodes are not changed.
+
         @param module_name Name of the module to turn into a component.
+        @return The new Component node.
         @raises FailedToCreateComponentError
 
         '''
-        with self._mutex:
-            if not self._obj.create_component(module_name):
-                raise FailedToCreateComponentError(module_name)
-            # The list of child components will have changed now, so it must be
-            # reparsed.
-            self._parse_component_children()
+        return self._create_child(module_name)
+
+    def create_components(self, module_names, max_workers=8):
+        '''Create several components at once.
+
+        The components are created concurrently, and each new component is
+        added as a child node of this node as soon as it is created. A failure
+        to create one component does not stop the others being created.
+
+        @param module_names A list of module names, with options, as for
+                            create_component().
+        @param max_workers The maximum number of components to create at once.
+        @return A list of ComponentResult records, in the same order as the
+                module names.
+
+        '''
+        def create(module_name):
+            start = time.time()
+            try:
+                node = self._create_child(module_name)
+                error = None
+            except Exception as e:
+                node = None
+                error = e
+            return ComponentResult(module_name, node, error,
+                    time.time() - start)
+        return [r for r, e in parallel_map(create, module_names, max_workers)]
 
     def delete_component(self, instance_name):
         '''Delete a component.
@@ -88,16 +281,41 @@ class Manager(TreeNode):
         Deletes the component specified by @ref instance_name from the manager.
         This will invalidate any objects that are children of this node.
 
+        The component's child node is removed from this node; the other child
+        nodes are not changed.
+
         @param instance_name The instance name of the component to delete.
         @raises FailedToDeleteComponentError
 
         '''
-        with self._mutex:
-            if self._obj.delete_component(instance_name) != RTC.RTC_OK:
-                raise FailedToDeleteComponentError(instance_name)
-            # The list of child components will have changed now, so it must be
-            # reparsed.
-            self._parse_component_children()
+        self._delete_child(instance_name)
+
+    def delete_components(self, instance_names, max_workers=8):
+        '''Delete several components at once.
+
+        The components are deleted concurrently, and each component's child
+        node is removed as soon as it is deleted. A failure to delete one
+        component does not stop the others being deleted.
+
+        @param instance_names A list of the instance names of the components
+                              to delete.
+        @param max_workers The maximum number of components to delete at once.
+        @return A list of ComponentResult records, in the same order as the
+                instance names.
+
+        '''
+        def delete(instance_name):
+            start = time.time()
+            try:
+                node = self._delete_child(instance_name)
+                error = None
+            except Exception as e:
+                node = None
+                error = e
+            return ComponentResult(instance_name, node, error,
+                    time.time() - start)
+        return [r for r, e in parallel_map(delete, instance_names,
+            max_workers)]
 
     def load_module(self, path, init_func):
         '''Load a shared library.
@@ -111,9 +329,9 @@ class Manager(TreeNode):
 
         '''
         try:
-            with self._mutex:
-                if self._obj.load_module(path, init_func) != RTC.RTC_OK:
-                    raise FailedToLoadModuleError(path)
+            if remote(self._obj, self).load_module(path, init_func) != \
+                    RTC.RTC_OK:
+                raise FailedToLoadModuleError(path)
         except CORBA.UNKNOWN as e:
             if e.args[0] == UNKNOWN_UserException:
                 raise FailedToLoadModuleError(path, 'CORBA User Exception')
@@ -130,9 +348,8 @@ class Manager(TreeNode):
         @raises FailedToUnloadModuleError
 
         '''
-        with self._mutex:
-            if self._obj.unload_module(path) != RTC.RTC_OK:
-                raise FailedToUnloadModuleError(path)
+        if remote(self._obj, self).unload_module(path) != RTC.RTC_OK:
+            raise FailedToUnloadModuleError(path)
 
     @property
     def components(self):
@@ -151,12 +368,7 @@ class Manager(TreeNode):
     @property
     def factory_profiles(self):
         '''The factory profiles of all loaded modules.'''
-        with self._mutex:
-            if not self._factory_profiles:
-                self._factory_profiles = []
-                for fp in self._obj.get_factory_profiles():
-                    self._factory_profiles.append(nvlist_to_dict(fp.properties))
-        return self._factory_profiles
+        return self._factory_profiles.get()
 
     ##########################################################################
     # Manager configuration
@@ -169,46 +381,36 @@ class Manager(TreeNode):
         @raises FailedToSetConfigurationError
 
         '''
-        with self._mutex:
-            if self._obj.set_configuration(param, value) != RTC.RTC_OK:
-                raise FailedToSetConfigurationError(param, value)
-            # Force a reparse of the configuration
-            self._configuration = None
+        if remote(self._obj, self).set_configuration(param, value) != \
+                RTC.RTC_OK:
+            raise FailedToSetConfigurationError(param, value)
+        # Force a reparse of the configuration
+        self._configuration.reset()
 
     @property
     def configuration(self):
         '''The configuration dictionary of the manager.'''
-        with self._mutex:
-            if not self._configuration:
-                self._configuration = nvlist_to_dict(self._obj.get_configuration())
-        return self._configuration
+        return self._configuration.get()
 
     @property
     def profile(self):
         '''The manager's profile.'''
-        with self._mutex:
-            if not self._profile:
-                profile = self._obj.get_profile()
-                self._profile = nvlist_to_dict(profile.properties)
-        return self._profile
+        return self._profile.get()
 
     ##########################################################################
     # Undocumented functions
 
     def fork(self):
         '''Fork the manager.'''
-        with self._mutex:
-            self._obj.fork()
+        remote(self._obj, self).fork()
 
     def shutdown(self):
         '''Shut down the manager.'''
-        with self._mutex:
-            self._obj.shutdown()
+        remote(self._obj, self).shutdown()
 
     def restart(self):
         '''Restart the manager.'''
-        with self._mutex:
-            self._obj.restart()
+        remote(self._obj, self).restart()
 
     ##########################################################################
     # Node functionality
@@ -238,28 +440,17 @@ class Manager(TreeNode):
         managers are only present as children of other managers.
 
         '''
-        with self._mutex:
-            return self._obj.is_master()
+        return remote(self._obj, self).is_master()
 
     @property
     def loadable_modules(self):
         '''The list of loadable module profile dictionaries.'''
-        with self._mutex:
-            if not self._loadable_modules:
-                self._loadable_modules = []
-                for mp in self._obj.get_loadable_modules():
-                    self._loadable_modules.append(nvlist_to_dict(mp.properties))
-        return self._loadable_modules
+        return self._loadable_modules.get()
 
     @property
     def loaded_modules(self):
         '''The list of loaded module profile dictionaries.'''
-        with self._mutex:
-            if not self._loaded_modules:
-                self._loaded_modules = []
-                for mp in self._obj.get_loaded_modules():
-                    self._loaded_modules.append(nvlist_to_dict(mp.properties))
-        return self._loaded_modules
+        return self._loaded_modules.get()
 
     @property
     def masters(self):
@@ -292,112 +483,186 @@ class Manager(TreeNode):
     def _add_master(self, new_master):
         # Add a new master to this manager. A slave manager can have multiple
         # masters. new_master should be a rtctree.manager.Manager object.
-        with self._mutex:
-            if self._obj.add_master_manager(new_master.object) != RTC.RTC_OK:
-                raise FailedToAddMasterManagerError
+        if remote(self._obj, self).add_master_manager(
+                new_master.object) != RTC.RTC_OK:
+            raise FailedToAddMasterManagerError
 
     def _add_slave(self, new_slave):
         # Add a slave to this manager. Master managers can hold slave managers,
         # which appear as child nodes in the tree. It will appear in the tree
         # as a new child node of this manager's node if the tree is reparsed.
         # new_slave should be a rtctree.manager.Manager object.
+        if remote(self._obj, self).add_save_manager(new_slave.object) != \
+                RTC.RTC_OK:
+            raise FailedToAddSlaveManagerError(self.name, new_slave.name)
+
+    def _create_child(self, module_name):
+        # Create a component and add a child node for it. The manager's mutex
+        # is only held while the node is added, so several components can be
+        # created at once.
+        obj = remote(self._obj, self).create_component(module_name)
+        if not obj:
+            raise FailedToCreateComponentError(module_name)
+        profile = remote(obj, self).get_component_profile()
+        leaf = Component(profile.instance_name + '.rtc', self, obj)
+        with self._mutex:
+            self._add_child(leaf)
+            self._components = None
+        return leaf
+
+    def _delete_child(self, instance_name):
+        # Delete a component and remove its child node, if present.
+        if remote(self._obj, self).delete_component(instance_name) != \
+                RTC.RTC_OK:
+            raise FailedToDeleteComponentError(instance_name)
         with self._mutex:
-            if self._obj.add_save_manager(new_slave.object) != RTC.RTC_OK:
-                raise FailedToAddSlaveManagerError(self.name, new_slave.name)
+            self._components = None
+            return self._children.pop(instance_name + '.rtc', None)
 
-    def _parse(self):
+    def _parse(self, crawl):
         # Nearly everything is delay-parsed when it is first accessed.
+        self._configuration.reset()
+        self._profile.reset()
+        self._factory_profiles.reset()
+        self._loadable_modules.reset()
+        self._loaded_modules.reset()
         with self._mutex:
             self._components = None
-            self._configuration = None
-            self._profile = None
-            self._factory_profiles = None
-            self._loadable_modules = None
-            self._loaded_modules = None
             self._masters = None
             self._slaves = None
-            self._parse_children()
-
-    def _parse_children(self):
-        # Parses child managers and components.
-        with self._mutex:
-            self._parse_component_children()
-            self._parse_manager_children()
-
-    def _parse_component_children(self):
+        self._parse_children(crawl)
+
+    def _parse_children(self, crawl=None):
+        # Parses child managers and components. The children are fetched and
+        # built without holding the lock, which is only taken to add them.
+        if crawl is None:
+            crawl = ManagerCrawl()
+            crawl._visit(self._obj)
+        self._parse_component_children(crawl)
+        self._parse_manager_children(crawl)
+
+    def _parse_component_children(self, crawl=None):
         # Parses the list returned by _obj.get_components into child nodes.
-        with self._mutex:
-            try:
-                comps = self._obj.get_components()
-            except CORBA.BAD_PARAM as e:
-                print('{0}: {1}'.format(os.path.basename(sys.argv[0]), e),
-                        file=sys.stderr)
-                return
-            for c in comps:
-                # Get the instance profile - this will be the node's name
-                profile = c.get_component_profile()
-                instance_name = profile.instance_name
-                # Create and store the new leaf node
-                leaf = Component(instance_name + '.rtc', self, c)
+        # The components are fetched concurrently.
+        def make_leaf(c):
+            if crawl.expired:
+                crawl._skip()
+                return None
+            # Get the instance profile - this will be the node's name
+            profile = remote(c, self).get_component_profile()
+            instance_name = profile.instance_name
+            return Component(instance_name + '.rtc', self, c)
+
+        if crawl is None:
+            crawl = ManagerCrawl()
+        try:
+            comps = remote(self._obj, self).get_components()
+        except CORBA.BAD_PARAM as e:
+            print('{0}: {1}'.format(os.path.basename(sys.argv[0]), e),
+                    file=sys.stderr)
+            return
+        results = parallel_map(make_leaf, comps, crawl.max_workers)
+        # Store the new leaf nodes
+        for leaf, error in results:
+            if leaf:
                 self._add_child(leaf)
+        for leaf, error in results:
+            if error:
+                raise error
 
-    def _parse_manager_children(self):
+    def _parse_manager_children(self, crawl=None):
         # Parses the list returned by _obj.get_slave_managers into child nodes.
-        with self._mutex:
+        # The profiles of the slaves are fetched concurrently, and then the
+        # slaves, with their own children, are created concurrently. The
+        # workers must not take this node's lock, so the name is read first.
+        name = self._name
+
+        def get_props(m):
+            if crawl.expired:
+                crawl._skip()
+                return None
+            if not crawl._visit(m):
+                # A cycle, or a slave shared with another master
+                return None
             try:
-                mgrs = self._obj.get_slave_managers()
-            except CORBA.BAD_OPERATION:
-                # This manager does not support slave managers; ignore
-                return
-            index = 0
-            for m in mgrs:
-                # Add each slave manager as a child node.
-                try:
-                    props = nvlist_to_dict(m.get_profile().properties)
-                except CORBA.TRANSIENT as e:
-                    if e.args[0] == TRANSIENT_ConnectFailed:
-                        print('{0}: Warning: zombie slave of '\
-                                'manager {1} found'.format(sys.argv[0],
-                                        self.name), file=sys.stderr)
-                        continue
-                    else:
-                        raise
-                if 'name' in props:
-                    name = props['name']
+                return nvlist_to_dict(remote(m, self).get_profile().properties)
+            except CORBA.TRANSIENT as e:
+                if e.args[0] == TRANSIENT_ConnectFailed:
+                    print('{0}: Warning: zombie slave of '\
+                            'manager {1} found'.format(sys.argv[0],
+                                    name), file=sys.stderr)
+                    return None
                 else:
-                    name = 'slave{0}'.format(index)
-                    index += 1
-                leaf = Manager(name, self, m)
+                    raise
+
+        def make_leaf(args):
+            slave_name, m = args
+            if crawl.expired:
+                crawl._skip()
+                return None
+            return Manager(slave_name, self, m, crawl=crawl)
+
+        if crawl is None:
+            crawl = ManagerCrawl()
+            crawl._visit(self._obj)
+        try:
+            mgrs = remote(self._obj, self).get_slave_managers()
+        except CORBA.BAD_OPERATION:
+            # This manager does not support slave managers; ignore
+            return
+        slaves = []
+        index = 0
+        for m, (props, error) in zip(mgrs,
+                parallel_map(get_props, mgrs, crawl.max_workers)):
+            if error:
+                raise error
+            if props is None:
+                continue
+            if 'name' in props:
+                slave_name = props['name']
+            else:
+                slave_name = 'slave{0}'.format(index)
+                index += 1
+            slaves.append((slave_name, m))
+        results = parallel_map(make_leaf, slaves, crawl.max_workers)
+        # Add each slave manager as a child node.
+        for leaf, error in results:
+            if leaf:
                 self._add_child(leaf)
+        for leaf, error in results:
+            if error:
+                raise error
 
     def _remove_master(self, master):
         # Remove a new master from this manager. A slave manager can have multiple
         # masters. new_master should be a rtctree.manager.Manager object.
-        with self._mutex:
-            if self._obj.remove_master_manager(master.object) != RTC.RTC_OK:
-                raise FailedToRemoveMasterManagerError
+        if remote(self._obj, self).remove_master_manager(
+                master.object) != RTC.RTC_OK:
+            raise FailedToRemoveMasterManagerError
 
     def _remove_slave(self, slave):
         # Remove a slave from this manager. Master managers can hold slave
         # managers, which appear as child nodes in the tree. slave should be a
         # rtctree.manager.Manager object.
-        with self._mutex:
-            if self._obj.remove_slave_manager(slave.object) != RTC.RTC_OK:
-                raise FailedToRemoveSlaveManagerError(self.name, slave.name)
+        if remote(self._obj, self).remove_slave_manager(slave.object) != \
+                RTC.RTC_OK:
+            raise FailedToRemoveSlaveManagerError(self.name, slave.name)
 
     def _set_parent(self, new_parent):
         # When setting the parent of a manager node, we need to tell wrapped
         # object that it has a new master. If our old parent was a master, then
         # we need to remove ourselves from that one.
         # Note that rtctree assumes a singly-linked hierarchy of managers.
-        with self._mutex:
-            if self.parent:
-                if self.parent.is_manager:
-                    self.parent._remove_slave(self)
-                    self._remove_master(self.parent)
-            self._add_master(new_parent)
-            new_parent._add_slave(self)
-            self.parent = new_parent
+        # The remote calls are made without holding the lock; setting the
+        # parent takes it.
+        old_parent = self.parent
+        if old_parent:
+            if old_parent.is_manager:
+                old_parent._remove_slave(self)
+                self._remove_master(old_parent)
+        self._add_master(new_parent)
+        new_parent._add_slave(self)
+        self.parent = new_parent
 
 
 # vim: tw=79
@@ -0,0 +1,349 @@
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''rtctree
+
+Copyright (C) 2009-2014
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Export of tree health metrics in the Prometheus text format.
+
+The following metrics are provided:
+
+- rtctree_components{state}: the number of components in each state.
+- rtctree_zombies: the number of zombie nodes.
+- rtctree_events_total{event}: the number of events raised by the nodes of
+  the tree, by event name. Use rate() to get event rates.
+- rtctree_heartbeat_age_seconds{path}: the time since the last heartbeat of
+  each dynamic component.
+- rtctree_heartbeats_missed: the number of components that have missed a
+  heartbeat and not yet recovered.
+- rtctree_call_duration_seconds{op,host}: a histogram of the time taken by
+  remote calls, when call statistics are enabled (see rtctree.instrument).
+- rtctree_call_errors_total{op,host,error}: the number of remote calls that
+  raised each type of exception.
+- rtctree_lock_hold_seconds{lock}: a histogram of the time the locks of each
+  type of object (e.g. Component, Port) are held for, when call statistics
+  are enabled.
+- rtctree_host_circuit_open{host}, rtctree_host_in_flight{host},
+  rtctree_host_rejected_total{host}, rtctree_host_throttled_total{host}: the
+  state of each endpoint under the tree's host policy, if it has one (see
+  rtctree.endpoints).
+
+The tree is walked once when the exporter is created. After that, the
+metrics are kept up to date from the events raised by the nodes, so reading
+them never walks the tree or contacts a component. Call refresh() after
+changing the structure of the tree (e.g. after reparsing a directory).
+
+'''
+
+
+import os
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from rtctree import instrument
+from rtctree.component import Component
+
+
+##############################################################################
+## Metrics exporter object
+
+class MetricsExporter(object):
+    '''Keeps the health metrics of a tree, and exports them.
+
+    Do not create this class directly. Use RTCTree.export_metrics().
+
+    '''
+    def __init__(self, root, *args, **kwargs):
+        '''Constructor.
+
+        @param root The root node of the tree.
+
+        '''
+        super(MetricsExporter, self).__init__(*args, **kwargs)
+        self._root = root
+        self._mutex = threading.Lock()
+        self._states = {}
+        self._zombies = 0
+        self._events = {}
+        self._beats = {}
+        self._missed = set()
+        self._server = None
+        self._server_thread = None
+        self.refresh()
+        self._root._add_listener(self._on_event)
+
+    def close(self):
+        '''Stop updating the metrics, and stop serving them.'''
+        self._root._rem_listener(self._on_event)
+        self.stop_serving()
+
+    def refresh(self):
+        '''Walk the tree to find its components and zombies again.
+
+        Event counts are kept.
+
+        '''
+        states = {}
+        beats = {}
+        zombies = []
+
+        def visit(node, args):
+            if node.is_zombie:
+                zombies.append(node)
+            elif node.is_component:
+                try:
+                    states[node] = node.state
+                except Exception:
+                    states[node] = node.UNKNOWN
+                if node.dynamic:
+                    beats[node] = (node.full_path_str, node.heartbeat_time)
+        self._root.iterate(visit)
+        with self._mutex:
+            self._states = states
+            self._beats = beats
+            self._zombies = len(zombies)
+            self._missed &= set(beats.keys())
+
+    def render(self):
+        '''Get the current metrics in the Prometheus text format.'''
+        now = time.time()
+        with self._mutex:
+            states = {}
+            for s in self._states.values():
+                states[s] = states.get(s, 0) + 1
+            lines = ['# HELP rtctree_components Components in each state.',
+                    '# TYPE rtctree_components gauge']
+            for state, name in sorted(_STATE_NAMES.items()):
+                lines.append(_sample('rtctree_components',
+                    {'state': name}, states.get(state, 0)))
+            lines += ['# HELP rtctree_zombies Zombie nodes in the tree.',
+                    '# TYPE rtctree_zombies gauge',
+                    _sample('rtctree_zombies', {}, self._zombies),
+                    '# HELP rtctree_events_total Events raised by nodes.',
+                    '# TYPE rtctree_events_total counter']
+            for event, count in sorted(self._events.items()):
+                lines.append(_sample('rtctree_events_total',
+                    {'event': event}, count))
+            lines += ['# HELP rtctree_heartbeat_age_seconds Time since the '
+                    'last heartbeat of each dynamic component.',
+                    '# TYPE rtctree_heartbeat_age_seconds gauge']
+            for path, beat in sorted(self._beats.values()):
+                lines.append(_sample('rtctree_heartbeat_age_seconds',
+                    {'path': path}, max(now - beat, 0.0)))
+            lines += ['# HELP rtctree_heartbeats_missed Components that have '
+                    'missed a heartbeat.',
+                    '# TYPE rtctree_heartbeats_missed gauge',
+                    _sample('rtctree_heartbeats_missed', {},
+                        len(self._missed))]
+        lines += _call_metrics(instrument.recorder())
+        lines += _lock_metrics(instrument.recorder())
+        lines += _host_metrics(self._root._host_policy)
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port=9464, address='127.0.0.1'):
+        '''Serve the metrics over HTTP from a background thread.
+
+        The metrics are served at every path, e.g.
+        http://127.0.0.1:9464/metrics.
+
+        @param port The TCP port to listen on. If 0, a free port is chosen.
+        @param address The address to listen on.
+        @return The (address, port) being listened on.
+
+        '''
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = exporter.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes are not worth logging
+                pass
+
+        self.stop_serving()
+        server = HTTPServer((address, port), Handler)
+        thread = threading.Thread(target=server.serve_forever,
+                name='rtctree-metrics-server')
+        thread.daemon = True
+        thread.start()
+        with self._mutex:
+            self._server = server
+            self._server_thread = thread
+        return server.server_address
+
+    def stop_serving(self):
+        '''Stop serving the metrics over HTTP.'''
+        with self._mutex:
+            server = self._server
+            thread = self._server_thread
+            self._server = None
+            self._server_thread = None
+        if server:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+    def write(self, filename):
+        '''Write the current metrics to a file.
+
+        The file is replaced atomically, so it can be read by the node
+        exporter's textfile collector while it is being updated.
+
+        @param filename The name of the file to write.
+
+        '''
+        temp = '{0}.{1}.tmp'.format(filename, os.getpid())
+        f = open(temp, 'w')
+        try:
+            f.write(self.render())
+        finally:
+            f.close()
+        if os.name == 'nt' and os.path.exists(filename):
+            # rename() does not replace files on Windows
+            os.remove(filename)
+        os.rename(temp, filename)
+
+    def _on_event(self, node, event, value):
+        # Update the metrics from an event raised by a node
+        if event == 'rtc_status':
+            # The node's cached EC states are already up to date
+            try:
+                state = node.state
+            except Exception:
+                state = node.UNKNOWN
+        with self._mutex:
+            self._events[event] = self._events.get(event, 0) + 1
+            if event == 'rtc_status':
+                self._states[node] = state
+            elif event == 'heartbeat':
+                entry = self._beats.get(node)
+                path = entry[0] if entry else instrument.node_path(node)
+                self._beats[node] = (path, value)
+                self._missed.discard(node)
+            elif event == 'heartbeat_missed':
+                self._missed.add(node)
+
+
+## The content type of the Prometheus text format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Names used for the component states in labels
+_STATE_NAMES = {Component.INACTIVE: 'inactive', Component.ACTIVE: 'active',
+        Component.ERROR: 'error', Component.UNKNOWN: 'unknown',
+        Component.CREATED: 'created'}
+
+
+def _call_metrics(recorder):
+    # Render the remote call statistics collected by a CallRecorder
+    if recorder is None:
+        return []
+    stats = recorder.stats()
+    lines = ['# HELP rtctree_call_duration_seconds Time taken by remote '
+            'calls.',
+            '# TYPE rtctree_call_duration_seconds histogram']
+    for key, s in sorted(stats.items()):
+        labels = {'op': s.op, 'host': s.host}
+        cumulative = 0
+        for bound, count in zip(instrument.LATENCY_BUCKETS, s.buckets):
+            cumulative += count
+            labels['le'] = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(_sample('rtctree_call_duration_seconds_bucket',
+                labels, cumulative))
+        del labels['le']
+        lines.append(_sample('rtctree_call_duration_seconds_sum', labels,
+            s.total))
+        lines.append(_sample('rtctree_call_duration_seconds_count', labels,
+            s.count))
+    lines += ['# HELP rtctree_call_errors_total Remote calls that raised an '
+            'exception.',
+            '# TYPE rtctree_call_errors_total counter']
+    for key, s in sorted(stats.items()):
+        for error, count in sorted(s.errors.items()):
+            lines.append(_sample('rtctree_call_errors_total',
+                {'op': s.op, 'host': s.host, 'error': error}, count))
+    return lines
+
+
+def _lock_metrics(recorder):
+    # Render the lock hold times collected by a CallRecorder
+    if recorder is None:
+        return []
+    lines = ['# HELP rtctree_lock_hold_seconds Time locks are held for.',
+            '# TYPE rtctree_lock_hold_seconds histogram']
+    for lock, s in sorted(recorder.lock_stats().items()):
+        labels = {'lock': lock}
+        cumulative = 0
+        for bound, count in zip(instrument.LATENCY_BUCKETS, s.buckets):
+            cumulative += count
+            labels['le'] = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(_sample('rtctree_lock_hold_seconds_bucket', labels,
+                cumulative))
+        del labels['le']
+        lines.append(_sample('rtctree_lock_hold_seconds_sum', labels,
+            s.total))
+        lines.append(_sample('rtctree_lock_hold_seconds_count', labels,
+            s.count))
+    return lines
+
+
+def _host_metrics(policy):
+    # Render the state of the endpoints under a HostPolicy
+    if policy is None:
+        return []
+    stats = sorted(policy.stats().items())
+    lines = []
+    for name, kind, help, value in [
+            ('rtctree_host_circuit_open', 'gauge',
+                'Whether calls to the host are refused (1 open, 0.5 trial).',
+                lambda s: {'open': 1, 'half_open': 0.5}.get(s.state, 0)),
+            ('rtctree_host_in_flight', 'gauge', 'Calls being made to the host.',
+                lambda s: s.in_flight),
+            ('rtctree_host_rejected_total', 'counter',
+                'Calls refused because the circuit was open.',
+                lambda s: s.rejected),
+            ('rtctree_host_throttled_total', 'counter',
+                'Calls that waited for the in-flight or rate limit.',
+                lambda s: s.throttled)]:
+        lines += ['# HELP {0} {1}'.format(name, help),
+                '# TYPE {0} {1}'.format(name, kind)]
+        for host, s in stats:
+            lines.append(_sample(name, {'host': host}, value(s)))
+    return lines
+
+
+def _sample(name, labels, value):
+    # Format one sample line
+    if labels:
+        name += '{' + ','.join('{0}="{1}"'.format(k, _escape(v)) \
+                for k, v in sorted(labels.items())) + '}'
+    return '{0} {1}'.format(name, repr(float(value)) \
+            if isinstance(value, float) else value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+            '\n', '\\n')
+
+
+# vim: tw=79
+
@@ -23,6 +23,7 @@ from omniORB import CORBA, TRANSIENT_ConnectFailed
 
 from rtctree.exceptions import *
 from rtctree.directory import Directory
+from rtctree.instrument import remote
 
 
 ##############################################################################
@@ -40,18 +41,21 @@ class NameServer(Directory):
 
     '''
     def __init__(self, orb=None, address=None, parent=None, filter=[],
-                 *args, **kwargs):
+                 budget=None, *args, **kwargs):
         '''Constructor.
 
         @param orb An orb object to use to connect to the name server.
         @param address The address of the name server. Used as the node name.
         @param parent The parent node of this node, if any.
         @param filter A list of paths to filter by.
+        @param budget The DiscoveryBudget limiting the time spent parsing the
+                      name server. Objects not resolved within it are added
+                      as pending nodes. If None, there is no limit.
 
         '''
         super(NameServer, self).__init__(name=address, parent=parent,
                 filter=filter, *args, **kwargs)
-        self._parse_server(address, orb, filter)
+        self._parse_server(address, orb, filter, budget)
 
     @property
     def is_nameserver(self):
@@ -70,13 +74,13 @@ class NameServer(Directory):
         with self._mutex:
             return self._ns_obj
 
-    def _parse_server(self, address, orb, filter=[]):
+    def _parse_server(self, address, orb, filter=[], budget=None):
         # Parse the name server.
         with self._mutex:
             self._address = address
             self._orb = orb
             root_context = self._connect_to_naming_service(address)
-            self._parse_context(root_context, orb, filter)
+            self._parse_context(root_context, orb, filter, budget)
 
     def _connect_to_naming_service(self, address):
         # Try to connect to a name server and get the root naming context.
@@ -87,7 +91,8 @@ class NameServer(Directory):
             except CORBA.ORB.InvalidName:
                 raise InvalidServiceError(address)
             try:
-                root_context = self._ns_obj._narrow(CosNaming.NamingContext)
+                root_context = remote(self._ns_obj, self)._narrow(
+                        CosNaming.NamingContext)
             except CORBA.TRANSIENT as e:
                 if e.args[0] == TRANSIENT_ConnectFailed:
                     raise InvalidServiceError(address)
@@ -18,9 +18,9 @@ Object representing a generic node in the tree.
 '''
 
 
-import threading
-
-from rtctree.exceptions import NotRelatedError, NoSuchEventError
+from rtctree.dispatch import CallbackWorker, Subscriber
+from rtctree.exceptions import NotRelatedError, NoSuchEventError, NoCBError
+from rtctree.instrument import TimedLock
 
 
 ##############################################################################
@@ -46,7 +46,7 @@ class TreeNode(object):
 
         '''
         super(TreeNode, self).__init__(*args, **kwargs)
-        self._mutex = threading.RLock()
+        self._mutex = TimedLock(type(self).__name__)
         self._name = name
         self._parent = parent
         if children:
@@ -58,6 +58,19 @@ class TreeNode(object):
         if dynamic:
             self._enable_dynamic(dynamic)
 
+    # Functions receiving every event raised in the tree (root node only)
+    _listeners = ()
+    # Journal recording observer notifications (root node only)
+    _journal = None
+    # Timeout, in seconds, of remote calls made by the tree (root node only)
+    _call_timeout = None
+    # Retrier of the tree's pending nodes (root node only)
+    _pending_retrier = None
+    # Negative cache of unreachable endpoints (root node only)
+    _unreachable = None
+    # Limits on the calls made to each endpoint (root node only)
+    _host_policy = None
+
     def __str__(self):
         '''Get this node as a string.'''
         with self._mutex:
@@ -67,7 +80,8 @@ class TreeNode(object):
                 result += str(self._children[child])
         return result
 
-    def add_callback(self, event, cb, args=None):
+    def add_callback(self, event, cb, args=None, threaded=False,
+            max_queue=100, executor=None):
         '''Add a callback to this node.
 
         Callbacks are called when the specified event occurs. The available
@@ -81,10 +95,59 @@ class TreeNode(object):
         relevant information for the event, and cb_args are the arguments you
         registered with the callback.
 
+        Any number of callbacks may be registered for an event. By default, a
+        callback is called in the thread that raised the event, which for
+        dynamic nodes is the ORB thread serving the observer; a slow callback
+        will delay the delivery of all later events. To avoid this, set
+        threaded to True to have the callback called in its own worker thread.
+        Events waiting for a slow threaded callback are queued, up to
+        max_queue events, after which the oldest queued events are discarded.
+        The worker thread is stopped when the callback is removed, or when the
+        node is removed from the tree (e.g. when its parent is reparsed).
+        Alternatively, pass a rtctree.dispatch.CallbackWorker as executor to
+        share a worker between several callbacks.
+
+        @param event The name of the event.
+        @param cb The callback function.
+        @param args The value to pass to the callback as cb_args.
+        @param threaded Call the callback in a dedicated worker thread.
+        @param max_queue The maximum number of events to queue for a threaded
+                         callback.
+        @param executor A CallbackWorker to call the callback in.
+        @raises NoSuchEventError
+
         '''
         if event not in self._cbs:
-            raise exceptions.NoSuchEventError
-        self._cbs[event] = [(cb, args)]
+            raise NoSuchEventError(self.name, event)
+        own_executor = False
+        if not executor and threaded:
+            executor = CallbackWorker(max_queue=max_queue,
+                    name='rtctree-cb-{0}-{1}'.format(self.name, event))
+            own_executor = True
+        sub = Subscriber(cb, args, executor=executor,
+                own_executor=own_executor)
+        with self._mutex:
+            # Replace the list so that _call_cb can iterate it unlocked
+            self._cbs[event] = self._cbs[event] + [sub]
+
+    def callback_stats(self, event=None):
+        '''Get statistics about the calls made to this node's callbacks.
+
+        @param event The name of the event to get statistics for. If None,
+                     statistics for all events are returned.
+        @return A list of (event, callback, stats) tuples, where stats is the
+                dictionary described by rtctree.dispatch.Subscriber.stats.
+        @raises NoSuchEventError
+
+        '''
+        if event is None:
+            events = list(self._cbs.keys())
+        elif event not in self._cbs:
+            raise NoSuchEventError(self.name, event)
+        else:
+            events = [event]
+        return [(e, sub.callback, sub.stats) for e in events \
+                for sub in self._cbs[e]]
 
     def get_node(self, path):
         '''Get a child node of this node, or this node, based on a path.
@@ -157,40 +220,49 @@ class TreeNode(object):
 
         '''
         with self._mutex:
-            result = []
-            if filter:
-                filters_passed = True
-                for f in filter:
-                    if type(f) == str:
-                        if not eval('self.' + f):
-                            filters_passed = False
-                            break
-                    else:
-                        if not f(self):
-                            filters_passed = False
-                            break
-                if filters_passed:
-                    result = [func(self, args)]
-            else:
+            children = [self._children[child] for child in self._children]
+        # The function and filters may read properties that are fetched
+        # remotely, so they are called without holding the lock
+        result = []
+        if filter:
+            filters_passed = True
+            for f in filter:
+                if type(f) == str:
+                    if not eval('self.' + f):
+                        filters_passed = False
+                        break
+                else:
+                    if not f(self):
+                        filters_passed = False
+                        break
+            if filters_passed:
                 result = [func(self, args)]
-            for child in self._children:
-                result += self._children[child].iterate(func, args, filter)
+        else:
+            result = [func(self, args)]
+        for child in children:
+            result += child.iterate(func, args, filter)
         return result
 
     def rem_callback(self, event, cb):
         '''Remove a callback from this node.
 
-        The callback is removed from the specified event.
+        The callback is removed from the specified event. If the callback was
+        registered more than once for the event, only the first registration
+        is removed.
 
         @param cb The callback function to remove.
+        @raises NoSuchEventError, NoCBError
 
         '''
         if event not in self._cbs:
-            raise exceptions.NoSuchEventError(self.name, event)
-        c = [(x[0], x[1]) for x in self._cbs[event]]
-        if not c:
-            raise exceptions.NoCBError(self.name, event, cb)
-        self._cbs[event].remove(c[0])
+            raise NoSuchEventError(self.name, event)
+        with self._mutex:
+            subs = [s for s in self._cbs[event] if s.callback == cb]
+            if not subs:
+                raise NoCBError(self.name, event, cb)
+            self._cbs[event] = [s for s in self._cbs[event] \
+                    if s is not subs[0]]
+        subs[0]._release()
 
     @property
     def children(self):
@@ -277,6 +349,11 @@ class TreeNode(object):
         '''Is this node a name server (specialisation of directory nodes)?'''
         return False
 
+    @property
+    def is_pending(self):
+        '''Is this node pending?'''
+        return False
+
     @property
     def is_unknown(self):
         '''Is this node unknown?'''
@@ -330,6 +407,7 @@ class TreeNode(object):
             if child.name not in self._children:
                 raise NotRelatedError(self.name, child.name)
             del self._children[child.name]
+        child._release_callbacks()
 
     @parent.setter
     def parent(self, new_parent):
@@ -358,24 +436,57 @@ class TreeNode(object):
                 return self
 
     def _add_child(self, new_child):
-        # Add a child to this node.
+        # Add a child to this node, replacing any child with the same name.
         with self._mutex:
+            old = self._children.get(new_child._name)
             self._children[new_child._name] = new_child
+        if old is not None and old is not new_child:
+            old._release_callbacks()
+
+    def _add_listener(self, listener):
+        # Add a function to receive every event raised by any node in the
+        # tree. Only used on the root node. The list is replaced rather than
+        # modified so that it can be read without holding the mutex.
+        with self._mutex:
+            self._listeners = list(self._listeners) + [listener]
 
     def _call_cb(self, event, value):
         if event not in self._cbs:
-            raise exceptions.NoSuchEventError(self.name, event)
-        for (cb, args) in self._cbs[event]:
-            cb(self, value, args)
+            raise NoSuchEventError(self.name, event)
+        for sub in self._cbs[event]:
+            sub.dispatch(self, value)
+        # Pass the event on to any tree-wide listeners
+        for listener in self.root._listeners:
+            listener(self, event, value)
 
     def _enable_dynamic(self, enable=True):
         # Enable or disable dynamic features.
         # By default, do nothing.
         pass
 
+    def _rem_listener(self, listener):
+        # Remove a function added with _add_listener.
+        with self._mutex:
+            self._listeners = [l for l in self._listeners if l != listener]
+
+    def _release_callbacks(self):
+        # Stop the workers of the threaded callbacks of this node and its
+        # children, which are no longer needed once the node is discarded
+        # from the tree.
+        with self._mutex:
+            subs = [s for event in self._cbs.values() for s in event]
+            children = list(self._children.values())
+        for sub in subs:
+            sub._release()
+        for child in children:
+            child._release_callbacks()
+
     def _remove_all_children(self):
         # Remove all children from this node.
+        old = self._children
         self._children = {}
+        for child in old.values():
+            child._release_callbacks()
 
     def _set_events(self, events):
         self._cbs = {}
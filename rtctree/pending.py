@@ -0,0 +1,295 @@
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''rtctree
+
+Copyright (C) 2009-2014
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Pending nodes, discovery time budgets, and the background retry of pending
+nodes.
+
+'''
+
+
+import heapq
+import threading
+import time
+
+from rtctree.exceptions import *
+from rtctree.node import TreeNode
+
+
+##############################################################################
+## Pending node object
+
+class Pending(TreeNode):
+    '''Node representing an object that has not yet been resolved.
+
+    Pending nodes occur below name server and directory nodes, in place of
+    objects that could not be resolved before the discovery time budget ran
+    out, or whose remote calls timed out. They cannot contain any children.
+    A pending node is retried in the background and, once its object has
+    been resolved, is replaced in its parent by the correct type of node.
+
+    '''
+    def __init__(self, name, parent, binding, filter=[], reason='',
+            attempts=0, *args, **kwargs):
+        '''Constructor.
+
+        @param name Name of this object (i.e. its entry in the path).
+        @param parent The parent node of this node.
+        @param binding The naming service binding of the object.
+        @param filter The filter to apply when the object is resolved.
+        @param reason Why the object was not resolved.
+        @param attempts The number of times resolving the object has failed.
+
+        '''
+        super(Pending, self).__init__(name=name, parent=parent, *args,
+                **kwargs)
+        self._binding = binding
+        self._filter = filter
+        self._reason = reason
+        self._attempts = attempts
+
+    @property
+    def attempts(self):
+        '''The number of times resolving the object has failed.'''
+        return self._attempts
+
+    @property
+    def binding(self):
+        '''The naming service binding of the object.'''
+        return self._binding
+
+    @property
+    def is_pending(self):
+        '''Is this node pending?'''
+        return True
+
+    @property
+    def reason(self):
+        '''Why the object has not been resolved.'''
+        return self._reason
+
+    ###########################################################################
+    # Internal API
+
+    def _add_child(self):
+        # Pending nodes cannot contain children.
+        raise CannotHoldChildrenError
+
+
+##############################################################################
+## Discovery budget object
+
+class DiscoveryBudget(object):
+    '''The time remaining for the discovery of a naming service tree.
+
+    A budget is shared by all the directories parsed while building a tree.
+    Once it has run out, the remaining objects are added as pending nodes
+    rather than being resolved.
+
+    '''
+    def __init__(self, time_budget=None, *args, **kwargs):
+        '''Constructor.
+
+        @param time_budget The maximum time, in seconds, to spend resolving
+                           objects. If None, there is no limit, but objects
+                           whose calls time out are still added as pending
+                           nodes.
+
+        '''
+        super(DiscoveryBudget, self).__init__(*args, **kwargs)
+        self._mutex = threading.Lock()
+        if time_budget is None:
+            self._deadline = None
+        else:
+            self._deadline = time.time() + time_budget
+        self._pending = []
+
+    @property
+    def deadline(self):
+        '''The time the budget runs out, or None.'''
+        return self._deadline
+
+    @property
+    def expired(self):
+        '''Has the budget run out?'''
+        return self._deadline is not None and time.time() >= self._deadline
+
+    @property
+    def pending(self):
+        '''The pending nodes added during the discovery.'''
+        with self._mutex:
+            return list(self._pending)
+
+    @property
+    def remaining(self):
+        '''The time remaining, in seconds, or None if there is no limit.'''
+        if self._deadline is None:
+            return None
+        return max(self._deadline - time.time(), 0.0)
+
+    def _add_pending(self, node):
+        with self._mutex:
+            self._pending.append(node)
+
+
+##############################################################################
+## Pending node retrier object
+
+class PendingRetrier(object):
+    '''Retries the pending nodes of a tree in a background thread.
+
+    Do not create this class directly. It is created by RTCTree when pending
+    nodes are first added to the tree.
+
+    Each pending node is retried after a delay that doubles after every
+    failure, up to a maximum. Each attempt is limited by a deadline so that
+    a hung object cannot stall the retries of the others. When an attempt
+    succeeds, the pending node is replaced by the resolved node; when it
+    times out, a new pending node with a higher attempt count takes its
+    place. An attempt that fails with any other error is counted in failed
+    and the node is retried again later.
+
+    '''
+    def __init__(self, retry_delay=1.0, max_delay=60.0, attempt_timeout=5.0,
+            *args, **kwargs):
+        '''Constructor.
+
+        @param retry_delay The delay, in seconds, before the first retry.
+        @param max_delay The maximum delay, in seconds, between retries.
+        @param attempt_timeout The maximum time, in seconds, that resolving a
+                               pending node may take.
+
+        '''
+        super(PendingRetrier, self).__init__(*args, **kwargs)
+        self._retry_delay = retry_delay
+        self._max_delay = max_delay
+        self._attempt_timeout = attempt_timeout
+        self._cond = threading.Condition(threading.Lock())
+        # (due time, sequence number, node)
+        self._queue = []
+        self._seq = 0
+        self._resolved = 0
+        self._failed = 0
+        self._stopped = False
+        self._thread = None
+
+    def add(self, node):
+        '''Schedule a pending node to be retried.'''
+        delay = min(self._retry_delay * 2 ** node.attempts, self._max_delay)
+        with self._cond:
+            self._seq += 1
+            heapq.heappush(self._queue, (time.time() + delay, self._seq, node))
+            if not self._thread and not self._stopped:
+                self._thread = threading.Thread(target=self._run,
+                        name='rtctree-pending-retrier')
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify()
+
+    def retry_now(self):
+        '''Retry every pending node as soon as possible.'''
+        with self._cond:
+            self._queue = [(0, seq, node) for due, seq, node in self._queue]
+            heapq.heapify(self._queue)
+            self._cond.notify()
+
+    def stop(self, wait=True):
+        '''Stop retrying pending nodes.
+
+        @param wait If True, wait for the current attempt to finish.
+
+        '''
+        with self._cond:
+            self._stopped = True
+            thread = self._thread
+            self._cond.notify()
+        if wait and thread and threading.current_thread() is not thread:
+            thread.join()
+
+    @property
+    def pending(self):
+        '''The pending nodes waiting to be retried.'''
+        with self._cond:
+            return [node for due, seq, node in sorted(self._queue)]
+
+    @property
+    def resolved(self):
+        '''The number of pending nodes that have been resolved.'''
+        with self._cond:
+            return self._resolved
+
+    @property
+    def failed(self):
+        '''The number of attempts that failed with an error other than a
+        timeout.'''
+        with self._cond:
+            return self._failed
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if self._queue:
+                        wait = self._queue[0][0] - time.time()
+                        if wait <= 0:
+                            break
+                    else:
+                        wait = None
+                    self._cond.wait(wait)
+                if self._stopped:
+                    self._thread = None
+                    return
+                due, seq, node = heapq.heappop(self._queue)
+            parent = node._parent
+            if parent is None:
+                # Removed from the tree
+                continue
+            budget = DiscoveryBudget(time_budget=self._attempt_timeout)
+            try:
+                resolved = parent._retry_pending(node, budget)
+            except Exception:
+                # Retry it later, backing off as for a timeout
+                with self._cond:
+                    self._failed += 1
+                node._attempts += 1
+                self.add(node)
+                continue
+            for new_node in budget.pending:
+                self.add(new_node)
+            if resolved:
+                with self._cond:
+                    self._resolved += 1
+
+
+def schedule_pending(root, nodes):
+    '''Schedule pending nodes to be retried by the retrier of their tree.
+
+    The retrier is created when it is first needed.
+
+    @param root The root node of the tree.
+    @param nodes The pending nodes.
+
+    '''
+    if not nodes:
+        return
+    with root._mutex:
+        if root._pending_retrier is None:
+            root._pending_retrier = PendingRetrier()
+        retrier = root._pending_retrier
+    for node in nodes:
+        retrier.add(node)
+
+
+# vim: tw=79
+
@@ -24,10 +24,11 @@ create the correct type of port object automatically.
 
 
 import RTC
-import threading
 
 from rtctree.exceptions import *
-from rtctree.utils import build_attr_string, dict_to_nvlist, nvlist_to_dict
+from rtctree.instrument import remote, TimedLock
+from rtctree.utils import build_attr_string, dict_to_nvlist, nvlist_to_dict, \
+        nvlist_to_shared_dict, LazyValue
 
 
 ##############################################################################
@@ -44,7 +45,7 @@ def parse_port(port_obj, owner):
     @return The created port object.
 
     '''
-    profile = port_obj.get_port_profile()
+    profile = remote(port_obj, owner).get_port_profile()
     props = nvlist_to_dict(profile.properties)
     if props['port.port_type'] == 'DataInPort':
         return DataInPort(port_obj, owner)
@@ -75,9 +76,10 @@ class Port(object):
         '''
         super(Port, self).__init__(*args, **kwargs)
         self._obj = port_obj
-        self._connections = None
+        self._connections = LazyValue(lambda: [Connection(cp, self) \
+                for cp in remote(self._obj, self).get_connector_profiles()])
         self._owner = owner
-        self._mutex = threading.RLock()
+        self._mutex = TimedLock(type(self).__name__)
         self._parse()
 
     def connect(self, dests=[], name=None, id='', props={}):
@@ -96,84 +98,77 @@ class Port(object):
         @raises IncompatibleDataPortConnectionPropsError, FailedToConnectError
 
         '''
-        with self._mutex:
-            if self.porttype == 'DataInPort' or self.porttype == 'DataOutPort':
-                for prop in props:
-                    if prop in self.properties:
-                        if props[prop] not in [x.strip() for x in self.properties[prop].split(',')] and \
-                                'any' not in self.properties[prop].lower():
+        if self.porttype == 'DataInPort' or self.porttype == 'DataOutPort':
+            for prop in props:
+                if prop in self.properties:
+                    if props[prop] not in [x.strip() for x in self.properties[prop].split(',')] and \
+                            'any' not in self.properties[prop].lower():
+                        # Invalid property selected
+                        raise IncompatibleDataPortConnectionPropsError
+                for d in dests:
+                    if prop in d.properties:
+                        if props[prop] not in [x.strip() for x in d.properties[prop].split(',')] and \
+                                'any' not in d.properties[prop].lower():
                             # Invalid property selected
                             raise IncompatibleDataPortConnectionPropsError
-                    for d in dests:
-                        if prop in d.properties:
-                            if props[prop] not in [x.strip() for x in d.properties[prop].split(',')] and \
-                                    'any' not in d.properties[prop].lower():
-                                # Invalid property selected
-                                raise IncompatibleDataPortConnectionPropsError
-            if not name:
-                name = self.name + '_'.join([d.name for d in dests])
-            props = dict_to_nvlist(props)
-            profile = RTC.ConnectorProfile(name, id,
-                    [self._obj] + [d._obj for d in dests], props)
-            return_code, profile = self._obj.connect(profile)
-            if return_code != RTC.RTC_OK:
-                raise FailedToConnectError(return_code)
-            self.reparse_connections()
-            for d in dests:
-                d.reparse_connections()
+        if not name:
+            name = self.name + '_'.join([d.name for d in dests])
+        props = dict_to_nvlist(props)
+        profile = RTC.ConnectorProfile(name, id,
+                [self._obj] + [d._obj for d in dests], props)
+        return_code, profile = remote(self._obj, self).connect(profile)
+        if return_code != RTC.RTC_OK:
+            raise FailedToConnectError(return_code)
+        self.reparse_connections()
+        for d in dests:
+            d.reparse_connections()
 
     def disconnect_all(self):
         '''Disconnect all connections to this port.'''
-        with self._mutex:
-            for conn in self.connections:
-                self.object.disconnect(conn.id)
-            self.reparse_connections()
+        for conn in self.connections:
+            remote(self.object, self).disconnect(conn.id)
+        self.reparse_connections()
 
     def get_connection_by_dest(self, dest):
         '''DEPRECATED. Search for a connection between this and another port.'''
-        with self._mutex:
-            for conn in self.connections:
-                if conn.has_port(self) and conn.has_port(dest):
-                    return conn
-            return None
+        for conn in self.connections:
+            if conn.has_port(self) and conn.has_port(dest):
+                return conn
+        return None
 
     def get_connections_by_dest(self, dest):
         '''Search for all connections between this and another port.'''
-        with self._mutex:
-            res = []
-            for c in self.connections:
-                if c.has_port(self) and c.has_port(dest):
-                    res.append(c)
-            return res
+        res = []
+        for c in self.connections:
+            if c.has_port(self) and c.has_port(dest):
+                res.append(c)
+        return res
 
     def get_connections_by_dests(self, dests):
         '''Search for all connections involving this and all other ports.'''
-        with self._mutex:
-            res = []
-            for c in self.connections:
-                if not c.has_port(self):
+        res = []
+        for c in self.connections:
+            if not c.has_port(self):
+                continue
+            for d in dests:
+                if not c.has_port(d):
                     continue
-                for d in dests:
-                    if not c.has_port(d):
-                        continue
-                res.append(c)
-            return res
+            res.append(c)
+        return res
 
     def get_connection_by_id(self, id):
         '''Search for a connection on this port by its ID.'''
-        with self._mutex:
-            for conn in self.connections:
-                if conn.id == id:
-                    return conn
-            return None
+        for conn in self.connections:
+            if conn.id == id:
+                return conn
+        return None
 
     def get_connection_by_name(self, name):
         '''Search for a connection to or from this port by name.'''
-        with self._mutex:
-            for conn in self.connections:
-                if conn.name == name:
-                    return conn
-            return None
+        for conn in self.connections:
+            if conn.name == name:
+                return conn
+        return None
 
     def reparse(self):
         '''Reparse the port.'''
@@ -182,8 +177,7 @@ class Port(object):
 
     def reparse_connections(self):
         '''Reparse the connections this port is involved in.'''
-        with self._mutex:
-            self._connections = None
+        self._connections.reset()
 
     @property
     def connections(self):
@@ -195,19 +189,14 @@ class Port(object):
         triggered).
 
         '''
-        with self._mutex:
-            if not self._connections:
-                self._connections = [Connection(cp, self) \
-                                     for cp in self._obj.get_connector_profiles()]
-        return self._connections
+        return self._connections.get()
 
     @property
     def is_connected(self):
         '''Check if this port is connected to any other ports.'''
-        with self._mutex:
-            if self.connections:
-                return True
-            return False
+        if self.connections:
+            return True
+        return False
 
     @property
     def name(self):
@@ -243,15 +232,18 @@ class Port(object):
             return self._properties
 
     def _parse(self):
-        # Parse the PortService object to build a port profile.
+        # Parse the PortService object to build a port profile. The profile
+        # is fetched before taking the lock, which is only held to install it.
+        profile = remote(self._obj, self).get_port_profile()
+        name = profile.name
+        properties = nvlist_to_shared_dict(profile.properties)
+        if self.owner:
+            prefix = self.owner.instance_name + '.'
+            if name.startswith(prefix):
+                name = name[len(prefix):]
         with self._mutex:
-            profile = self._obj.get_port_profile()
-            self._name = profile.name
-            self._properties = nvlist_to_dict(profile.properties)
-            if self.owner:
-                prefix = self.owner.instance_name + '.'
-                if self._name.startswith(prefix):
-                    self._name = self._name[len(prefix):]
+            self._name = name
+            self._properties = properties
 
 
 ##############################################################################
@@ -291,26 +283,25 @@ class DataPort(Port):
 
         '''
         # Data ports can only connect to opposite data ports
-        with self._mutex:
-            new_props = props.copy()
-            ptypes = [d.porttype for d in dests]
-            if self.porttype == 'DataInPort':
-                if 'DataOutPort' not in ptypes:
-                    raise WrongPortTypeError
-            if self.porttype == 'DataOutPort':
-                if 'DataInPort' not in ptypes:
-                    raise WrongPortTypeError
-            if 'dataport.dataflow_type' not in new_props:
-                new_props['dataport.dataflow_type'] = 'push'
-            if 'dataport.interface_type' not in new_props:
-                new_props['dataport.interface_type'] = 'corba_cdr'
-            if 'dataport.subscription_type' not in new_props:
-                new_props['dataport.subscription_type'] = 'new'
-            if 'dataport.data_type' not in new_props:
-                new_props['dataport.data_type'] = \
-                        self.properties['dataport.data_type']
-            super(DataPort, self).connect(dests=dests, name=name, id=id,
-                                          props=new_props)
+        new_props = props.copy()
+        ptypes = [d.porttype for d in dests]
+        if self.porttype == 'DataInPort':
+            if 'DataOutPort' not in ptypes:
+                raise WrongPortTypeError
+        if self.porttype == 'DataOutPort':
+            if 'DataInPort' not in ptypes:
+                raise WrongPortTypeError
+        if 'dataport.dataflow_type' not in new_props:
+            new_props['dataport.dataflow_type'] = 'push'
+        if 'dataport.interface_type' not in new_props:
+            new_props['dataport.interface_type'] = 'corba_cdr'
+        if 'dataport.subscription_type' not in new_props:
+            new_props['dataport.subscription_type'] = 'new'
+        if 'dataport.data_type' not in new_props:
+            new_props['dataport.data_type'] = \
+                    self.properties['dataport.data_type']
+        super(DataPort, self).connect(dests=dests, name=name, id=id,
+                                      props=new_props)
 
 
 class DataInPort(DataPort):
@@ -350,7 +341,8 @@ class CorbaPort(Port):
         '''
         super(CorbaPort, self).__init__(port_obj=port_obj, owner=owner,
                                         *args, **kwargs)
-        self._interfaces = None
+        self._interfaces = LazyValue(lambda: [SvcInterface(intf) for intf in \
+                remote(self._obj, self).get_port_profile().interfaces])
 
     def connect(self, dests=None, name=None, id='', props={}):
         '''Connect this port to other CorbaPorts.
@@ -369,44 +361,42 @@ class CorbaPort(Port):
                 MismatchedPolarityError
 
         '''
-        with self._mutex:
-            # Corba ports can only connect to corba ports of the opposite
-            # polarity
+        # Corba ports can only connect to corba ports of the opposite
+        # polarity
+        for d in dests:
+            if not d.porttype == 'CorbaPort':
+                raise WrongPortTypeError
+        # Check the interfaces and their respective polarities match
+        if self.interfaces:
             for d in dests:
-                if not d.porttype == 'CorbaPort':
-                    raise WrongPortTypeError
-            # Check the interfaces and their respective polarities match
-            if self.interfaces:
-                for d in dests:
-                    if not d.interfaces:
-                        raise MismatchedInterfacesError
-                for intf in self.interfaces:
-                    for d in dests:
-                        match = d.get_interface_by_instance_name(
-                                    intf.instance_name)
-                        if not match:
-                            raise MismatchedInterfacesError
-                        if intf.polarity == match.polarity:
-                            # Polarity should be opposite
-                            raise MismatchedPolarityError
-            else:
+                if not d.interfaces:
+                    raise MismatchedInterfacesError
+            for intf in self.interfaces:
                 for d in dests:
-                    if d.interfaces:
+                    match = d.get_interface_by_instance_name(
+                                intf.instance_name)
+                    if not match:
                         raise MismatchedInterfacesError
-            # Make the connection
-            new_props = props.copy()
-            if 'port.port_type' not in new_props:
-                new_props['port.port_type'] = 'CorbaPort'
-            super(CorbaPort, self).connect(dests=dests, name=name, id=id,
-                                           props=new_props)
+                    if intf.polarity == match.polarity:
+                        # Polarity should be opposite
+                        raise MismatchedPolarityError
+        else:
+            for d in dests:
+                if d.interfaces:
+                    raise MismatchedInterfacesError
+        # Make the connection
+        new_props = props.copy()
+        if 'port.port_type' not in new_props:
+            new_props['port.port_type'] = 'CorbaPort'
+        super(CorbaPort, self).connect(dests=dests, name=name, id=id,
+                                       props=new_props)
 
     def get_interface_by_instance_name(self, name):
         '''Get an interface of this port by instance name.'''
-        with self._mutex:
-            for intf in self.interfaces:
-                if intf.instance_name == name:
-                    return intf
-            return None
+        for intf in self.interfaces:
+            if intf.instance_name == name:
+                return intf
+        return None
 
     @property
     def interfaces(self):
@@ -418,12 +408,7 @@ class CorbaPort(Port):
         triggered).
 
         '''
-        with self._mutex:
-            if not self._interfaces:
-                profile = self._obj.get_port_profile()
-                self._interfaces = [SvcInterface(intf) \
-                                    for intf in profile.interfaces]
-        return self._interfaces
+        return self._interfaces.get()
 
 
 ##############################################################################
@@ -439,7 +424,7 @@ class SvcInterface(object):
         '''
         super(SvcInterface, self).__init__(*args, **kwargs)
         self._obj = intf_obj
-        self._mutex = threading.RLock()
+        self._mutex = TimedLock(type(self).__name__)
         self._parse()
 
     def polarity_as_string(self, add_colour=True):
@@ -523,30 +508,31 @@ class Connection(object):
         super(Connection, self).__init__(*args, **kwargs)
         self._obj = conn_profile_obj
         self._owner = owner
-        self._mutex = threading.RLock()
+        self._mutex = TimedLock(type(self).__name__)
+        self._ports = LazyValue(self._fetch_ports)
         self._parse()
 
     def __str__(self):
         return 'Connection {0} (ID: {1}), properties {2}, with ports '\
-            '{3}'.format(self._name, self._id, self._properties, self._ports)
+            '{3}'.format(self._name, self._id, self._properties,
+                    self._ports.peek())
 
     def disconnect(self):
         '''Disconnect this connection.'''
-        with self._mutex:
-            if not self.ports:
-                raise NotConnectedError
-            # Some of the connection participants may not be in the tree,
-            # causing the port search in self.ports to return ('Unknown', None)
-            # for those participants. Search the list to find the first
-            # participant that is in the tree (there must be at least one).
-            p = self.ports[0][1]
-            ii = 1
-            while not p and ii < len(self.ports):
-                p = self.ports[ii][1]
-                ii += 1
-            if not p:
-                raise UnknownConnectionOwnerError
-            p.object.disconnect(self.id)
+        if not self.ports:
+            raise NotConnectedError
+        # Some of the connection participants may not be in the tree,
+        # causing the port search in self.ports to return ('Unknown', None)
+        # for those participants. Search the list to find the first
+        # participant that is in the tree (there must be at least one).
+        p = self.ports[0][1]
+        ii = 1
+        while not p and ii < len(self.ports):
+            p = self.ports[ii][1]
+            ii += 1
+        if not p:
+            raise UnknownConnectionOwnerError
+        remote(p.object, self).disconnect(self.id)
 
     def has_port(self, port):
         '''Return True if this connection involves the given Port object.
@@ -554,14 +540,13 @@ class Connection(object):
         @param port The Port object to search for in this connection's ports.
 
         '''
-        with self._mutex:
-            for p in self.ports:
-                if not p[1]:
-                    # Port owner not in tree, so unknown
-                    continue
-                if port.object._is_equivalent(p[1].object):
-                    return True
-            return False
+        for p in self.ports:
+            if not p[1]:
+                # Port owner not in tree, so unknown
+                continue
+            if port.object._is_equivalent(p[1].object):
+                return True
+        return False
 
     def reparse(self):
         '''Reparse the connection.'''
@@ -607,35 +592,7 @@ class Connection(object):
         triggered).
 
         '''
-        def has_port(node, args):
-            if node.get_port_by_ref(args):
-                return node
-            return None
-
-        with self._mutex:
-            if not self._ports:
-                self._ports = []
-                for p in self._obj.ports:
-                    # My owner's owner is a component node in the tree
-                    if self.owner and self.owner.owner:
-                        root = self.owner.owner.root
-                        owner_nodes = [n for n in root.iterate(has_port,
-                                args=p, filter=['is_component']) if n]
-                        if not owner_nodes:
-                            self._ports.append(('Unknown', None))
-                        else:
-                            port_owner = owner_nodes[0]
-                            port_owner_path = port_owner.full_path_str
-                            port_name = p.get_port_profile().name
-                            prefix = port_owner.instance_name + '.'
-                            if port_name.startswith(prefix):
-                                port_name = port_name[len(prefix):]
-                            self._ports.append((port_owner_path + ':' + \
-                                port_name, parse_port(p, self.owner.owner)))
-                    else:
-                        self._ports.append((p.get_port_profile().name,
-                                            parse_port(p, None)))
-        return self._ports
+        return self._ports.get()
 
     @property
     def properties(self):
@@ -648,8 +605,38 @@ class Connection(object):
         with self._mutex:
             self._name = self._obj.name
             self._id = self._obj.connector_id
-            self._ports = None
-            self._properties = nvlist_to_dict(self._obj.properties)
+            self._properties = nvlist_to_shared_dict(self._obj.properties)
+        self._ports.reset()
+
+    def _fetch_ports(self):
+        # Find the ports involved in this connection
+        def has_port(node, args):
+            if node.get_port_by_ref(args):
+                return node
+            return None
+
+        ports = []
+        for p in self._obj.ports:
+            # My owner's owner is a component node in the tree
+            if self.owner and self.owner.owner:
+                root = self.owner.owner.root
+                owner_nodes = [n for n in root.iterate(has_port,
+                        args=p, filter=['is_component']) if n]
+                if not owner_nodes:
+                    ports.append(('Unknown', None))
+                else:
+                    port_owner = owner_nodes[0]
+                    port_owner_path = port_owner.full_path_str
+                    port_name = remote(p, self).get_port_profile().name
+                    prefix = port_owner.instance_name + '.'
+                    if port_name.startswith(prefix):
+                        port_name = port_name[len(prefix):]
+                    ports.append((port_owner_path + ':' + \
+                        port_name, parse_port(p, self.owner.owner)))
+            else:
+                port_name = remote(p, self).get_port_profile().name
+                ports.append((port_name, parse_port(p, None)))
+        return ports
 
 
 # vim: tw=79
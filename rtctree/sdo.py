@@ -23,64 +23,117 @@ import RTC
 import SDOPackage
 
 
+##############################################################################
+## API functions
+
+def parse_status(target, kind, hint):
+    '''Parse a status notification sent to an observer.
+
+    @param target The Component node the notification is about.
+    @param kind The kind of notification, as a string (e.g. 'RTC_STATUS').
+    @param hint The notification's hint string.
+    @return A tuple of the name of the event the notification raises on the
+            target (e.g. 'rtc_status') and that event's value, or None if the
+            kind of notification is not known.
+
+    '''
+    if kind == 'COMPONENT_PROFILE':
+        return 'component_profile', [x.strip() for x in hint.split(',')]
+    elif kind == 'RTC_STATUS':
+        status, ec_handle = hint.split(':')
+        if status == 'INACTIVE':
+            status = target.INACTIVE
+        elif status == 'ACTIVE':
+            status = target.ACTIVE
+        elif status == 'ERROR':
+            status = target.ERROR
+        return 'rtc_status', (int(ec_handle), status)
+    elif kind == 'EC_STATUS':
+        event, ec_handle = hint.split(':')
+        if event == 'ATTACHED':
+            event = target.EC_ATTACHED
+        elif event == 'DETACHED':
+            event = target.EC_DETACHED
+        elif event == 'RATE_CHANGED':
+            event = target.EC_RATE_CHANGED
+        elif event == 'STARTUP':
+            event = target.EC_STARTUP
+        elif event == 'SHUTDOWN':
+            event = target.EC_SHUTDOWN
+        return 'ec_event', (int(ec_handle), event)
+    elif kind == 'PORT_PROFILE':
+        event, port_name = hint.split(':')
+        if event == 'ADD':
+            event = target.PORT_ADD
+        elif event == 'REMOVE':
+            event = target.PORT_REMOVE
+        elif event == 'CONNECT':
+            event = target.PORT_CONNECT
+        elif event == 'DISCONNECT':
+            event = target.PORT_DISCONNECT
+        return 'port_event', (port_name, event)
+    elif kind == 'CONFIGURATION':
+        event, arg = hint.split(':')
+        if event == 'UPDATE_CONFIGSET':
+            event = target.CFG_UPDATE_SET
+        elif event == 'UPDATE_PARAMETER':
+            event = target.CFG_UPDATE_PARAM
+        elif event == 'SET_CONFIG_SET':
+            event = target.CFG_SET_SET
+        elif event == 'ADD_CONFIG_SET':
+            event = target.CFG_ADD_SET
+        elif event == 'REMOVE_CONFIG_SET':
+            event = target.CFG_REMOVE_SET
+        elif event == 'ACTIVATE_CONFIG_SET':
+            event = target.CFG_ACTIVATE_SET
+        return 'config_event', (arg, event)
+    elif kind == 'HEARTBEAT':
+        return 'heartbeat', None
+    return None
+
+
+def apply_status(target, kind, hint):
+    '''Apply a status notification sent to an observer to its target.
+
+    The target node is updated and its callbacks are called, exactly as if
+    the notification had been received by the target's observer.
+
+    @param target The Component node the notification is about.
+    @param kind The kind of notification, as a string (e.g. 'RTC_STATUS').
+    @param hint The notification's hint string.
+
+    '''
+    parsed = parse_status(target, kind, hint)
+    if not parsed:
+        return
+    event, value = parsed
+    if event == 'component_profile':
+        target._profile_update(value)
+    elif event == 'rtc_status':
+        target._set_state_in_ec(value[0], value[1])
+    elif event == 'ec_event':
+        target._ec_event(value[0], value[1])
+    elif event == 'port_event':
+        target._port_event(value[0], value[1])
+    elif event == 'config_event':
+        target._config_event(value[0], value[1])
+    elif event == 'heartbeat':
+        target._heartbeat()
+
+
+##############################################################################
+## SDO service objects
+
 class RTCObserver(OpenRTM__POA.ComponentObserver):
     def __init__(self, target):
         self._tgt = target
 
     def update_status(self, kind, hint):
         kind = str(kind)
-        if kind == 'COMPONENT_PROFILE':
-            self._tgt._profile_update([x.strip() for x in hint.split(',')])
-        elif kind == 'RTC_STATUS':
-            status, ec_handle = hint.split(':')
-            if status == 'INACTIVE':
-                status = self._tgt.INACTIVE
-            elif status == 'ACTIVE':
-                status = self._tgt.ACTIVE
-            elif status == 'ERROR':
-                status = self._tgt.ERROR
-            self._tgt._set_state_in_ec(int(ec_handle), status)
-        elif kind == 'EC_STATUS':
-            event, ec_handle = hint.split(':')
-            if event == 'ATTACHED':
-                event = self._tgt.EC_ATTACHED
-            elif event == 'DETACHED':
-                event = self._tgt.EC_DETACHED
-            elif event == 'RATE_CHANGED':
-                event = self._tgt.EC_RATE_CHANGED
-            elif event == 'STARTUP':
-                event = self._tgt.EC_STARTUP
-            elif event == 'SHUTDOWN':
-                event = self._tgt.EC_SHUTDOWN
-            self._tgt._ec_event(int(ec_handle), event)
-        elif kind == 'PORT_PROFILE':
-            event, port_name = hint.split(':')
-            if event == 'ADD':
-                event = self._tgt.PORT_ADD
-            elif event == 'REMOVE':
-                event = self._tgt.PORT_REMOVE
-            elif event == 'CONNECT':
-                event = self._tgt.PORT_CONNECT
-            elif event == 'DISCONNECT':
-                event = self._tgt.PORT_DISCONNECT
-            self._tgt._port_event(port_name, event)
-        elif kind == 'CONFIGURATION':
-            event, arg = hint.split(':')
-            if event == 'UPDATE_CONFIGSET':
-                event = self._tgt.CFG_UPDATE_SET
-            elif event == 'UPDATE_PARAMETER':
-                event = self._tgt.CFG_UPDATE_PARAM
-            elif event == 'SET_CONFIG_SET':
-                event = self._tgt.CFG_SET_SET
-            elif event == 'ADD_CONFIG_SET':
-                event = self._tgt.CFG_ADD_SET
-            elif event == 'REMOVE_CONFIG_SET':
-                event = self._tgt.CFG_REMOVE_SET
-            elif event == 'ACTIVATE_CONFIG_SET':
-                event = self._tgt.CFG_ACTIVATE_SET
-            self._tgt._config_event(arg, event)
-        elif kind == 'HEARTBEAT':
-            self._tgt._heartbeat()
+        journal = self._tgt.root._journal
+        if journal:
+            journal.record(self._tgt.full_path_str, kind, hint)
+        apply_status(self._tgt, kind, hint)
 
 
 class RTCLogger(OpenRTM__POA.Logger):
@@ -90,7 +143,43 @@ class RTCLogger(OpenRTM__POA.Logger):
 
     def publish(self, record):
         ts = record.time.sec + record.time.nsec / 1e9
-        self._cb(self._tgt.name, ts, loggername, level, message)
+        self._cb(self._tgt.name, ts, record.loggername, record.level,
+                record.message)
+
+    def close(self):
+        pass
+
+
+class SharedRTCLogger(OpenRTM__POA.Logger):
+    '''Logger servant shared by many components.
+
+    The servant is activated once for each component, under a different
+    object ID each time, in a POA that allows multiple IDs per servant. The
+    component a record came from is found from the object ID of the current
+    request.
+
+    '''
+    def __init__(self, current, sources, callback):
+        '''Constructor.
+
+        @param current The PortableServer::Current object of the ORB.
+        @param sources A dictionary mapping object IDs to a value identifying
+                       the component the servant was activated for.
+        @param callback A function taking the identifying value of a component
+                        and an OpenRTM.LogRecord.
+
+        '''
+        self._current = current
+        self._sources = sources
+        self._cb = callback
+
+    def publish(self, record):
+        source = self._sources.get(self._current.get_object_id())
+        if source is not None:
+            self._cb(source, record)
+
+    def close(self):
+        pass
 
 
 # vim: tw=79
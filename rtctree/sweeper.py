@@ -0,0 +1,212 @@
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''rtctree
+
+Copyright (C) 2009-2014
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Removal of the registrations of dead objects from name servers.
+
+'''
+
+
+from collections import namedtuple
+import threading
+import time
+
+from rtctree.exceptions import BadPathError
+from rtctree.utils import parallel_map
+
+
+##############################################################################
+## Zombie sweeper object
+
+## The result of one sweep of the zombies in a tree.
+##
+## removed is the list of paths (as strings) of the zombies unbound from their
+## name servers and removed from the tree. revived is the list of paths of
+## zombies whose objects answered again, and which have been replaced in the
+## tree by the correct type of node. waiting is the list of paths of zombies
+## confirmed dead that are still within the grace period, or whose names have
+## been bound to another object since they were probed. errors is a dictionary
+## of paths to the exception raised when probing or unbinding them.
+SweepReport = namedtuple('SweepReport', 'removed revived waiting errors')
+
+
+class ZombieSweeper(object):
+    '''Removes zombies that stay dead from their name servers.
+
+    Each sweep finds the zombie nodes in the tree and probes their objects
+    again, concurrently. Objects that answer are parsed again, replacing the
+    zombie node. Objects that have been dead for longer than the grace period
+    are unbound from their naming contexts, with the names in each context
+    unbound concurrently, and their nodes are removed from the tree. Keeping
+    stale registrations off the name servers keeps listing them fast.
+
+    An object is only taken to be dead if contacting it fails to connect or
+    finds no object; probes are not limited by the tree's host policy, so an
+    endpoint whose circuit is open is contacted anyway. A name is only
+    unbound if it is still bound to the object that was probed.
+
+    The time an object has been dead is counted from when its zombie node was
+    created, and is remembered by path between sweeps, so reparsing a
+    directory does not restart it.
+
+    Sweeps can be made by calling sweep(), or periodically by a background
+    thread.
+
+    '''
+    def __init__(self, root, interval=60.0, grace_period=300.0,
+            max_workers=8, cb=None, *args, **kwargs):
+        '''Constructor.
+
+        @param root The root node of the tree to sweep.
+        @param interval The time, in seconds, between the sweeps made by the
+                        background thread.
+        @param grace_period The time, in seconds, that an object must have
+                            been dead for before it is unbound.
+        @param max_workers The maximum number of probe or unbind calls made at
+                           once.
+        @param cb A function to call with the SweepReport of each sweep made
+                  by the background thread, of the format 'def cb(report)'.
+
+        '''
+        super(ZombieSweeper, self).__init__(*args, **kwargs)
+        self._mutex = threading.RLock()
+        self._root = root
+        self._interval = interval
+        self._grace_period = grace_period
+        self._max_workers = max_workers
+        self._cb = cb
+        # Path -> time the object was first found to be dead
+        self._dead_since = {}
+        self._last_report = None
+        self._stop_flag = threading.Event()
+        self._thread = None
+
+    def start(self):
+        '''Start the background thread that sweeps periodically.'''
+        with self._mutex:
+            if self._thread:
+                return
+            self._stop_flag.clear()
+            self._thread = threading.Thread(target=self._run,
+                    name='rtctree-zombie-sweeper')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        '''Stop the background thread.'''
+        with self._mutex:
+            thread = self._thread
+            self._thread = None
+        if thread:
+            self._stop_flag.set()
+            if threading.current_thread() is not thread:
+                thread.join()
+
+    def sweep(self):
+        '''Sweep the zombies of the tree once.
+
+        @return A SweepReport of what was done.
+
+        '''
+        zombies = self._root.iterate(lambda n, a: (n, n.full_path_str),
+                filter=['is_zombie'])
+        removed = []
+        revived = []
+        waiting = []
+        errors = {}
+        probes = parallel_map(lambda z: z[0]._parent._probe(z[0].name),
+                zombies, max_workers=self._max_workers)
+        now = time.time()
+        # Parent directory -> [(zombie, path)] of the zombies to unbind
+        to_unbind = {}
+        with self._mutex:
+            seen = set()
+            for (zombie, path), (probe, error) in zip(zombies, probes):
+                seen.add(path)
+                if error:
+                    errors[path] = error
+                    continue
+                alive, obj = probe
+                if alive:
+                    continue
+                since = self._dead_since.setdefault(path, zombie.dead_since)
+                if now - since < self._grace_period:
+                    waiting.append(path)
+                else:
+                    to_unbind.setdefault(zombie._parent, []).append(
+                            (zombie, path, obj))
+            # Forget the zombies no longer in the tree
+            for path in list(self._dead_since.keys()):
+                if path not in seen:
+                    del self._dead_since[path]
+        for (zombie, path), (probe, error) in zip(zombies, probes):
+            if not error and probe[0]:
+                try:
+                    if zombie._parent._revive_zombie(zombie):
+                        revived.append(path)
+                except Exception as e:
+                    errors[path] = e
+        for parent, dead in to_unbind.items():
+            results = parallel_map(lambda z: self._unbind(parent, z[0], z[2]),
+                    dead, max_workers=self._max_workers)
+            for (zombie, path, obj), (result, error) in zip(dead, results):
+                if error:
+                    errors[path] = error
+                elif result:
+                    removed.append(path)
+                else:
+                    waiting.append(path)
+        with self._mutex:
+            for path in removed + revived:
+                self._dead_since.pop(path, None)
+            report = SweepReport(removed=removed, revived=revived,
+                    waiting=waiting, errors=errors)
+            self._last_report = report
+        return report
+
+    @property
+    def last_report(self):
+        '''The SweepReport of the last sweep, or None.'''
+        with self._mutex:
+            return self._last_report
+
+    def _run(self):
+        while not self._stop_flag.wait(self._interval):
+            try:
+                report = self.sweep()
+            except Exception:
+                # The tree may be changing; try again next time
+                continue
+            if self._cb:
+                self._cb(report)
+
+    def _unbind(self, parent, zombie, obj):
+        # Unbind a dead object's name and remove its zombie. Returns False,
+        # leaving both, if the name has been bound to another object since
+        # the probe (e.g. the component was restarted).
+        bound = parent._bound_object(zombie.name)
+        if bound:
+            if obj is None or not bound._is_equivalent(obj):
+                return False
+            try:
+                parent.unbind(zombie.name)
+            except BadPathError:
+                # Already unbound by someone else
+                pass
+        parent._remove_zombie(zombie)
+        return True
+
+
+# vim: tw=79
+
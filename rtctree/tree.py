@@ -28,7 +28,17 @@ from rtctree.exceptions import *
 from rtctree.path import BadPathError
 from rtctree.node import TreeNode
 from rtctree.directory import Directory
+from rtctree.endpoints import UnreachableEndpoints
+from rtctree.confsnapshot import take_snapshot
+from rtctree.events import EventStream
+from rtctree.heartbeat import HeartbeatMonitor
+from rtctree import instrument
+from rtctree.journal import EventJournal, replay_journal
+from rtctree.logcollector import LogCollector
+from rtctree.metrics import MetricsExporter
 from rtctree.nameserver import NameServer
+from rtctree.pending import DiscoveryBudget, schedule_pending
+from rtctree.sweeper import ZombieSweeper
 from rtctree.manager import Manager
 from rtctree.component import Component
 from rtctree.utils import filtered, trim_filter
@@ -56,7 +66,9 @@ class RTCTree(object):
 
     '''
     def __init__(self, servers=None, paths=None, orb=None, filter=[],
-            dynamic=False, *args, **kwargs):
+            dynamic=False, stats=False, call_timeout=None,
+            discovery_budget=None, unreachable_ttl=10.0, host_policy=None,
+            *args, **kwargs):
         '''Constructor.
 
         @param servers A list of servers to parse into the tree.
@@ -74,11 +86,39 @@ class RTCTree(object):
                        when a component changes state, an observer can notify
                        RTCTree so that the corresponding object in the tree can
                        be updated. Currently this only affects components.
+        @param stats Enable the instrumentation of remote calls before the
+                     name servers are parsed, so that the calls made while
+                     building the tree are included in stats().
+        @param call_timeout The maximum time, in seconds, that any remote call
+                            made by the tree may take. See set_call_timeout().
+        @param discovery_budget The maximum time, in seconds, to spend parsing
+                                each name server. Objects not resolved within
+                                the budget, or whose calls time out, are added
+                                to the tree as pending nodes and resolved in
+                                the background. If None, there is no limit.
+        @param unreachable_ttl The time, in seconds, to remember an endpoint
+                               (host and port) that could not be connected
+                               to. While it is remembered, objects on that
+                               endpoint are added as zombies without being
+                               contacted, so a crashed host costs one failed
+                               connection rather than one per object. If None
+                               or 0, every object is contacted.
+        @param host_policy A HostPolicy limiting the calls made to each
+                           endpoint. See set_host_policy().
         @raises NonRootPathError
 
         '''
         super(RTCTree, self).__init__()
+        if stats:
+            self.enable_stats()
         self._root = TreeNode('/', None, dynamic=dynamic)
+        self._discovery_budget = discovery_budget
+        if unreachable_ttl:
+            self._root._unreachable = UnreachableEndpoints(unreachable_ttl)
+        if call_timeout is not None:
+            self.set_call_timeout(call_timeout)
+        if host_policy is not None:
+            self.set_host_policy(host_policy)
         self._create_orb(orb)
         self._dynamic = dynamic
         if servers:
@@ -103,6 +143,8 @@ class RTCTree(object):
 
     def __del__(self):
         # Destructor to ensure the ORB shuts down correctly.
+        if self._root._pending_retrier:
+            self._root._pending_retrier.stop(wait=False)
         if self._orb_is_mine:
             self._orb.shutdown(wait_for_completion=CORBA.FALSE)
             self._orb.destroy()
@@ -130,6 +172,113 @@ class RTCTree(object):
             dynamic = self._dynamic
         self._parse_name_server(server, filter, dynamic=dynamic)
 
+    def collect_logs(self, sinks, paths=None, level='NORMAL', filters='ALL',
+            **kwargs):
+        '''Collect the log records of many components into a set of sinks.
+
+        A LogCollector is created and attached to every component in the tree,
+        or only those at or below the given paths. Stop the collector when it
+        is no longer needed.
+
+        @param sinks A list of rtctree.logcollector.LogSink objects to deliver
+                     the records to.
+        @param paths A list of paths (each a list of strings). If given, only
+                     components at or below one of these paths are attached.
+        @param level The maximum level of log records to collect.
+        @param filters Filter the loggers in each component from which to
+                       collect records.
+        @param kwargs Any other arguments are passed to the LogCollector
+                      constructor.
+        @return The rtctree.logcollector.LogCollector object.
+
+        '''
+        def in_paths(node):
+            if not paths:
+                return True
+            path = node.full_path
+            for p in paths:
+                if path[:len(p)] == p:
+                    return True
+            return False
+
+        collector = LogCollector(self._orb, sinks=sinks, **kwargs)
+        self.iterate(lambda n, a: collector.attach(n, level=level,
+            filters=filters), filter=['is_component', in_paths])
+        return collector
+
+    def disable_stats(self):
+        '''Disable the instrumentation of remote calls.
+
+        The statistics recorded so far are discarded.
+
+        '''
+        instrument.disable()
+
+    def enable_stats(self):
+        '''Enable the instrumentation of remote calls.
+
+        Every remote call made by the nodes of the tree is timed and counted
+        by operation name and target host, and exceptions raised by calls are
+        counted. Instrumentation is process-wide: calls made by other trees
+        in the process are also recorded. The time the locks of the nodes,
+        ports and execution contexts are held for is recorded as well (see
+        lock_stats()).
+
+        '''
+        instrument.enable()
+
+    def events(self, events=None, paths=None, filter=None, maxsize=1000,
+            policy=None):
+        '''Get a single stream of the events raised by all nodes in the tree.
+
+        Events raised by any node (for example, the rtc_status events of
+        dynamic components) are delivered to the stream in addition to any
+        callbacks registered on the node. The stream can be read by iterating
+        over it, either in a normal for loop or in an asyncio 'async for'
+        loop. Close the stream when it is no longer needed.
+
+        @param events A list of the event names to receive. If None, the
+                      rtc_status, ec_event, port_event, config_event and
+                      heartbeat events are received.
+        @param paths A list of paths (each a list of strings). If given, only
+                     events from nodes at or below one of these paths will be
+                     received.
+        @param filter A function called with each rtctree.events.Event. If it
+                      returns False, the event is not received.
+        @param maxsize The maximum number of events to buffer.
+        @param policy What to do when the buffer is full. One of
+                      EventStream.DROP_OLDEST (the default),
+                      EventStream.DROP_NEWEST, EventStream.COALESCE and
+                      EventStream.BLOCK.
+        @return An rtctree.events.EventStream object.
+
+        '''
+        return EventStream(self._root, events=events, paths=paths,
+                filter=filter, maxsize=maxsize, policy=policy)
+
+    def export_metrics(self, port=None, address='127.0.0.1'):
+        '''Export health metrics of the tree in the Prometheus text format.
+
+        The exporter walks the tree once, and then keeps the component state
+        counts, zombie count, event counts and heartbeat ages up to date from
+        the events raised by the nodes. Remote call latencies are included if
+        call statistics have been enabled with enable_stats(). Call the
+        exporter's refresh() method after changing the structure of the tree.
+
+        @param port If not None, serve the metrics over HTTP on this port. The
+                    metrics can also be served later with the exporter's
+                    serve() method, or written to a file with its write()
+                    method.
+        @param address The address to serve the metrics on.
+        @return An rtctree.metrics.MetricsExporter object. Call its close()
+                method when it is no longer needed.
+
+        '''
+        exporter = MetricsExporter(self._root)
+        if port is not None:
+            exporter.serve(port=port, address=address)
+        return exporter
+
     def get_node(self, path):
         '''Get a node by path.
 
@@ -150,6 +299,18 @@ class RTCTree(object):
         '''
         return self._root.has_path(path)
 
+    def host_stats(self):
+        '''Get the statistics of the calls made to each endpoint.
+
+        @return A dictionary of endpoints (host and port) to HostStats, or an
+                empty dictionary if the tree has no host policy.
+
+        '''
+        policy = self._root._host_policy
+        if policy is None:
+            return {}
+        return policy.stats()
+
     def is_component(self, path):
         '''Is the node pointed to by @ref path a component?'''
         node = self.get_node(path)
@@ -176,6 +337,11 @@ class RTCTree(object):
         node = self.get_node(path)
         return node.is_nameserver
 
+    def is_pending(self, path):
+        '''Is the node pointed to by @ref path a pending object?'''
+        node = self.get_node(path)
+        return node.is_pending
+
     def is_unknown(self, path):
         '''Is the node pointed to by @ref path an unknown object?'''
         node = self.get_node(path)
@@ -226,6 +392,273 @@ class RTCTree(object):
                          if s]
             self._parse_name_servers(servers, filter, dynamic)
 
+    def lock_stats(self, reset=False):
+        '''Get the statistics of the time locks are held for.
+
+        Instrumentation must first be enabled with enable_stats(), or by
+        passing stats=True when creating the tree. Long holds of a type of
+        lock delay every thread reading the objects it guards.
+
+        @param reset If True, all recorded statistics, including those of the
+                     remote calls, are discarded after being read.
+        @return A dictionary of rtctree.instrument.LockStats objects, keyed
+                by lock name (the type of object the lock belongs to, e.g.
+                'Component'). Empty if instrumentation is disabled.
+
+        '''
+        recorder = instrument.recorder()
+        if recorder is None:
+            return {}
+        result = recorder.lock_stats()
+        if reset:
+            recorder.reset()
+        return result
+
+    def log_slow_calls(self, threshold, callback=None, max_records=1000):
+        '''Log the remote calls that take longer than a threshold.
+
+        Each slow call is recorded with the path of the node it was made for,
+        and passed to the callback or printed as a warning.
+
+        @param threshold The time, in seconds, above which a call is slow.
+        @param callback A function to call with the
+                        rtctree.instrument.CallRecord of each slow call. If
+                        None, a warning is printed to stderr.
+        @param max_records The maximum number of slow calls to keep.
+        @return The rtctree.instrument.SlowCallLog object. Call its stop()
+                method to stop logging.
+
+        '''
+        log = instrument.SlowCallLog(threshold, callback=callback,
+                max_records=max_records)
+        log.start()
+        return log
+
+    def monitor_heartbeats(self, cb=None, cb_args=None, interval=1.0,
+            tolerance=2.5, resolution=0.1, start=True):
+        '''Watch the heartbeats of every dynamic component in the tree.
+
+        A single HeartbeatMonitor is created and all components currently in
+        the tree that are dynamic are added to it. Each component will raise
+        its heartbeat_missed event when it falls silent. Components added to
+        the tree later (for example, by reparsing a directory) must be added
+        to the monitor using its watch() method.
+
+        @param cb A function to call for every missed heartbeat, of the format
+                  'def cb(node, last_heartbeat, cb_args)'.
+        @param cb_args The value to pass as cb_args to @ref cb.
+        @param interval The expected heartbeat interval, in seconds.
+        @param tolerance The number of intervals that may pass without a
+                         heartbeat before the heartbeat is considered missed.
+        @param resolution The granularity of the monitor, in seconds.
+        @param start Start the monitor's background thread immediately.
+        @return The HeartbeatMonitor object.
+
+        '''
+        monitor = HeartbeatMonitor(interval=interval, tolerance=tolerance,
+                resolution=resolution, cb=cb, cb_args=cb_args)
+        self.iterate(lambda n, a: monitor.watch(n),
+                filter=['is_component', lambda n: n.dynamic])
+        if start:
+            monitor.start()
+        return monitor
+
+    def record_events(self, filename):
+        '''Record every notification received by the tree's observers.
+
+        The kind, hint, target path and time of each notification received
+        by the observer of a dynamic component is appended to a compact
+        binary journal file. The journal can later be replayed into a tree
+        using replay_events(). Only one journal can record at a time; starting
+        a new one stops the previous one.
+
+        @param filename The name of the journal file to create.
+        @return The rtctree.journal.EventJournal object. Call its close()
+                method, or stop_recording_events(), to stop recording.
+
+        '''
+        journal = EventJournal(filename)
+        old = self._root._journal
+        self._root._journal = journal
+        if old:
+            old.close()
+        return journal
+
+    def replay_events(self, filename, speed=1.0, callbacks_only=False):
+        '''Replay a journal recorded by record_events() into this tree.
+
+        Notifications are delivered to the nodes in this tree with the
+        recorded paths, in the recorded order and (scaled by speed) at the
+        recorded times. This function returns once the entire journal has
+        been replayed.
+
+        @param filename The name of the journal file.
+        @param speed The replay speed relative to the recording, e.g. 10.0 to
+                     replay ten times faster. If 0 or None, notifications are
+                     replayed as fast as possible.
+        @param callbacks_only If True, only the callbacks of the target nodes
+                              (and event streams) are called, without updating
+                              the nodes from their components. Use this to
+                              replay a journal when the recorded components are
+                              not running.
+        @return A tuple of the number of notifications delivered and the number
+                skipped because their target was not in the tree.
+
+        '''
+        return replay_journal(self._root, filename, speed=speed,
+                callbacks_only=callbacks_only)
+
+    def set_call_timeout(self, timeout):
+        '''Set the maximum time that any remote call made by the tree may take.
+
+        The timeout is applied with omniORB's per-object call timeouts, so a
+        call to a hung object raises CORBA.TRANSIENT rather than blocking
+        forever. Each object reference is given the timeout once, before the
+        first call the tree makes on it; references the tree has not called
+        keep any timeout the application set. A shorter limit for a group of
+        calls can be set with rtctree.instrument.Deadline.
+
+        @param timeout The timeout in seconds. If None, calls have no timeout
+                       other than the ORB's own.
+
+        '''
+        self._root._call_timeout = timeout
+        if timeout is not None:
+            instrument.use_timeouts()
+
+    def set_host_policy(self, policy):
+        '''Set the limits on the remote calls made to each endpoint.
+
+        Tools that poll many components can use a policy so that they do not
+        overload the hosts, or amplify an outage by retrying calls to a host
+        that is down. For example, to make at most two calls at once and ten
+        calls per second to each host, and to stop calling a host for 30
+        seconds after five consecutive calls to it fail:
+
+            tree.set_host_policy(HostPolicy(max_in_flight=2, rate=10,
+                failure_threshold=5, reset_timeout=30))
+
+        @param policy A HostPolicy object (see rtctree.endpoints), or None to
+                      not limit calls.
+
+        '''
+        self._root._host_policy = policy
+        if policy is not None:
+            instrument.use_policies()
+
+    def snapshot_configurations(self, paths=None, max_workers=8):
+        '''Take a snapshot of the configuration of many components.
+
+        The configuration sets of every component in the tree, or only those
+        at or below the given paths, are read directly from the components,
+        several at once. The cached configuration sets of the component nodes
+        are not used or changed.
+
+        Snapshots can be compared with each other, or with a target
+        configuration saved in a file, to find configuration drift.
+
+        @param paths A list of paths (each a list of strings). If given, only
+                     components at or below one of these paths are included.
+        @param max_workers The maximum number of components to read at once.
+        @return An rtctree.confsnapshot.ConfigurationSnapshot object.
+
+        '''
+        def in_paths(node):
+            if not paths:
+                return True
+            path = node.full_path
+            for p in paths:
+                if path[:len(p)] == p:
+                    return True
+            return False
+
+        components = self.iterate(lambda n, a: n,
+                filter=['is_component', in_paths])
+        return take_snapshot(components, max_workers=max_workers)
+
+    def stats(self, by=None, reset=False):
+        '''Get the statistics of the remote calls made by the tree.
+
+        Instrumentation must first be enabled with enable_stats(), or by
+        passing stats=True when creating the tree.
+
+        @param by If None, statistics are given for each operation on each
+                  host. If 'op', they are combined over all hosts for each
+                  operation, and if 'host', over all operations for each
+                  host.
+        @param reset If True, recorded statistics are discarded after being
+                     read.
+        @return A dictionary of rtctree.instrument.OperationStats objects,
+                keyed by (operation, host), operation or host. Empty if
+                instrumentation is disabled.
+
+        '''
+        recorder = instrument.recorder()
+        if recorder is None:
+            return {}
+        result = recorder.stats()
+        if reset:
+            recorder.reset()
+        if by:
+            result = instrument.merge_stats(result, by)
+        return result
+
+    def stop_recording_events(self):
+        '''Stop recording notifications started by record_events().'''
+        journal = self._root._journal
+        self._root._journal = None
+        if journal:
+            journal.close()
+
+    def sweep_zombies(self, interval=60.0, grace_period=300.0, max_workers=8,
+            cb=None, start=True):
+        '''Remove zombies that stay dead from their name servers.
+
+        A ZombieSweeper is created for the tree. Each sweep probes the objects
+        of the zombie nodes again, and unbinds those that have been dead for
+        longer than the grace period. Call the sweeper's sweep() method to
+        make a single sweep, e.g. tree.sweep_zombies(grace_period=0,
+        start=False).sweep().
+
+        Warning: unbinding is not reversible. An object that is unbound will
+        not be found by the tree, or by other tools, until it registers
+        itself again.
+
+        @param interval The time, in seconds, between sweeps.
+        @param grace_period The time, in seconds, that an object must have
+                            been dead for before it is unbound.
+        @param max_workers The maximum number of probe or unbind calls made at
+                           once.
+        @param cb A function to call with the SweepReport of each sweep, of
+                  the format 'def cb(report)'.
+        @param start Start the sweeper's background thread immediately.
+        @return The ZombieSweeper object.
+
+        '''
+        sweeper = ZombieSweeper(self._root, interval=interval,
+                grace_period=grace_period, max_workers=max_workers, cb=cb)
+        if start:
+            sweeper.start()
+        return sweeper
+
+    def trace_calls(self, max_records=100000):
+        '''Record the sequence of remote calls made by the tree.
+
+        Every remote call is recorded with the path of the node it was made
+        for, the operation, and its start time and duration, until the
+        trace's stop() method is called. Use this to find where the time
+        goes when reparsing part of the tree. To trace the building of a
+        tree, use an rtctree.instrument.CallTrace as a context manager
+        around the creation of the RTCTree.
+
+        @param max_records The maximum number of calls to keep.
+        @return The rtctree.instrument.CallTrace object.
+
+        '''
+        trace = instrument.CallTrace(max_records=max_records)
+        trace.start()
+        return trace
+
     def give_away_orb(self):
         '''Releases ownership of an ORB created by the tree.
 
@@ -247,6 +680,28 @@ class RTCTree(object):
         '''The reference to the ORB held by this tree.'''
         return self._orb
 
+    @property
+    def pending_retrier(self):
+        '''The PendingRetrier resolving the pending nodes of this tree.
+
+        None if no pending nodes have been added to the tree.
+
+        '''
+        return self._root._pending_retrier
+
+    @property
+    def host_policy(self):
+        '''The HostPolicy limiting the calls made to each endpoint, or None.'''
+        return self._root._host_policy
+
+    @property
+    def unreachable_endpoints(self):
+        '''The UnreachableEndpoints object remembering the endpoints that could
+        not be connected to, or None if disabled.
+
+        '''
+        return self._root._unreachable
+
     def _create_orb(self, orb=None):
         # Create the ORB, optionally checking the environment variable for
         # arguments to pass to the ORB.
@@ -281,9 +736,12 @@ class RTCTree(object):
     def _parse_name_server(self, address, filter=[], dynamic=False):
         # Parse a single name server and add it to the root node.
         if not filtered(['/', address], filter):
+            budget = DiscoveryBudget(self._discovery_budget)
             new_ns_node = NameServer(self._orb, address, self._root,
-                    trim_filter(deepcopy(filter), 2), dynamic=dynamic)
+                    trim_filter(deepcopy(filter), 2), budget=budget,
+                    dynamic=dynamic)
             self._root._add_child(new_ns_node)
+            schedule_pending(self._root, budget.pending)
 
 
 # vim: tw=79
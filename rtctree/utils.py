@@ -19,9 +19,19 @@ of name servers, directories, managers and components.
 '''
 
 
-from omniORB import any
+from omniORB import any, CORBA, TRANSIENT_CallTimedout
 import SDOPackage
 import sys
+import threading
+import time
+import weakref
+
+try:
+    from collections.abc import Mapping, MutableMapping
+except ImportError:
+    from collections import Mapping, MutableMapping
+
+from rtctree.instrument import Deadline, current_deadline
 
 
 ##############################################################################
@@ -158,20 +168,457 @@ def get_terminal_size():
     return cr[1], cr[0]
 
 
+def _intern(s):
+    # Intern strings so that the keys (and common values) of the many
+    # dictionaries built from name-value lists share a single copy.
+    if type(s) is str and len(s) <= _INTERN_MAX:
+        return _intern_str(s)
+    return s
+
+_intern_str = getattr(sys, 'intern', None) or intern
+# Longer strings are unlikely to be repeated
+_INTERN_MAX = 64
+
+
+def _to_any(value):
+    # Strings make up nearly all values, so build their Any directly rather
+    # than having any.to_any work out the type code.
+    if type(value) is str:
+        return CORBA.Any(CORBA.TC_string, value)
+    tc = _ANY_TYPES.get(type(value))
+    if tc is not None:
+        return CORBA.Any(tc, value)
+    return any.to_any(value)
+
+# Types whose type code does not depend on the value
+_ANY_TYPES = {bool: CORBA.TC_boolean, float: CORBA.TC_double}
+
+
 def dict_to_nvlist(dict):
     '''Convert a dictionary into a CORBA namevalue list.'''
-    result = []
-    for item in list(dict.keys()):
-        result.append(SDOPackage.NameValue(item, any.to_any(dict[item])))
-    return result
+    NameValue = SDOPackage.NameValue
+    return [NameValue(k, _to_any(v)) for k, v in dict.items()]
 
 
 def nvlist_to_dict(nvlist):
-    '''Convert a CORBA namevalue list into a dictionary.'''
-    result = {}
-    for item in nvlist :
-        result[item.name] = item.value.value()
-    return result
+    '''Convert a CORBA namevalue list into a dictionary.
+
+    Names, and short string values, are interned. To decode values only when
+    they are used, wrap the list in an NVListMapping instead.
+
+    '''
+    return dict([(_intern(item.name), _intern(item.value.value()))
+        for item in nvlist])
+
+
+class NVListMapping(Mapping):
+    '''A read-only dictionary view of a CORBA namevalue list.
+
+    Values are decoded from their Any objects the first time they are
+    accessed, and then cached. This is faster than nvlist_to_dict when only a
+    few of the values in a long list are used.
+
+    '''
+    def __init__(self, nvlist, *args, **kwargs):
+        '''Constructor.
+
+        @param nvlist The CORBA namevalue list.
+
+        '''
+        super(NVListMapping, self).__init__(*args, **kwargs)
+        self._anys = dict([(_intern(item.name), item.value)
+            for item in nvlist])
+        self._values = {}
+
+    def __contains__(self, key):
+        return key in self._anys
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            value = self._values[key] = _intern(self._anys[key].value())
+            return value
+
+    def __iter__(self):
+        return iter(self._anys)
+
+    def __len__(self):
+        return len(self._anys)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class _SharedDict(dict):
+    # A dictionary held in the shared property pool. Plain dictionaries cannot
+    # be weakly referenced.
+    __slots__ = ('__weakref__',)
+
+
+class SharedProperties(MutableMapping):
+    '''A properties dictionary that may share its contents with others.
+
+    Do not create this class directly. Use share_properties() or
+    nvlist_to_shared_dict().
+
+    Many objects, such as the instances of one component type or their ports,
+    have identical properties. Objects of this class with identical contents
+    refer to a single shared dictionary, which is never changed. Properties
+    known to differ between objects (such as a component's instance name) can
+    be kept in a small private dictionary alongside the shared one. If the
+    properties are changed, a private copy of all the properties is made first
+    (copy-on-write), so changes are never visible through other objects.
+
+    '''
+    __slots__ = ('_data', '_extra', '_owned')
+
+    def __init__(self, data, extra=None, owned=False):
+        '''Constructor.
+
+        @param data The dictionary of properties.
+        @param extra A dictionary of further properties private to this
+                     object, or None. Its keys must not be in data.
+        @param owned True if data is private to this object.
+
+        '''
+        self._data = data
+        self._extra = extra
+        self._owned = owned
+
+    def __contains__(self, key):
+        return key in self._data or (self._extra is not None and
+                key in self._extra)
+
+    def __delitem__(self, key):
+        self._own()
+        del self._data[key]
+
+    def __eq__(self, other):
+        if isinstance(other, SharedProperties):
+            if self._extra is None and other._extra is None:
+                return self._data == other._data
+            other = dict(other)
+        elif not isinstance(other, Mapping):
+            return NotImplemented
+        if self._extra is None:
+            return self._data == other
+        return dict(self) == other
+
+    def __getitem__(self, key):
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        return self._data[key]
+
+    def __iter__(self):
+        for key in self._data:
+            yield key
+        if self._extra is not None:
+            for key in self._extra:
+                yield key
+
+    def __len__(self):
+        if self._extra is None:
+            return len(self._data)
+        return len(self._data) + len(self._extra)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def __setitem__(self, key, value):
+        self._own()
+        self._data[key] = value
+
+    def copy(self):
+        '''Get a private, mutable copy of the properties as a dictionary.'''
+        result = dict(self._data)
+        if self._extra is not None:
+            result.update(self._extra)
+        return result
+
+    @property
+    def is_shared(self):
+        '''Are the properties shared with other objects?'''
+        return not self._owned
+
+    def _own(self):
+        # Copy the shared dictionary before changing it.
+        if not self._owned:
+            self._data = self.copy()
+            self._extra = None
+            self._owned = True
+
+    __hash__ = None
+
+
+def share_properties(props, unshared_keys=None):
+    '''Get a properties mapping that shares its contents with any other
+    mapping with identical contents.
+
+    Shared dictionaries are kept in a pool for as long as any mapping refers
+    to them.
+
+    @param props A dictionary of properties.
+    @param unshared_keys A list of keys whose values are expected to differ
+                         between otherwise identical dictionaries. These
+                         properties are kept separately so that the rest can
+                         still be shared.
+    @return A SharedProperties object. If any of the values cannot be hashed,
+            the properties cannot be shared and a private SharedProperties
+            object is returned.
+
+    '''
+    extra = None
+    if unshared_keys:
+        extra = dict([(k, props[k]) for k in unshared_keys if k in props])
+        if extra:
+            props = dict([(k, v) for k, v in props.items() if k not in extra])
+        else:
+            extra = None
+    try:
+        key = frozenset(props.items())
+    except TypeError:
+        # Unhashable values
+        result = SharedProperties(dict(props), owned=True)
+        if extra:
+            result._data.update(extra)
+        return result
+    with _shared_pool_lock:
+        data = _shared_pool.get(key)
+        if data is None:
+            data = _SharedDict(props)
+            _shared_pool[key] = data
+    return SharedProperties(data, extra)
+
+_shared_pool = weakref.WeakValueDictionary()
+_shared_pool_lock = threading.Lock()
+
+
+def nvlist_to_shared_dict(nvlist, unshared_keys=None):
+    '''Convert a CORBA namevalue list into a properties mapping that shares
+    its contents with other identical mappings.
+
+    See share_properties().
+
+    '''
+    return share_properties(nvlist_to_dict(nvlist), unshared_keys)
+
+
+def parallel_map(func, items, max_workers=8):
+    '''Call a function on each of a list of items using a pool of threads.
+
+    This is intended for making many independent remote calls, such as
+    querying every component in a tree, at the same time rather than one
+    after the other.
+
+    @param func The function to call. It receives a single item.
+    @param items The list of items.
+    @param max_workers The maximum number of calls to make at once.
+    @return A list of (result, error) tuples, in the same order as the items.
+            If a call raised an exception, its result is None and error is the
+            exception; otherwise, error is None.
+
+    '''
+    items = list(items)
+    results = [None] * len(items)
+    next_item = [0]
+    lock = threading.Lock()
+    # The calls are made under the caller's deadline, if any
+    deadline = current_deadline()
+
+    def worker():
+        with Deadline(at=deadline):
+            while True:
+                with lock:
+                    ii = next_item[0]
+                    if ii >= len(items):
+                        return
+                    next_item[0] += 1
+                try:
+                    results[ii] = (func(items[ii]), None)
+                except Exception as e:
+                    results[ii] = (None, e)
+
+    num_workers = min(max_workers, len(items))
+    if num_workers <= 1:
+        worker()
+        return results
+    threads = [threading.Thread(target=worker) for ii in range(num_workers)]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+class SingleFlight(object):
+    '''Deduplicates concurrent fetches of the same thing.
+
+    A fetch is made with do(key, fetch). If another thread is already making
+    a fetch with the same key, the calling thread waits for its result rather
+    than making its own, so concurrent misses on one key share a single remote
+    request. Nothing is cached: once a fetch has finished, the next call with
+    its key makes a new one.
+
+    '''
+    def __init__(self, *args, **kwargs):
+        super(SingleFlight, self).__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, fetch):
+        '''Make a fetch, or wait for the one in progress with the same key.
+
+        Threads waiting for another thread's fetch wait no longer than their
+        deadline (see rtctree.instrument.Deadline).
+
+        @param key The key identifying what is fetched. It must be hashable.
+        @param fetch The function to call to make the fetch. It receives no
+                     arguments.
+        @return The result of the fetch.
+        @raises The exception raised by the fetch, if it failed.
+
+        '''
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                leader = True
+            elif flight.thread is threading.current_thread():
+                # The fetch needs its own result; waiting for it would never
+                # end, so make another
+                leader = None
+            else:
+                leader = False
+        if leader is None:
+            return fetch()
+        if not leader:
+            return flight.wait()
+        error = None
+        try:
+            value = fetch()
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            # Release the waiters even if the fetch was interrupted (e.g. by
+            # KeyboardInterrupt or SystemExit)
+            self._land(key, flight)
+            flight.finish(value if error is None else None, error)
+        return value
+
+    def in_flight(self, key):
+        '''Is a fetch with a key in progress?'''
+        with self._lock:
+            return key in self._flights
+
+    def _land(self, key, flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+
+class _Flight(object):
+    # A fetch in progress, which other threads can wait for.
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self._done = threading.Event()
+        self._value = None
+        self._error = None
+
+    def finish(self, value, error):
+        self._value = value
+        self._error = error
+        self._done.set()
+
+    def wait(self):
+        deadline = current_deadline()
+        if deadline is None:
+            self._done.wait()
+        elif not self._done.wait(max(deadline - time.time(), 0)):
+            raise CORBA.TRANSIENT(TRANSIENT_CallTimedout, CORBA.COMPLETED_NO)
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+class LazyValue(object):
+    '''A value fetched from a remote object when it is first needed, and
+    cached until it is reset.
+
+    The fetch is made without holding any lock, so reading a value that has
+    been cached never waits behind a remote call. If several threads read the
+    value before it has been cached, they share one fetch (see SingleFlight).
+    A value fetched while the cache was being reset is returned to the
+    threads that were waiting for it, but is not cached, so that a reset
+    always leads to a fresh fetch.
+
+    '''
+    def __init__(self, fetch, *args, **kwargs):
+        '''Constructor.
+
+        @param fetch The function to call to fetch the value. It receives no
+                     arguments.
+
+        '''
+        super(LazyValue, self).__init__(*args, **kwargs)
+        self._fetch = fetch
+        self._lock = threading.Lock()
+        self._value = None
+        self._cached = False
+        self._generation = 0
+        self._flights = SingleFlight()
+
+    def get(self):
+        '''Get the value, fetching it if it is not cached.
+
+        @return The value.
+        @raises The exception raised by the fetch, if it failed.
+
+        '''
+        with self._lock:
+            if self._cached:
+                return self._value
+            generation = self._generation
+        # Fetches made before and after a reset are kept apart
+        value = self._flights.do(generation, self._fetch)
+        with self._lock:
+            if self._generation == generation and not self._cached:
+                self._value = value
+                self._cached = True
+        return value
+
+    def peek(self):
+        '''Get the value if it is cached, or None, without fetching it.'''
+        with self._lock:
+            return self._value
+
+    def reset(self):
+        '''Discard the cached value. It will be fetched when next needed.'''
+        with self._lock:
+            self._generation += 1
+            self._value = None
+            self._cached = False
+
+    def set(self, value):
+        '''Cache a value obtained without fetching it.'''
+        with self._lock:
+            self._generation += 1
+            self._value = value
+            self._cached = True
+
+    @property
+    def cached(self):
+        '''Is the value cached?'''
+        with self._lock:
+            return self._cached
 
 
 def filtered(path, filter):
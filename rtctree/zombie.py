@@ -18,6 +18,8 @@ Object representing a zombie node in the tree.
 '''
 
 
+import time
+
 from rtctree.exceptions import *
 from rtctree.node import TreeNode
 
@@ -42,6 +44,12 @@ class Zombie(TreeNode):
 
         '''
         super(Zombie, self).__init__(name=name, parent=parent, *args, **kwargs)
+        self._dead_since = time.time()
+
+    @property
+    def dead_since(self):
+        '''The time the object was found to be dead.'''
+        return self._dead_since
 
     @property
     def is_zombie(self):